@@ -1,17 +1,30 @@
 import argparse
 import ast
+import array
+import bisect
+import builtins
+import gc
 import hashlib
+import itertools
 import json
+import marshal
 import os
 import re
 import shutil
+import sqlite3
+import struct
 import subprocess
 import sys
+import threading
+import time
 import traceback
+import types
 import warnings
-from collections import OrderedDict
-from dataclasses import dataclass
-from typing import Any, Optional
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Callable, Iterable, Iterator, Optional
+from urllib.parse import quote, unquote, urlparse
 
 # Suppress pygame and setuptools warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -52,6 +65,13 @@ class OPNError(Exception):
         return self.message
 
 
+class OPNWarning(Warning):
+    # Avisos del compilador que no impiden ejecutar (p.ej. parallel for con hilos).
+    # Se emiten con warnings.warn en cada compilacion, tambien desde la cache; la CLI
+    # los imprime con su formato y los embebidos pueden filtrarlos o capturarlos.
+    pass
+
+
 class _Ansi:
     RESET = "\033[0m"
     BOLD = "\033[1m"
@@ -114,9 +134,30 @@ def print_opn_error(exc: OPNError, *, stream: Any = sys.stderr) -> None:
     stream.write(format_opn_error(exc, color=color) + "\n")
 
 
+def install_opn_warning_printer(stream: Any = sys.stderr) -> None:
+    # La CLI muestra cada OPNWarning una vez por proceso, sin la ruta interna de
+    # warnings.warn; el resto de avisos conserva el formato de Python.
+    shown: set[str] = set()
+    default_show = warnings.showwarning
+
+    def show(message: Any, category: Any, filename: str, lineno: int, *args: Any) -> None:
+        if not issubclass(category, OPNWarning):
+            default_show(message, category, filename, lineno, *args)
+            return
+        text = str(message)
+        if text in shown:
+            return
+        shown.add(text)
+        color = _supports_color(stream)
+        stream.write(f"{_apply_color('Aviso', _Ansi.YELLOW, color)}: {text}\n")
+
+    warnings.simplefilter("always", OPNWarning)
+    warnings.showwarning = show
+
+
 TOKEN_SPEC = [
     ("NUMBER", r"\d+(\.\d+)?"),
-    ("STRING", r'"([^"\\]|\\.)*"|\'([^\'\\]|\\.)*\''),
+    ("STRING", r'"([^"\\\n]|\\.)*"|\'([^\'\\\n]|\\.)*\''),
     ("ID", r"[A-Za-z_][A-Za-z0-9_]*"),
     ("OP", r"==|!=|<=|>=|\|\||&&|\+|-|\*|/|%|<|>|=|!"),
     ("LBRACE", r"\{"),
@@ -151,13 +192,32 @@ KEYWORDS = {
     "import",
     "from",
     "as",
+    "async",
+    "await",
+    "parallel",
+    "in",
+    "yield",
 }
 
+KEYWORD_TYPES = {word: sys.intern(word.upper()) for word in KEYWORDS}
+# Tokens que abren una sentencia: puntos de resincronizacion tras un error.
+STATEMENT_START_TYPES = frozenset(
+    "VAR FUNCTION FUNC ASYNC CLASS IF WHILE FOR PARALLEL RETURN YIELD IMPORT FROM".split()
+)
+
 TOKEN_REGEX = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in TOKEN_SPEC))
 LINE_COMMENT_REGEX = re.compile(r"//.*")
-# El transpiler inserta 5 lineas de preambulo y una linea en blanco antes del cuerpo.
-GENERATED_BODY_LINE_OFFSET = 6
 DEFAULT_CACHE_SIZE = 128
+# Presupuesto por cache en bytes estimados; configurable en opn.json ("cache")
+# o con OPN_CACHE_MAX_MB / OPN_CACHE_MAX_ENTRIES.
+DEFAULT_CACHE_BYTES = 64 * 2**20
+# Flag CO_COROUTINE: el codigo de modulo usa await de nivel superior.
+CO_COROUTINE = 0x0080
+# Contenedor .opnc: magia, version de formato, largo del header JSON, header y
+# el code object serializado con marshal.
+OPNC_MAGIC = b"OPNC"
+OPNC_FORMAT_VERSION = 2
+OPNC_PREFIX = struct.Struct("<4sHI")
 DEFAULT_VENV_DIR = ".venv"
 DEFAULT_PROJECT_FILE = "opn.json"
 RUNTIME_VERSION = "0.1.2"
@@ -167,35 +227,179 @@ MODULE_TO_PACKAGE = {
     "sklearn": "scikit-learn",
     "yaml": "PyYAML",
 }
+# Helper emitido una sola vez en programas con 'parallel for'. Los procesos usan
+# fork para heredar las funciones del programa: el modulo __opn_main__ no es
+# importable, asi que spawn no encontraria los workers. Sin fork (Windows) se usan
+# hilos, y tambien si hay otros hilos vivos (p.ej. los de run_many): hacer fork
+# con otros hilos puede dejar locks tomados en el hijo.
+PARALLEL_HELPER = [
+    "def _opn_parallel_map(worker, items, bound, threads, chunk):",
+    "    import concurrent.futures, functools, multiprocessing, os, threading",
+    "    items = list(items)",
+    "    if bound:",
+    "        worker = functools.partial(worker, *bound)",
+    "    if not items:",
+    "        return []",
+    "    forkable = 'fork' in multiprocessing.get_all_start_methods()",
+    "    if threads or not forkable or threading.active_count() > 1:",
+    "        with concurrent.futures.ThreadPoolExecutor() as pool:",
+    "            return list(pool.map(worker, items))",
+    "    if chunk is None:",
+    "        chunk = max(1, len(items) // ((os.cpu_count() or 1) * 4))",
+    "    context = multiprocessing.get_context('fork')",
+    "    with concurrent.futures.ProcessPoolExecutor(mp_context=context) as pool:",
+    "        return list(pool.map(worker, items, chunksize=chunk))",
+]
+OPN_MODULE_NAME = "__opn_main__"
 DEFAULT_BUILD_WORK_DIR = ".opn_build"
+DEFAULT_INDEX_FILE = ".opn_index.sqlite"
 DEFAULT_DIST_DIR = "dist"
+# Binarios recientes conservados en .opn_build/cache, indexados por hash de entrada.
+DEFAULT_BUILD_CACHE_ENTRIES = 8
+# onefile se extrae en cada arranque; onedir y zipapp arrancan sin extraccion.
+BUILD_FORMATS = ("onefile", "onedir", "zipapp")
+
+
+def _estimate_size(value: Any) -> int:
+    if isinstance(value, types.CodeType):
+        size = sys.getsizeof(value) + sys.getsizeof(value.co_code)
+        size += sys.getsizeof(value.co_linetable)
+        return size + sum(_estimate_size(const) for const in value.co_consts)
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    return sys.getsizeof(value)
 
 
 class LRUCache:
-    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE, max_bytes: int = DEFAULT_CACHE_BYTES):
         self.maxsize = maxsize
-        self._data: OrderedDict[tuple[str, str], Any] = OrderedDict()
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[tuple[str, str], tuple[Any, int]] = OrderedDict()
+        # Las caches son globales del modulo y se comparten entre hilos del embedding.
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get(self, key: tuple[str, str]) -> Any:
-        if key not in self._data:
-            return None
-        value = self._data.pop(key)
-        self._data[key] = value
-        return value
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
 
     def set(self, key: tuple[str, str], value: Any) -> None:
-        if key in self._data:
-            self._data.pop(key)
-        self._data[key] = value
-        if len(self._data) > self.maxsize:
-            self._data.popitem(last=False)
+        size = _estimate_size(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            # Una entrada mayor que todo el presupuesto solo vaciaria la cache.
+            if size > self.max_bytes:
+                return
+            self._data[key] = (value, size)
+            self.bytes += size
+            self._evict()
+
+    def resize(self, maxsize: int, max_bytes: int) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._data and (len(self._data) > self.maxsize or self.bytes > self.max_bytes):
+            _, (_, size) = self._data.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "max_entries": self.maxsize,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def cache_limits(config: Optional[dict[str, Any]] = None) -> tuple[int, int]:
+    maxsize, max_bytes = DEFAULT_CACHE_SIZE, DEFAULT_CACHE_BYTES
+    section = (config or {}).get("cache")
+    if isinstance(section, dict):
+        if isinstance(section.get("max_entries"), int) and section["max_entries"] > 0:
+            maxsize = section["max_entries"]
+        if isinstance(section.get("max_mb"), (int, float)) and section["max_mb"] > 0:
+            max_bytes = int(section["max_mb"] * 2**20)
+    # Las variables de entorno tienen prioridad sobre opn.json; valores invalidos se ignoran.
+    env_entries = os.environ.get("OPN_CACHE_MAX_ENTRIES", "")
+    if env_entries.isdigit() and int(env_entries) > 0:
+        maxsize = int(env_entries)
+    try:
+        env_mb = float(os.environ.get("OPN_CACHE_MAX_MB", ""))
+    except ValueError:
+        env_mb = 0.0
+    if env_mb > 0:
+        max_bytes = int(env_mb * 2**20)
+    return maxsize, max_bytes
+
 
+def configure_caches(config: Optional[dict[str, Any]] = None) -> None:
+    maxsize, max_bytes = cache_limits(config)
+    _TRANSPILE_CACHE.resize(maxsize, max_bytes)
+    _COMPILED_CACHE.resize(maxsize, max_bytes)
+    _FILE_KEY_CACHE.resize(maxsize, max_bytes)
+    _LINE_MAPS.resize(maxsize, max_bytes)
 
-_TRANSPILE_CACHE = LRUCache()
-_COMPILED_CACHE = LRUCache()
 
+def cache_stats() -> dict[str, dict[str, int]]:
+    return {
+        "files": _FILE_KEY_CACHE.stats(),
+        "transpile": _TRANSPILE_CACHE.stats(),
+        "compiled": _COMPILED_CACHE.stats(),
+    }
 
-@dataclass
+
+_TRANSPILE_CACHE = LRUCache(*cache_limits())
+_COMPILED_CACHE = LRUCache(*cache_limits())
+# (ruta, tamano, mtime_ns, inodo) -> clave de contenido: evita leer y hashear archivos sin cambios.
+_FILE_KEY_CACHE = LRUCache(*cache_limits())
+# co_filename ("<opn:nombre#etiqueta>") -> line_map. La etiqueta sale del contenido:
+# dos programas con el mismo nombre (hilos de run_many, un .opnc y un run) no se
+# pisan el mapa. Acotada como las demas caches; sin mapa, la linea queda sin resolver.
+_LINE_MAPS = LRUCache(*cache_limits())
+OPN_FILENAME_TAG_REGEX = re.compile(r"#[0-9a-f]{12}$")
+
+
+def _opn_filename(source_name: Optional[str], key: tuple[str, str]) -> str:
+    tag = hashlib.blake2b(key[0].encode("ascii"), digest_size=6).hexdigest()
+    return f"<opn:{source_name or '<memory>'}#{tag}>"
+
+
+def opn_source_line(filename: str, lineno: Optional[int]) -> Optional[int]:
+    line_map = _LINE_MAPS.get(filename)
+    if line_map is None or lineno is None or not 0 < lineno <= len(line_map):
+        return None
+    return line_map[lineno - 1] or None
+
+
+def opn_location(filename: str, lineno: Optional[int]) -> Optional[tuple[str, int]]:
+    # (fuente OPN, linea OPN) para frames de codigo OPN; None para cualquier otro frame.
+    # La linea es 0 en el preambulo y helpers generados.
+    if not filename.startswith("<opn:"):
+        return None
+    name = OPN_FILENAME_TAG_REGEX.sub("", filename[5:-1])
+    return name, opn_source_line(filename, lineno) or 0
+
+
+@dataclass(slots=True)
 class Token:
     type: str
     value: str
@@ -204,20 +408,26 @@ class Token:
 
 
 class Lexer:
-    def __init__(self, code: str, source_name: Optional[str] = None):
+    def __init__(self, code: str, source_name: Optional[str] = None, recover: bool = False):
         # Allow UTF-8 BOM at file start (common on Windows editors).
         if code.startswith("\ufeff"):
             code = code.lstrip("\ufeff")
         self.source_name = source_name
         self.source_code = code
+        # Con recover, los caracteres invalidos se registran en errors y se omiten.
+        self.recover = recover
+        self.errors: list[OPNError] = []
         self.code = LINE_COMMENT_REGEX.sub("", code)
 
     def tokenize(self) -> list[Token]:
-        tokens: list[Token] = []
+        return list(self.iter_tokens())
+
+    def iter_tokens(self) -> Iterator[Token]:
         line = 1
         col = 1
-        append_token = tokens.append
         token_regex = TOKEN_REGEX
+        keyword_types = KEYWORD_TYPES
+        intern = sys.intern
 
         for mo in token_regex.finditer(self.code):
             kind = mo.lastgroup
@@ -232,7 +442,7 @@ class Lexer:
                 continue
             if kind == "MISMATCH":
                 bad = Token("MISMATCH", value, line, col)
-                raise OPNError(
+                err = OPNError(
                     f"Caracter inesperado: {value}",
                     bad,
                     code="OPN1001",
@@ -241,63 +451,79 @@ class Lexer:
                     source_code=self.source_code,
                     hint="Revisa simbolos no validos o comillas sin cerrar.",
                 )
-            if kind == "ID" and value in KEYWORDS:
-                kind = value.upper()
+                if not self.recover:
+                    raise err
+                self.errors.append(err)
+                col += len(value)
+                continue
+            if kind == "ID" or kind == "OP":
+                # Identificadores y operadores se repiten mucho: una sola copia por texto.
+                value = intern(value)
+                if kind == "ID":
+                    kind = keyword_types.get(value, kind)
 
-            append_token(Token(kind, value, line, col))
+            yield Token(kind, value, line, col)
             col += len(value)
 
-        append_token(Token("EOF", "", line, col))
-        return tokens
+        yield Token("EOF", "", line, col)
 
 
 class Node:
-    pass
+    # Linea OPN de la sentencia (la fija el parser) y tipo inferido por infer_types;
+    # ninguno forma parte de fields().
+    __slots__ = ("line", "inferred")
 
 
-@dataclass
+@dataclass(slots=True)
 class Program(Node):
     body: list[Node]
 
 
-@dataclass
+@dataclass(slots=True)
 class Block(Node):
     body: list[Node]
 
 
-@dataclass
+@dataclass(slots=True)
 class VarDecl(Node):
     name: str
     expr: Node
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionDecl(Node):
     name: str
     params: list[str]
     body: Block
+    is_async: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class ClassDecl(Node):
     name: str
     body: Block
 
 
-@dataclass
+@dataclass(slots=True)
+class StructDecl(Node):
+    name: str
+    fields: list[str]
+
+
+@dataclass(slots=True)
 class IfStmt(Node):
     test: Node
     cons: Block
     alt: Optional[Block]
 
 
-@dataclass
+@dataclass(slots=True)
 class WhileStmt(Node):
     test: Node
     body: Block
 
 
-@dataclass
+@dataclass(slots=True)
 class ForStmt(Node):
     init: Optional[Node]
     test: Optional[Node]
@@ -305,103 +531,615 @@ class ForStmt(Node):
     body: Block
 
 
-@dataclass
+@dataclass(slots=True)
+class ForInStmt(Node):
+    name: str
+    iterable: Node
+    body: Block
+
+
+@dataclass(slots=True)
+class ParallelFor(Node):
+    loop: Node
+    threads: bool
+    chunk: Optional[Node]
+
+
+@dataclass(slots=True)
 class ReturnStmt(Node):
     expr: Optional[Node]
 
 
-@dataclass
+@dataclass(slots=True)
+class YieldStmt(Node):
+    expr: Optional[Node]
+
+
+@dataclass(slots=True)
 class ExprStmt(Node):
     expr: Node
 
 
-@dataclass
+@dataclass(slots=True)
 class ImportStmt(Node):
     module: str
     alias: Optional[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class FromImportStmt(Node):
     module: str
     names: list[tuple[str, Optional[str]]]
 
 
-@dataclass
+@dataclass(slots=True)
 class AssignExpr(Node):
     target: Node
     value: Node
 
 
-@dataclass
+@dataclass(slots=True)
 class BinaryExpr(Node):
     left: Node
     op: str
     right: Node
 
 
-@dataclass
+@dataclass(slots=True)
 class UnaryExpr(Node):
     op: str
     value: Node
 
 
-@dataclass
+@dataclass(slots=True)
+class AwaitExpr(Node):
+    value: Node
+
+
+@dataclass(slots=True)
 class Literal(Node):
     value: Any
 
 
-@dataclass
+@dataclass(slots=True)
 class Identifier(Node):
     name: str
 
 
-@dataclass
+@dataclass(slots=True)
 class CallExpr(Node):
     callee: Node
     args: list[Node]
 
 
-@dataclass
+@dataclass(slots=True)
 class MemberExpr(Node):
     obj: Node
     prop: str
 
 
-@dataclass
+@dataclass(slots=True)
 class IndexExpr(Node):
     obj: Node
     index: Node
 
 
-@dataclass
+@dataclass(slots=True)
 class ArrayLiteral(Node):
     elements: list[Node]
 
 
-@dataclass
+@dataclass(slots=True)
 class DictLiteral(Node):
     pairs: list[tuple[Node, Node]]
 
 
+# Nombres de campo por clase de nodo; fields() es costoso en recorridos completos.
+_NODE_FIELDS: dict[type, tuple[str, ...]] = {}
+
+
+def iter_child_nodes(node: Node) -> Iterator[Node]:
+    names = _NODE_FIELDS.get(node.__class__)
+    if names is None:
+        names = _NODE_FIELDS[node.__class__] = tuple(field.name for field in fields(node))
+    for name in names:
+        value = getattr(node, name)
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                if isinstance(item, Node):
+                    yield item
+                elif isinstance(item, tuple):
+                    yield from (sub for sub in item if isinstance(sub, Node))
+
+
+def walk_scope(node: Node) -> Iterator[Node]:
+    # Recorre el subarbol sin entrar en funciones o clases anidadas.
+    pending = list(iter_child_nodes(node))
+    while pending:
+        child = pending.pop()
+        yield child
+        if not isinstance(child, (FunctionDecl, ClassDecl)):
+            pending.extend(iter_child_nodes(child))
+
+
+def walk_nodes(node: Node) -> Iterator[Node]:
+    pending = [node]
+    while pending:
+        child = pending.pop()
+        yield child
+        pending.extend(iter_child_nodes(child))
+
+
+def declared_names(node: Node) -> set[str]:
+    names: set[str] = set()
+    for child in walk_scope(node):
+        if isinstance(child, (VarDecl, FunctionDecl, ClassDecl, StructDecl, ForInStmt)):
+            names.add(child.name)
+        elif isinstance(child, AssignExpr) and isinstance(child.target, Identifier):
+            names.add(child.target.name)
+    return names
+
+
+# Builtins que acceden a nombres por texto: si aparecen, el tree shaking no es seguro.
+DYNAMIC_LOOKUP_NAMES = frozenset({"eval", "exec", "globals", "locals", "vars", "getattr", "__import__"})
+
+
+@dataclass(slots=True)
+class ShakeReport:
+    functions: list[str] = field(default_factory=list)
+    classes: list[str] = field(default_factory=list)
+    imports: list[str] = field(default_factory=list)
+    excluded_modules: list[str] = field(default_factory=list)
+    skipped_reason: Optional[str] = None
+
+
+def _used_names(nodes: Iterable[Node]) -> set[str]:
+    return {
+        child.name for node in nodes for child in walk_nodes(node) if isinstance(child, Identifier)
+    }
+
+
+def _identifier_names(nodes: Iterable[Node]) -> set[str]:
+    # Como _used_names, pero sobre nodos ya recorridos.
+    return {node.name for node in nodes if isinstance(node, Identifier)}
+
+
+def shake_program(program: Program) -> tuple[Program, ShakeReport]:
+    # Alcanzabilidad desde las sentencias de nivel superior que no son declaraciones:
+    # se eliminan funciones, clases e imports de nivel superior que nadie nombra.
+    report = ShakeReport()
+    dynamic = sorted(_used_names([program]) & DYNAMIC_LOOKUP_NAMES)
+    if dynamic:
+        report.skipped_reason = f"acceso dinamico a nombres: {', '.join(dynamic)}"
+        return program, report
+
+    declared: dict[str, list[Node]] = {}
+    roots = []
+    for stmt in program.body:
+        if isinstance(stmt, (FunctionDecl, ClassDecl, StructDecl)):
+            declared.setdefault(stmt.name, []).append(stmt)
+        elif not isinstance(stmt, (ImportStmt, FromImportStmt)):
+            roots.append(stmt)
+    used = _used_names(roots)
+    pending = list(used)
+    while pending:
+        for decl in declared.pop(pending.pop(), []):
+            found = _used_names([decl]) - used
+            used |= found
+            pending.extend(found)
+
+    body: list[Node] = []
+    kept_modules: set[str] = set()
+    dropped_modules: set[str] = set()
+    for stmt in program.body:
+        if isinstance(stmt, (FunctionDecl, ClassDecl, StructDecl)) and stmt.name not in used:
+            target = report.functions if isinstance(stmt, FunctionDecl) else report.classes
+            target.append(stmt.name)
+            continue
+        if isinstance(stmt, ImportStmt):
+            root = stmt.module.split(".")[0]
+            if (stmt.alias or root) not in used:
+                report.imports.append(stmt.module)
+                dropped_modules.add(root)
+                continue
+            kept_modules.add(root)
+        elif isinstance(stmt, FromImportStmt):
+            names = [(name, alias) for name, alias in stmt.names if (alias or name) in used]
+            root = stmt.module.split(".")[0]
+            report.imports.extend(
+                f"{stmt.module}.{name}" for name, alias in stmt.names if (alias or name) not in used
+            )
+            if not names:
+                dropped_modules.add(root)
+                continue
+            kept_modules.add(root)
+            stmt = FromImportStmt(stmt.module, names)
+        body.append(stmt)
+
+    # Excluir un paquete de terceros solo es seguro si ningun import conservado de
+    # terceros puede depender de el; la biblioteca estandar nunca se excluye.
+    stdlib = set(getattr(sys, "stdlib_module_names", ()))
+    if not kept_modules - stdlib:
+        report.excluded_modules = sorted(dropped_modules - kept_modules - stdlib)
+    return Program(body), report
+
+
+# Inferencia local de tipos: anota cada expresion con su tipo en el slot "inferred"
+# ("int", "float", "str", "bool", "list", "dict", "range", "none" o None si se desconoce).
+COMPARISON_OPS = frozenset({"==", "!=", "<", "<=", ">", ">="})
+NUMERIC_TYPES = frozenset({"int", "float", "bool"})
+INTRINSIC_RESULT_TYPES = {
+    "len": "int",
+    "str": "str",
+    "repr": "str",
+    "int": "int",
+    "float": "float",
+    "bool": "bool",
+    "input": "str",
+    "chr": "str",
+    "ord": "int",
+    "list": "list",
+    "sorted": "list",
+    "dict": "dict",
+    "range": "range",
+}
+STR_METHOD_RESULT_TYPES = {
+    "upper": "str",
+    "lower": "str",
+    "strip": "str",
+    "lstrip": "str",
+    "rstrip": "str",
+    "replace": "str",
+    "join": "str",
+    "format": "str",
+    "title": "str",
+    "capitalize": "str",
+    "split": "list",
+    "find": "int",
+    "count": "int",
+    "startswith": "bool",
+    "endswith": "bool",
+    "isdigit": "bool",
+}
+
+
+def inferred_type(node: Optional[Node]) -> Optional[str]:
+    return getattr(node, "inferred", None)
+
+
+def _literal_type(value: Any) -> Optional[str]:
+    if value is None:
+        return "none"
+    if isinstance(value, bool):
+        return "bool"
+    return {int: "int", float: "float", str: "str"}.get(type(value))
+
+
+def _binary_result_type(op: str, left: Optional[str], right: Optional[str]) -> Optional[str]:
+    if op in COMPARISON_OPS:
+        return "bool"
+    if left is None or right is None:
+        return None
+    if op in ("&&", "||"):
+        return left if left == right else None
+    if left in NUMERIC_TYPES and right in NUMERIC_TYPES:
+        if op == "/" or "float" in (left, right):
+            return "float"
+        return "int"
+    if op == "+" and left == right and left in ("str", "list"):
+        return left
+    if op == "*" and {left, right} in ({"str", "int"}, {"list", "int"}):
+        return "str" if "str" in (left, right) else "list"
+    return None
+
+
+def _merge_env(a: dict[str, str], b: dict[str, str]) -> dict[str, str]:
+    return {name: kind for name, kind in a.items() if b.get(name) == kind}
+
+
+def _bound_names(nodes: Iterable[Node]) -> set[str]:
+    names: set[str] = set()
+    for node in nodes:
+        if isinstance(node, (VarDecl, FunctionDecl, ClassDecl, StructDecl, ForInStmt)):
+            names.add(node.name)
+            if isinstance(node, FunctionDecl):
+                names.update(node.params)
+        elif isinstance(node, AssignExpr) and isinstance(node.target, Identifier):
+            names.add(node.target.name)
+        elif isinstance(node, ImportStmt):
+            names.add(node.alias or node.module.split(".")[0])
+        elif isinstance(node, FromImportStmt):
+            names.update(alias or name for name, alias in node.names)
+    return names
+
+
+class TypeInference:
+    # Flujo por ambito: las ramas se combinan y cada bucle itera hasta un punto fijo.
+    # Dentro de funciones solo se siguen locales; los nombres libres quedan desconocidos.
+    def __init__(self, program: Program, nodes: Optional[list[Node]] = None):
+        self.program = program
+        self.nodes = nodes if nodes is not None else list(walk_nodes(program))
+        self.shadowed = _bound_names(self.nodes)
+        # Structs declarados una sola vez y sin otro enlace: llamar a su nombre crea un
+        # registro de tipo "struct Nombre".
+        declared = Counter(node.name for node in self.nodes if isinstance(node, StructDecl))
+        others = _bound_names(node for node in self.nodes if not isinstance(node, StructDecl))
+        self.structs = {name for name, count in declared.items() if count == 1 and name not in others}
+        self.loops: dict[int, tuple[dict[str, str], dict[str, str]]] = {}
+        self.scopes: dict[int, set[str]] = {}
+
+    def run(self) -> None:
+        if _identifier_names(self.nodes) & DYNAMIC_LOOKUP_NAMES:
+            return
+        if any(name == "*" for name in self.shadowed):
+            return
+        self.block(self.program.body, {})
+
+    def block(self, body: list[Node], env: dict[str, str]) -> dict[str, str]:
+        for stmt in body:
+            env = self.stmt(stmt, env)
+        return env
+
+    def stmt(self, node: Node, env: dict[str, str]) -> dict[str, str]:
+        if isinstance(node, Block):
+            return self.block(node.body, env)
+        if isinstance(node, VarDecl):
+            self.bind(env, node.name, self.expr(node.expr, env))
+            return env
+        if isinstance(node, ExprStmt):
+            self.expr(node.expr, env)
+            return env
+        if isinstance(node, (ReturnStmt, YieldStmt)):
+            if node.expr is not None:
+                self.expr(node.expr, env)
+            return env
+        if isinstance(node, (IfStmt, WhileStmt, ForStmt, ForInStmt)):
+            return self.scoped(node, env)
+        if isinstance(node, ParallelFor):
+            self.expr(node, env)
+            return env
+        if isinstance(node, FunctionDecl):
+            env.pop(node.name, None)
+            self.block(node.body.body, {})
+            return env
+        if isinstance(node, ClassDecl):
+            env.pop(node.name, None)
+            self.block(node.body.body, {})
+            return env
+        if isinstance(node, StructDecl):
+            env.pop(node.name, None)
+            return env
+        if isinstance(node, ImportStmt):
+            env.pop(node.alias or node.module.split(".")[0], None)
+            return env
+        if isinstance(node, FromImportStmt):
+            for name, alias in node.names:
+                env.pop(alias or name, None)
+            return env
+        return env
+
+    def scoped(self, node: Node, env: dict[str, str]) -> dict[str, str]:
+        # Las ramas y bucles solo ven los nombres que su subarbol lee o asigna; el
+        # resto no cambia. Sin esto cada combinacion recorre todo el entorno de nivel
+        # superior y el analisis crece cuadratico con el tamano del programa.
+        names = self.scopes.get(id(node))
+        if names is None:
+            subtree = list(walk_nodes(node))
+            names = _identifier_names(subtree) | _bound_names(subtree)
+            self.scopes[id(node)] = names
+        inner = {name: env[name] for name in names if name in env}
+        inner = self.branch(node, inner)
+        for name in names:
+            if name in inner:
+                env[name] = inner[name]
+            else:
+                env.pop(name, None)
+        return env
+
+    def branch(self, node: Node, env: dict[str, str]) -> dict[str, str]:
+        if isinstance(node, IfStmt):
+            self.expr(node.test, env)
+            cons = self.block(node.cons.body, dict(env))
+            alt = self.block(node.alt.body, dict(env)) if node.alt else env
+            return _merge_env(cons, alt)
+        if isinstance(node, WhileStmt):
+            return self.loop(node, env, lambda inner: self.block(node.body.body, inner), node.test)
+        if isinstance(node, ForStmt):
+            if node.init is not None:
+                env = self.stmt(node.init, env)
+            return self.loop(node, env, lambda inner: self.for_body(node, inner), node.test)
+        element = self.element_type(self.expr(node.iterable, env))
+
+        def body(inner: dict[str, str]) -> dict[str, str]:
+            self.bind(inner, node.name, element)
+            return self.block(node.body.body, inner)
+
+        return self.loop(node, env, body, None)
+
+    def for_body(self, node: ForStmt, env: dict[str, str]) -> dict[str, str]:
+        env = self.block(node.body.body, env)
+        if node.update is not None:
+            self.expr(node.update, env)
+        return env
+
+    def loop(
+        self,
+        node: Node,
+        env: dict[str, str],
+        body: Callable[[dict[str, str]], dict[str, str]],
+        test: Optional[Node],
+    ) -> dict[str, str]:
+        # El entorno de entrada solo puede perder precision: si no cambia respecto
+        # al ultimo analisis del bucle, se reutiliza sin recorrerlo otra vez.
+        entry = env
+        cached = self.loops.get(id(node))
+        if cached is not None:
+            entry = _merge_env(cached[0], env)
+            if entry == cached[0]:
+                return dict(entry)
+        while True:
+            if test is not None:
+                self.expr(test, entry)
+            exit_env = body(dict(entry))
+            widened = _merge_env(entry, exit_env)
+            if widened == entry:
+                break
+            entry = widened
+        self.loops[id(node)] = (entry, exit_env)
+        return dict(entry)
+
+    def bind(self, env: dict[str, str], name: str, kind: Optional[str]) -> None:
+        if kind is None:
+            env.pop(name, None)
+        else:
+            env[name] = kind
+
+    def element_type(self, iterable: Optional[str]) -> Optional[str]:
+        return {"range": "int", "str": "str"}.get(iterable or "")
+
+    def expr(self, node: Node, env: dict[str, str]) -> Optional[str]:
+        kind = self._expr(node, env)
+        node.inferred = kind
+        return kind
+
+    def _expr(self, node: Node, env: dict[str, str]) -> Optional[str]:
+        if isinstance(node, Literal):
+            return _literal_type(node.value)
+        if isinstance(node, Identifier):
+            return env.get(node.name)
+        if isinstance(node, AssignExpr):
+            kind = self.expr(node.value, env)
+            if isinstance(node.target, Identifier):
+                self.bind(env, node.target.name, kind)
+                node.target.inferred = kind
+            else:
+                self.expr(node.target, env)
+            return kind
+        if isinstance(node, BinaryExpr):
+            left = self.expr(node.left, env)
+            right = self.expr(node.right, env)
+            return _binary_result_type(node.op, left, right)
+        if isinstance(node, UnaryExpr):
+            kind = self.expr(node.value, env)
+            if node.op == "!":
+                return "bool"
+            if kind in NUMERIC_TYPES:
+                return "int" if kind == "bool" else kind
+            return None
+        if isinstance(node, AwaitExpr):
+            self.expr(node.value, env)
+            return None
+        if isinstance(node, CallExpr):
+            return self.call(node, env)
+        if isinstance(node, MemberExpr):
+            self.expr(node.obj, env)
+            return None
+        if isinstance(node, IndexExpr):
+            obj = self.expr(node.obj, env)
+            self.expr(node.index, env)
+            return "str" if obj == "str" else None
+        if isinstance(node, ArrayLiteral):
+            for element in node.elements:
+                self.expr(element, env)
+            return "list"
+        if isinstance(node, DictLiteral):
+            for key, value in node.pairs:
+                self.expr(key, env)
+                self.expr(value, env)
+            return "dict"
+        if isinstance(node, ParallelFor):
+            loop = node.loop
+            if node.chunk is not None:
+                self.expr(node.chunk, env)
+            inner = dict(env)
+            if isinstance(loop, ForInStmt):
+                element = self.element_type(self.expr(loop.iterable, env))
+                self.bind(inner, loop.name, element)
+            elif isinstance(loop, ForStmt) and loop.init is not None:
+                inner = self.stmt(loop.init, inner)
+                if loop.test is not None:
+                    self.expr(loop.test, inner)
+            # Cada iteracion corre en un worker aislado: el entorno externo no cambia.
+            self.block(loop.body.body, inner)
+            return "list"
+        return None
+
+    def call(self, node: CallExpr, env: dict[str, str]) -> Optional[str]:
+        callee = node.callee
+        args = [self.expr(arg, env) for arg in node.args]
+        if isinstance(callee, MemberExpr):
+            obj = self.expr(callee.obj, env)
+            callee.inferred = None
+            if obj == "str":
+                return STR_METHOD_RESULT_TYPES.get(callee.prop)
+            return None
+        self.expr(callee, env)
+        if isinstance(callee, Identifier) and callee.name in self.structs:
+            return f"struct {callee.name}"
+        if not isinstance(callee, Identifier) or callee.name in self.shadowed:
+            return None
+        name = callee.name
+        if name == "abs" and len(args) == 1 and args[0] in ("int", "float"):
+            return args[0]
+        if name == "round" and len(args) == 1 and args[0] in NUMERIC_TYPES:
+            return "int"
+        if name in ("min", "max") and args and len(set(args)) == 1 and args[0] in ("int", "float", "str"):
+            return args[0]
+        return INTRINSIC_RESULT_TYPES.get(name)
+
+
+def infer_types(program: Program, nodes: Optional[list[Node]] = None) -> Program:
+    TypeInference(program, nodes).run()
+    return program
+
+
 class Parser:
     def __init__(
         self,
-        tokens: list[Token],
+        tokens: Iterable[Token],
         source_name: Optional[str] = None,
         source_code: Optional[str] = None,
+        recover: bool = False,
+        lexer_errors: Optional[list[OPNError]] = None,
     ):
-        self.tokens = tokens
-        self.pos = 0
+        # Los tokens se consumen de un iterador con una ventana de lookahead,
+        # asi los ya analizados se liberan durante el parseo.
+        self.tokens = iter(tokens)
+        self.lookahead: deque[Token] = deque()
+        self.eof: Optional[Token] = None
         self.source_name = source_name
         self.source_code = source_code
+        self.function_stack: list[bool] = []
+        # Con recover, cada error se guarda en errors y el parseo sigue en la
+        # siguiente sentencia (opn check). lexer_errors es la lista del Lexer en modo
+        # recover: un error de sintaxis precedido por uno lexico en la misma sentencia
+        # es consecuencia del caracter omitido y no se reporta.
+        self.recover = recover
+        self.errors: list[OPNError] = []
+        self.lexer_errors = lexer_errors if lexer_errors is not None else []
+
+    def peek(self, offset: int = 0) -> Token:
+        lookahead = self.lookahead
+        while len(lookahead) <= offset:
+            if self.eof is not None:
+                lookahead.append(self.eof)
+                continue
+            tok = next(self.tokens)
+            if tok.type == "EOF":
+                self.eof = tok
+            lookahead.append(tok)
+        return lookahead[offset]
 
     def current(self) -> Token:
-        return self.tokens[self.pos]
+        if self.lookahead:
+            return self.lookahead[0]
+        return self.peek()
 
     def advance(self) -> Token:
         tok = self.current()
-        self.pos += 1
+        self.lookahead.popleft()
         return tok
 
     def eat(self, t: str) -> Token:
@@ -419,14 +1157,14 @@ class Parser:
 
     def match(self, t: str) -> bool:
         if self.current().type == t:
-            self.pos += 1
+            self.lookahead.popleft()
             return True
         return False
 
     def match_op(self, op: str) -> bool:
         tok = self.current()
         if tok.type == "OP" and tok.value == op:
-            self.pos += 1
+            self.lookahead.popleft()
             return True
         return False
 
@@ -436,25 +1174,86 @@ class Parser:
     def parse(self) -> Program:
         body = []
         while self.current().type != "EOF":
-            body.append(self.statement())
+            stmt = self.recovering_statement() if self.recover else self.statement()
+            if stmt is not None:
+                body.append(stmt)
         return Program(body)
 
+    def recovering_statement(self) -> Optional[Node]:
+        start = self.current()
+        try:
+            return self.statement()
+        except OPNError as err:
+            if self.current() is start:
+                self.advance()
+            self.synchronize()
+            where = (err.line or 0, err.col or 0)
+            if not any(
+                (start.line, start.col) <= (lexical.line or 0, lexical.col or 0) <= where
+                for lexical in self.lexer_errors
+            ):
+                self.errors.append(err)
+            return None
+
+    def synchronize(self) -> None:
+        # Modo panico: descarta tokens hasta un ';' o un bloque completo, o hasta
+        # el inicio de otra sentencia; un '}' sin abrir queda para el bloque actual.
+        depth = 0
+        while True:
+            tok = self.current()
+            if tok.type == "EOF":
+                return
+            if tok.type == "LBRACE":
+                depth += 1
+            elif tok.type == "RBRACE":
+                if depth == 0:
+                    return
+                depth -= 1
+                if depth == 0:
+                    self.advance()
+                    return
+            elif depth == 0:
+                if tok.type == "SEMICOL":
+                    self.advance()
+                    return
+                if tok.type in STATEMENT_START_TYPES:
+                    return
+            self.advance()
+
     def statement(self) -> Node:
+        line = self.current().line
+        node = self._statement()
+        node.line = line
+        return node
+
+    def _statement(self) -> Node:
         tok = self.current()
         if tok.type == "VAR":
             return self.var_decl(require_semicol=True)
-        if tok.type in ("FUNCTION", "FUNC"):
+        if tok.type in ("FUNCTION", "FUNC", "ASYNC"):
             return self.func_decl()
         if tok.type == "CLASS":
             return self.class_decl()
+        if (
+            tok.type == "ID"
+            and tok.value == "struct"
+            and self.peek(1).type == "ID"
+            and self.peek(2).type == "LBRACE"
+        ):
+            # Palabra clave contextual: "import struct" y struct.pack(...) siguen validos.
+            return self.struct_decl()
         if tok.type == "IF":
             return self.if_stmt()
         if tok.type == "WHILE":
             return self.while_stmt()
         if tok.type == "FOR":
             return self.for_stmt()
+        if tok.type == "PARALLEL":
+            return self.parallel_for()
         if tok.type == "RETURN":
             return self.return_stmt()
+        if tok.type == "YIELD":
+            return self.yield_stmt()
         if tok.type == "IMPORT":
             return self.import_stmt()
         if tok.type == "FROM":
@@ -470,7 +1269,7 @@ class Parser:
         body = []
         while self.current().type != "RBRACE":
             if self.current().type == "EOF":
-                raise OPNError(
+                err = OPNError(
                     "Falta '}' para cerrar bloque",
                     self.current(),
                     code="OPN2002",
@@ -478,7 +1277,13 @@ class Parser:
                     source_name=self.source_name,
                     source_code=self.source_code,
                 )
-            body.append(self.statement())
+                if not self.recover:
+                    raise err
+                self.errors.append(err)
+                return Block(body)
+            stmt = self.recovering_statement() if self.recover else self.statement()
+            if stmt is not None:
+                body.append(stmt)
         self.eat("RBRACE")
         return Block(body)
 
@@ -492,6 +1297,7 @@ class Parser:
         return VarDecl(name, expr)
 
     def func_decl(self) -> FunctionDecl:
+        is_async = self.match("ASYNC")
         if self.current().type in ("FUNCTION", "FUNC"):
             self.advance()
         else:
@@ -504,8 +1310,12 @@ class Parser:
             while self.match("COMMA"):
                 params.append(self.eat("ID").value)
         self.eat("RPAREN")
-        body = self.block()
-        return FunctionDecl(name, params, body)
+        self.function_stack.append(is_async)
+        try:
+            body = self.block()
+        finally:
+            self.function_stack.pop()
+        return FunctionDecl(name, params, body, is_async)
 
     def class_decl(self) -> ClassDecl:
         self.eat("CLASS")
@@ -513,6 +1323,29 @@ class Parser:
         body = self.block()
         return ClassDecl(name, body)
 
+    def struct_decl(self) -> StructDecl:
+        self.eat("ID")
+        name = self.eat("ID").value
+        self.eat("LBRACE")
+        fields: list[str] = []
+        while self.current().type != "RBRACE":
+            tok = self.eat("ID")
+            if tok.value in fields or tok.value in ("this", "self"):
+                raise OPNError(
+                    f"Campo invalido o repetido en struct {name}: {tok.value}",
+                    tok,
+                    code="OPN2010",
+                    phase="Sintaxis",
+                    source_name=self.source_name,
+                    source_code=self.source_code,
+                    hint="Cada campo de un struct debe ser un nombre unico: struct Point { x, y }",
+                )
+            fields.append(tok.value)
+            if not self.match("COMMA"):
+                break
+        self.eat("RBRACE")
+        return StructDecl(name, fields)
+
     def if_stmt(self) -> IfStmt:
         self.eat("IF")
         self.eat("LPAREN")
@@ -532,10 +1365,18 @@ class Parser:
         body = self.block()
         return WhileStmt(test, body)
 
-    def for_stmt(self) -> ForStmt:
+    def for_stmt(self) -> Node:
         self.eat("FOR")
         self.eat("LPAREN")
 
+        if self.is_for_in():
+            self.match("VAR")
+            name = self.eat("ID").value
+            self.eat("IN")
+            iterable = self.expression()
+            self.eat("RPAREN")
+            return ForInStmt(name, iterable, self.block())
+
         init: Optional[Node] = None
         if self.current().type != "SEMICOL":
             if self.current().type == "VAR":
@@ -557,6 +1398,50 @@ class Parser:
         body = self.block()
         return ForStmt(init, test, update, body)
 
+    def is_for_in(self) -> bool:
+        offset = 1 if self.current().type == "VAR" else 0
+        return self.peek(offset).type == "ID" and self.peek(offset + 1).type == "IN"
+
+    def parallel_for(self) -> ParallelFor:
+        self.eat("PARALLEL")
+        threads = False
+        tok = self.current()
+        if tok.type == "ID" and tok.value in ("threads", "processes"):
+            threads = self.advance().value == "threads"
+        chunk: Optional[Node] = None
+        if self.match("LPAREN"):
+            chunk = self.expression()
+            self.eat("RPAREN")
+        if self.current().type != "FOR":
+            raise OPNError(
+                "Se esperaba 'for' despues de 'parallel'",
+                self.current(),
+                code="OPN2006",
+                phase="Sintaxis",
+                source_name=self.source_name,
+                source_code=self.source_code,
+                hint="Uso: parallel [threads] [(chunk)] for (...) { ... }",
+            )
+        return ParallelFor(self.for_stmt(), threads, chunk)
+
+    def yield_stmt(self) -> YieldStmt:
+        tok = self.eat("YIELD")
+        if not self.function_stack:
+            raise OPNError(
+                "yield solo puede usarse dentro de una funcion",
+                tok,
+                code="OPN2008",
+                phase="Sintaxis",
+                source_name=self.source_name,
+                source_code=self.source_code,
+                hint="Mueve el yield al cuerpo de una function para crear un generador.",
+            )
+        expr = None
+        if self.current().type != "SEMICOL":
+            expr = self.expression()
+        self.eat_semicol()
+        return YieldStmt(expr)
+
     def return_stmt(self) -> ReturnStmt:
         self.eat("RETURN")
         expr = None
@@ -661,6 +1546,19 @@ class Parser:
         if self.current().type == "OP" and self.current().value in ("!", "-"):
             op = self.advance().value
             return UnaryExpr(op, self.unary())
+        if self.current().type == "AWAIT":
+            tok = self.advance()
+            if self.function_stack and not self.function_stack[-1]:
+                raise OPNError(
+                    "await solo puede usarse dentro de async function",
+                    tok,
+                    code="OPN2005",
+                    phase="Sintaxis",
+                    source_name=self.source_name,
+                    source_code=self.source_code,
+                    hint="Declara la funcion como 'async function' o usa await en el nivel superior.",
+                )
+            return AwaitExpr(self.unary())
         return self.call()
 
     def call(self) -> Node:
@@ -696,7 +1594,19 @@ class Parser:
             return Literal(int(tok.value))
         if tok.type == "STRING":
             self.advance()
-            return Literal(ast.literal_eval(tok.value))
+            try:
+                return Literal(ast.literal_eval(tok.value))
+            except (SyntaxError, ValueError) as err:
+                raise OPNError(
+                    "Cadena invalida",
+                    tok,
+                    code="OPN2012",
+                    phase="Sintaxis",
+                    source_name=self.source_name,
+                    source_code=self.source_code,
+                    hint="Revisa las secuencias de escape de la cadena.",
+                    details=str(err),
+                ) from err
         if tok.type == "TRUE":
             self.advance()
             return Literal(True)
@@ -721,6 +1631,8 @@ class Parser:
             return self.array_literal()
         if tok.type == "LBRACE":
             return self.dict_literal()
+        if tok.type == "PARALLEL":
+            return self.parallel_for()
         raise OPNError(
             "Expresion invalida",
             tok,
@@ -757,32 +1669,405 @@ class Parser:
         return key, value
 
 
+# Nodos maximos de la expresion devuelta para que una funcion se inserte en linea.
+INLINE_MAX_NODES = 16
+
+
+def _binding_counts(nodes: Iterable[Node]) -> Counter[str]:
+    counts: Counter[str] = Counter()
+    for node in nodes:
+        if isinstance(node, (VarDecl, FunctionDecl, ClassDecl, StructDecl, ForInStmt)):
+            counts[node.name] += 1
+            if isinstance(node, FunctionDecl):
+                counts.update(node.params)
+        elif isinstance(node, AssignExpr) and isinstance(node.target, Identifier):
+            counts[node.target.name] += 1
+        elif isinstance(node, ImportStmt):
+            counts[node.alias or node.module.split(".")[0]] += 1
+        elif isinstance(node, FromImportStmt):
+            counts.update(alias or name for name, alias in node.names)
+    return counts
+
+
+def inline_candidates(
+    program: Program, nodes: Optional[list[Node]] = None
+) -> dict[str, FunctionDecl]:
+    # Funciones de nivel superior con un unico "return expr" pequeno, definidas
+    # antes de cualquier codigo ejecutable, declaradas una sola vez y usadas solo
+    # como llamadas. El cuerpo no puede llamar a otra candidata (ni a si misma).
+    if nodes is None:
+        nodes = list(walk_nodes(program))
+    if _identifier_names(nodes) & DYNAMIC_LOOKUP_NAMES:
+        return {}
+    candidates: dict[str, FunctionDecl] = {}
+    for stmt in program.body:
+        if not isinstance(stmt, (FunctionDecl, StructDecl, ImportStmt, FromImportStmt)):
+            break
+        if not isinstance(stmt, FunctionDecl) or stmt.is_async or len(stmt.body.body) != 1:
+            continue
+        ret = stmt.body.body[0]
+        if not isinstance(ret, ReturnStmt) or ret.expr is None:
+            continue
+        body_nodes = list(walk_nodes(ret.expr))
+        if len(body_nodes) > INLINE_MAX_NODES or len(set(stmt.params)) != len(stmt.params):
+            continue
+        if any(isinstance(node, (AssignExpr, AwaitExpr, ParallelFor)) for node in body_nodes):
+            continue
+        if any(isinstance(node, Identifier) and node.name == "this" for node in body_nodes):
+            continue
+        candidates[stmt.name] = stmt
+
+    counts = _binding_counts(nodes)
+    callees = {id(node.callee) for node in nodes if isinstance(node, CallExpr)}
+    for node in nodes:
+        if isinstance(node, Identifier) and node.name in candidates and id(node) not in callees:
+            candidates.pop(node.name)
+    for name in [name for name in candidates if counts[name] != 1]:
+        candidates.pop(name)
+    for name in list(candidates):
+        body = candidates[name].body.body[0].expr
+        if _used_names([body]) & set(candidates):
+            candidates.pop(name)
+    return candidates
+
+
+# Nombres que pueden agregar atributos sin una asignacion visible obj.campo = valor.
+ATTRIBUTE_INJECTION_NAMES = DYNAMIC_LOOKUP_NAMES | {"setattr", "delattr"}
+
+
+def _class_member_stores(cls: ClassDecl) -> Iterator[AssignExpr]:
+    # Asignaciones this.campo = ... del cuerpo de la clase en orden de fuente,
+    # sin entrar en clases anidadas.
+    pending = list(iter_child_nodes(cls.body))[::-1]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ClassDecl):
+            continue
+        if (
+            isinstance(node, AssignExpr)
+            and isinstance(node.target, MemberExpr)
+            and isinstance(node.target.obj, Identifier)
+            and node.target.obj.name == "this"
+        ):
+            yield node
+        pending.extend(reversed(list(iter_child_nodes(node))))
+
+
+def slotted_classes(
+    program: Program, nodes: Optional[list[Node]] = None
+) -> dict[int, tuple[str, ...]]:
+    # Una clase recibe __slots__ si sus campos salen solo de this.campo = ... y
+    # ninguna asignacion obj.campo = ... fuera de sus metodos usa otro nombre.
+    # Las clases se identifican por id() del ClassDecl.
+    if nodes is None:
+        nodes = list(walk_nodes(program))
+    if _identifier_names(nodes) & ATTRIBUTE_INJECTION_NAMES:
+        return {}
+    classes = [node for node in nodes if isinstance(node, ClassDecl)]
+    own_stores: set[int] = set()
+    fields_by_class: dict[int, dict[str, None]] = {}
+    for cls in classes:
+        fields: dict[str, None] = {}
+        for assign in _class_member_stores(cls):
+            fields.setdefault(assign.target.prop, None)
+            own_stores.add(id(assign))
+        fields_by_class[id(cls)] = fields
+    external: set[str] = set()
+    for node in nodes:
+        if isinstance(node, MemberExpr) and node.prop == "__dict__":
+            return {}
+        if isinstance(node, AssignExpr) and isinstance(node.target, MemberExpr):
+            if id(node) not in own_stores:
+                external.add(node.target.prop)
+
+    slots: dict[int, tuple[str, ...]] = {}
+    for cls in classes:
+        fields = fields_by_class[id(cls)]
+        members = {
+            "__init__" if isinstance(stmt, FunctionDecl) and stmt.name == "init" else stmt.name
+            for stmt in cls.body.body
+            if isinstance(stmt, (FunctionDecl, ClassDecl, VarDecl))
+        }
+        # Un slot no puede compartir nombre con un metodo o atributo de clase.
+        if external <= fields.keys() and not members & fields.keys():
+            slots[id(cls)] = tuple(fields)
+    return slots
+
+
+def _evaluation_order(node: Node, conditional: bool = False) -> Iterator[tuple[Node, bool]]:
+    # Identificadores y llamadas en el orden en que Python los evalua; cada llamada
+    # aparece despues de su callee y sus argumentos.
+    if isinstance(node, Identifier):
+        yield node, conditional
+    elif isinstance(node, BinaryExpr):
+        yield from _evaluation_order(node.left, conditional)
+        yield from _evaluation_order(node.right, conditional or node.op in ("&&", "||"))
+    elif isinstance(node, UnaryExpr):
+        yield from _evaluation_order(node.value, conditional)
+    elif isinstance(node, CallExpr):
+        yield from _evaluation_order(node.callee, conditional)
+        for arg in node.args:
+            yield from _evaluation_order(arg, conditional)
+        yield node, conditional
+    elif isinstance(node, (MemberExpr, IndexExpr)):
+        yield from _evaluation_order(node.obj, conditional)
+        if isinstance(node, IndexExpr):
+            yield from _evaluation_order(node.index, conditional)
+    elif isinstance(node, ArrayLiteral):
+        for element in node.elements:
+            yield from _evaluation_order(element, conditional)
+    elif isinstance(node, DictLiteral):
+        for key, value in node.pairs:
+            yield from _evaluation_order(key, conditional)
+            yield from _evaluation_order(value, conditional)
+
+
+def _chain_code(node: Node) -> Optional[tuple[str, frozenset[str]]]:
+    # Codigo y nombres de una cadena pura raiz.miembro[indice]...; None si no lo es.
+    if isinstance(node, Identifier):
+        return ("self" if node.name == "this" else node.name), frozenset({node.name})
+    if isinstance(node, MemberExpr):
+        base = _chain_code(node.obj)
+        return None if base is None else (f"{base[0]}.{node.prop}", base[1])
+    if isinstance(node, IndexExpr):
+        base = _chain_code(node.obj)
+        if base is None:
+            return None
+        index = node.index
+        if isinstance(index, Identifier):
+            return f"{base[0]}[{_chain_code(index)[0]}]", base[1] | {index.name}
+        if isinstance(index, Literal) and isinstance(index.value, (int, str)):
+            return f"{base[0]}[{index.value!r}]", base[1]
+    return None
+
+
+class _ChainPlanner:
+    # Recorre un bloque basico en orden de evaluacion. Una llamada, await, yield o
+    # escritura de miembro/indice invalida todas las cadenas; reasignar un nombre
+    # invalida solo las cadenas que lo mencionan.
+    def __init__(self) -> None:
+        self.generation = 0
+        self.name_generation: dict[str, int] = {}
+        self.conditional = 0
+        self.groups: dict[tuple[Any, ...], list[tuple[Node, tuple[int, ...], int]]] = {}
+        self.line = 0
+
+    def statement(self, node: Node) -> None:
+        self.line = getattr(node, "line", 0)
+        if isinstance(node, VarDecl):
+            self.visit(node.expr)
+            self.rebind(node.name)
+        elif isinstance(node, ExprStmt):
+            self.visit(node.expr)
+        elif isinstance(node, ReturnStmt):
+            if node.expr is not None:
+                self.visit(node.expr)
+        elif isinstance(node, YieldStmt):
+            if node.expr is not None:
+                self.visit(node.expr)
+            self.generation += 1
+        else:
+            self.generation += 1
+
+    def rebind(self, name: str) -> None:
+        self.name_generation[name] = self.name_generation.get(name, 0) + 1
+
+    def visit(self, node: Node, ancestors: tuple[int, ...] = ()) -> None:
+        if isinstance(node, (Literal, Identifier)):
+            return
+        if isinstance(node, (MemberExpr, IndexExpr)):
+            chain = _chain_code(node)
+            if chain is None:
+                self.visit(node.obj)
+                if isinstance(node, IndexExpr):
+                    self.visit(node.index)
+                return
+            if not self.conditional:
+                code, names = chain
+                key = (
+                    code,
+                    self.generation,
+                    tuple(self.name_generation.get(name, 0) for name in sorted(names)),
+                )
+                self.groups.setdefault(key, []).append((node, ancestors, self.line))
+            self.visit(node.obj, (*ancestors, id(node)))
+            return
+        if isinstance(node, CallExpr):
+            # El metodo ligado no se cachea; su objeto si.
+            callee = node.callee
+            self.visit(callee.obj if isinstance(callee, MemberExpr) else callee)
+            for arg in node.args:
+                self.visit(arg)
+            self.generation += 1
+            return
+        if isinstance(node, BinaryExpr):
+            self.visit(node.left)
+            if node.op in ("&&", "||"):
+                # El lado derecho puede no evaluarse: no define ni usa temporales.
+                self.conditional += 1
+                self.visit(node.right)
+                self.conditional -= 1
+            else:
+                self.visit(node.right)
+            return
+        if isinstance(node, UnaryExpr):
+            self.visit(node.value)
+            return
+        if isinstance(node, AssignExpr):
+            self.visit(node.value)
+            target = node.target
+            if isinstance(target, Identifier):
+                self.rebind(target.name)
+                return
+            if isinstance(target, (MemberExpr, IndexExpr)):
+                self.visit(target.obj)
+                if isinstance(target, IndexExpr):
+                    self.visit(target.index)
+            self.generation += 1
+            return
+        if isinstance(node, ArrayLiteral):
+            for element in node.elements:
+                self.visit(element)
+            return
+        if isinstance(node, DictLiteral):
+            for key, value in node.pairs:
+                self.visit(key)
+                self.visit(value)
+            return
+        if isinstance(node, AwaitExpr):
+            self.visit(node.value)
+        self.generation += 1
+
+    def plan(self) -> list[tuple[str, list[Node], int]]:
+        # Las cadenas mas largas primero; una aparicion dentro de un uso ya
+        # reemplazado no se evalua y no cuenta para sus prefijos.
+        selected = []
+        replaced: set[int] = set()
+        for key, occurrences in sorted(self.groups.items(), key=lambda item: -len(item[0][0])):
+            live = [
+                (node, line)
+                for node, ancestors, line in occurrences
+                if not replaced.intersection(ancestors)
+            ]
+            if len(live) < 2:
+                continue
+            nodes = [node for node, _ in live]
+            replaced.update(id(node) for node in nodes[1:])
+            selected.append((key[0], nodes, live[0][1]))
+        return selected
+
+
+@dataclass(slots=True)
+class Specialization:
+    line: int
+    kind: str
+    detail: str
+
+
 class Transpiler:
-    def __init__(self):
+    def __init__(
+        self,
+        source_name: Optional[str] = None,
+        specialize: bool = True,
+        inline: bool = True,
+        source_code: Optional[str] = None,
+    ):
+        self.source_name = source_name
+        self.source_code = source_code
+        self.use_types = specialize
+        # Sin inlining para trazadores y profilers: una llamada inlineada no deja frame
+        # ni eventos de linea en el cuerpo de la funcion.
+        self.use_inline = inline
         self.indent = 0
+        self.line = 0
+        self.specializations: list[Specialization] = []
+        self.scope_roots: list[Node] = []
+        self.nested_names: dict[int, set[str]] = {}
+        self.accumulators: dict[str, str] = {}
+        self.cse: dict[int, tuple[str, bool]] = {}
+        self.inlinable: dict[str, FunctionDecl] = {}
+        self.inline_args: dict[str, str] = {}
+        self.inline_defs: dict[int, str] = {}
+        self.in_class_body = False
+        self.class_slots: dict[int, tuple[str, ...]] = {}
+        self.temp_count = 0
+        self.uses_asyncio = False
+        self.uses_parallel = False
+        self.scopes: list[set[str]] = []
+        self.lifted: list[str] = []
+        self.lifted_count = 0
+        self.line_map = array.array("I")
+        self.warnings: list[str] = []
 
     def emit(self, line: str) -> str:
         return ("    " * self.indent) + line
 
     def transpile(self, node: Node, in_class: bool = False) -> str:
+        line = getattr(node, "line", 0)
+        outer_line = self.line
+        self.line = line or outer_line
+        chunk = self._transpile(node, in_class)
+        self.line = outer_line
+        # Marca "\0linea\0" al inicio del chunk; Program la retira al armar line_map.
+        if line and chunk:
+            return f"\0{line}\0{chunk}"
+        return chunk
+
+    def _strip_line_markers(self, body: str) -> str:
+        lines = []
+        line_map = self.line_map
+        current = 0
+        for text in body.split("\n"):
+            while text.startswith("\0"):
+                _, number, text = text.split("\0", 2)
+                current = int(number)
+            line_map.append(current)
+            lines.append(text)
+        return "\n".join(lines)
+
+    def specialize(self, kind: str, detail: str, line: Optional[int] = None) -> None:
+        self.specializations.append(Specialization(line or self.line, kind, detail))
+
+    def _transpile(self, node: Node, in_class: bool) -> str:
         if isinstance(node, Program):
-            chunks = [self.transpile(stmt) for stmt in node.body]
+            if self.use_types:
+                # Un solo recorrido del arbol compartido por los tres analisis.
+                nodes = list(walk_nodes(node))
+                infer_types(node, nodes)
+                if self.use_inline:
+                    self.inlinable = inline_candidates(node, nodes)
+                self.class_slots = slotted_classes(node, nodes)
+            self.scope_roots.append(node)
+            chunks = []
+            for stmt in node.body:
+                chunk = self.transpile(stmt)
+                if self.lifted:
+                    chunk = "\n".join([*self.lifted, chunk])
+                    self.lifted = []
+                chunks.append(chunk)
             body = "\n".join(c for c in chunks if c.strip())
+            imports = "import asyncio as _opn_asyncio, sys as _opn_sys"
             prelude = "\n".join(
                 [
-                    "import sys as _opn_sys",
+                    imports if self.uses_asyncio else "import sys as _opn_sys",
                     "if hasattr(_opn_sys.stdout, 'reconfigure'):",
                     "    _opn_sys.stdout.reconfigure(encoding='utf-8')",
                     "if hasattr(_opn_sys.stderr, 'reconfigure'):",
                     "    _opn_sys.stderr.reconfigure(encoding='utf-8')",
                 ]
             )
+            # line_map[i] es la linea OPN de la linea Python i + 1 (0 en el preambulo).
+            self.line_map = array.array("I", [0] * (prelude.count("\n") + 1))
             if body:
-                return prelude + "\n\n" + body
+                self.line_map.append(0)
+                return prelude + "\n\n" + self._strip_line_markers(body)
             return prelude
 
         if isinstance(node, Block):
+            planned = self._plan_common_chains(node.body) if self.use_types else []
             chunks = [self.transpile(stmt, in_class=in_class) for stmt in node.body]
+            for key in planned:
+                del self.cse[key]
             lines = [c for c in chunks if c.strip()]
             return "\n".join(lines) if lines else self.emit("pass")
 
@@ -808,21 +2093,39 @@ class Transpiler:
             params = list(node.params)
             if in_class and (not params or params[0] != "self"):
                 params.insert(0, "self")
-            header = self.emit(f"def {py_name}({', '.join(params)}):")
+            keyword = "async def" if node.is_async else "def"
+            header = self.emit(f"{keyword} {py_name}({', '.join(params)}):")
+            self.scopes.append(set(params) | declared_names(node.body))
+            self.scope_roots.append(node)
+            outer_class_body = self.in_class_body
+            self.in_class_body = False
             self.indent += 1
             body = self.transpile(node.body, in_class=in_class)
             self.indent -= 1
+            self.in_class_body = outer_class_body
+            self.scope_roots.pop()
+            self.scopes.pop()
             return header + "\n" + body
 
         if isinstance(node, ClassDecl):
             header = self.emit(f"class {node.name}:")
+            outer_class_body = self.in_class_body
+            self.in_class_body = True
             self.indent += 1
             body = self.transpile(node.body, in_class=True)
+            slots = self.class_slots.get(id(node))
+            if slots is not None:
+                self.specialize("slots", f"{node.name}.__slots__ = {slots!r}")
+                body = self.emit(f"__slots__ = {slots!r}") + "\n" + body
             self.indent -= 1
+            self.in_class_body = outer_class_body
             return header + "\n" + body
 
+        if isinstance(node, StructDecl):
+            return self._struct(node)
+
         if isinstance(node, IfStmt):
-            head = self.emit(f"if {self.expr(node.test)}:")
+            head = self.emit(f"if {self.test(node.test)}:")
             self.indent += 1
             cons = self.transpile(node.cons, in_class=in_class)
             self.indent -= 1
@@ -834,8 +2137,13 @@ class Transpiler:
             self.indent -= 1
             return head + "\n" + cons + "\n" + else_head + "\n" + alt
 
+        if isinstance(node, (WhileStmt, ForStmt, ForInStmt)):
+            accumulated = self._string_accumulators(node)
+            if accumulated:
+                return self._accumulate_loop(node, accumulated, in_class)
+
         if isinstance(node, WhileStmt):
-            head = self.emit(f"while {self.expr(node.test)}:")
+            head = self.emit(f"while {self.test(node.test)}:")
             self.indent += 1
             body = self.transpile(node.body, in_class=in_class)
             self.indent -= 1
@@ -857,7 +2165,7 @@ class Transpiler:
             lines = []
             if node.init:
                 lines.append(self.transpile(node.init, in_class=in_class))
-            cond = self.expr(node.test) if node.test else "True"
+            cond = self.test(node.test) if node.test else "True"
             lines.append(self.emit(f"while {cond}:"))
             self.indent += 1
             body_code = self.transpile(node.body, in_class=in_class)
@@ -867,13 +2175,34 @@ class Transpiler:
             self.indent -= 1
             return "\n".join(lines)
 
+        if isinstance(node, ForInStmt):
+            header = self.emit(f"for {node.name} in {self.expr(node.iterable)}:")
+            self.indent += 1
+            body_code = self.transpile(node.body, in_class=in_class)
+            self.indent -= 1
+            return header + "\n" + body_code
+
+        if isinstance(node, ParallelFor):
+            return self.emit(self.expr(node))
+
+        if isinstance(node, YieldStmt):
+            if node.expr is None:
+                return self.emit("yield")
+            return self.emit(f"yield {self.expr(node.expr)}")
+
         if isinstance(node, ReturnStmt):
             if node.expr is None:
                 return self.emit("return")
             return self.emit(f"return {self.expr(node.expr)}")
 
         if isinstance(node, ExprStmt):
-            return self.emit(self.expr(node.expr))
+            expr = node.expr
+            if isinstance(expr, AssignExpr) and isinstance(expr.target, Identifier):
+                parts = self.accumulators.get(expr.target.name)
+                if parts is not None:
+                    pieces = self._concat_operands(expr.value)[1:]
+                    return self.emit(f"{parts}.append({self._concat_code(pieces)[0]})")
+            return self.emit(self.expr(expr))
 
         return ""
 
@@ -881,14 +2210,33 @@ class Transpiler:
         if isinstance(node, Literal):
             return repr(node.value)
         if isinstance(node, Identifier):
+            if node.name in self.inline_args:
+                return self.inline_defs.get(id(node)) or self.inline_args[node.name]
             return "self" if node.name == "this" else node.name
         if isinstance(node, AssignExpr):
-            return f"{self.expr(node.target)} = {self.expr(node.value)}"
+            target = node.target
+            kind = inferred_type(target.obj) if isinstance(target, MemberExpr) else None
+            if kind is not None and kind.startswith("struct "):
+                raise self._transpile_error(
+                    f"Los campos de {kind} son inmutables: no se puede asignar '{target.prop}'",
+                    hint=f"Crea un registro nuevo: {kind[7:]}(...) con los valores cambiados.",
+                )
+            return f"{self.expr(target)} = {self.expr(node.value)}"
         if isinstance(node, BinaryExpr):
             if isinstance(node.left, Literal) and isinstance(node.right, Literal):
                 folded = self._eval_const_binary(node.op, node.left.value, node.right.value)
                 if folded is not None:
                     return repr(folded)
+            identity = self._none_identity(node)
+            if identity is not None:
+                return identity
+            if node.op == "+" and inferred_type(node) == "str":
+                operands = self._concat_operands(node)
+                if len(operands) >= 3:
+                    code, rewritten = self._concat_code(operands)
+                    if rewritten:
+                        self.specialize("f-string", f"{len(operands)} operandos -> {code}")
+                    return code
             op = node.op.replace("&&", "and").replace("||", "or")
             return f"({self.expr(node.left)} {op} {self.expr(node.right)})"
         if isinstance(node, UnaryExpr):
@@ -898,13 +2246,46 @@ class Transpiler:
                 if isinstance(node.value.value, (int, float)):
                     return repr(-node.value.value)
             return f"(-{self.expr(node.value)})"
+        if isinstance(node, AwaitExpr):
+            value = node.value
+            if (
+                isinstance(value, CallExpr)
+                and isinstance(value.callee, Identifier)
+                and value.callee.name == "all"
+            ):
+                # await all(a, b, ...) superpone las esperas con asyncio.gather.
+                self.uses_asyncio = True
+                if len(value.args) == 1 and not isinstance(value.args[0], (CallExpr, AwaitExpr)):
+                    args = f"*{self.expr(value.args[0])}"
+                else:
+                    args = ", ".join(self.expr(arg) for arg in value.args)
+                return f"(await _opn_asyncio.gather({args}))"
+            return f"(await {self.expr(value)})"
+        if isinstance(node, ParallelFor):
+            return self._parallel_for(node)
         if isinstance(node, CallExpr):
+            if isinstance(node.callee, Identifier) and node.callee.name in self.inlinable:
+                inlined = self._inline_call(node)
+                if inlined is not None:
+                    return inlined
+            if self._is_identity_conversion(node):
+                arg = self.expr(node.args[0])
+                self.specialize("intrinsic", f"{node.callee.name}({arg}) -> {arg}")
+                return arg
             args = ", ".join(self.expr(arg) for arg in node.args)
             return f"{self.expr(node.callee)}({args})"
         if isinstance(node, MemberExpr):
-            return f"{self.expr(node.obj)}.{node.prop}"
+            planned = self.cse.get(id(node))
+            if planned is not None and not planned[1]:
+                return planned[0]
+            code = f"{self.expr(node.obj)}.{node.prop}"
+            return f"({planned[0]} := {code})" if planned else code
         if isinstance(node, IndexExpr):
-            return f"{self.expr(node.obj)}[{self.expr(node.index)}]"
+            planned = self.cse.get(id(node))
+            if planned is not None and not planned[1]:
+                return planned[0]
+            code = f"{self.expr(node.obj)}[{self.expr(node.index)}]"
+            return f"({planned[0]} := {code})" if planned else code
         if isinstance(node, ArrayLiteral):
             return "[" + ", ".join(self.expr(e) for e in node.elements) + "]"
         if isinstance(node, DictLiteral):
@@ -912,6 +2293,419 @@ class Transpiler:
             return "{" + ", ".join(pairs) + "}"
         return "None"
 
+    def test(self, node: Node) -> str:
+        # En una condicion basta la veracidad del valor: len(x) > 0 pasa a x y
+        # flag == true pasa a flag cuando los tipos inferidos lo garantizan.
+        if isinstance(node, BinaryExpr) and isinstance(node.right, Literal):
+            positive = None
+            target = node.left
+            value = node.right.value
+            sized = self._is_sized_len(target)
+            if sized and type(value) is int:
+                positive = {(">", 0): True, ("!=", 0): True, (">=", 1): True}.get((node.op, value))
+                if positive is None:
+                    positive = {("==", 0): False, ("<", 1): False, ("<=", 0): False}.get(
+                        (node.op, value)
+                    )
+                target = target.args[0]
+            elif inferred_type(target) == "bool" and isinstance(value, bool) and node.op in ("==", "!="):
+                positive = value == (node.op == "==")
+            if positive is not None:
+                subject = self.expr(target)
+                code = subject if positive else f"(not {subject})"
+                literal = str(value).lower() if isinstance(value, bool) else value
+                shown = f"len({subject})" if sized else subject
+                self.specialize("truthiness", f"{shown} {node.op} {literal} -> {code}")
+                return code
+        return self.expr(node)
+
+    def _is_sized_len(self, node: Node) -> bool:
+        # inferred == "int" confirma que len es el builtin y no un nombre redefinido.
+        return (
+            isinstance(node, CallExpr)
+            and isinstance(node.callee, Identifier)
+            and node.callee.name == "len"
+            and inferred_type(node) == "int"
+            and len(node.args) == 1
+            and inferred_type(node.args[0]) in ("str", "list", "dict")
+        )
+
+    def _is_formattable_str(self, node: Node) -> bool:
+        return (
+            isinstance(node, CallExpr)
+            and isinstance(node.callee, Identifier)
+            and node.callee.name == "str"
+            and inferred_type(node) == "str"
+            and len(node.args) == 1
+            and inferred_type(node.args[0]) in ("int", "float", "bool", "str", "none")
+        )
+
+    def _is_identity_conversion(self, node: CallExpr) -> bool:
+        return (
+            isinstance(node.callee, Identifier)
+            and node.callee.name in ("str", "int", "float")
+            and inferred_type(node) == node.callee.name
+            and len(node.args) == 1
+            and inferred_type(node.args[0]) == node.callee.name
+        )
+
+    def _none_identity(self, node: BinaryExpr) -> Optional[str]:
+        # Con un tipo builtin conocido, == null equivale a "is None" y evita __eq__.
+        if node.op not in ("==", "!="):
+            return None
+        left, right = node.left, node.right
+        if isinstance(left, Literal) and left.value is None:
+            left, right = right, left
+        if not (isinstance(right, Literal) and right.value is None):
+            return None
+        if inferred_type(left) is None:
+            return None
+        op = "is" if node.op == "==" else "is not"
+        code = f"({self.expr(left)} {op} None)"
+        self.specialize("none-identity", code)
+        return code
+
+    def _concat_operands(self, node: Node) -> list[Node]:
+        # Aplana una cadena de + entre strings (asociativa) en orden de izquierda a derecha.
+        operands = []
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            if (
+                isinstance(current, BinaryExpr)
+                and current.op == "+"
+                and inferred_type(current) == "str"
+            ):
+                pending.append(current.right)
+                pending.append(current.left)
+            else:
+                operands.append(current)
+        return operands
+
+    def _concat_code(self, operands: list[Node]) -> tuple[str, bool]:
+        if len(operands) == 1:
+            op = operands[0]
+            if isinstance(op, Literal) and isinstance(op.value, str):
+                return repr(op.value), False
+            return self.expr(op), False
+        parts: list[tuple[Optional[str], str]] = []
+        for op in operands:
+            if isinstance(op, Literal) and isinstance(op.value, str):
+                parts.append((None, op.value))
+            elif self._is_formattable_str(op):
+                # Dentro de un f-string, {x} ya formatea como str(x) para los tipos builtin.
+                code = self.expr(op.args[0])
+                parts.append((code, f"str({code})"))
+            else:
+                code = self.expr(op)
+                parts.append((code, code))
+        # Las expresiones con comillas, barras o llaves no caben en un f-string
+        # portable; en ese caso se conserva la concatenacion.
+        if any(code is not None and any(ch in code for ch in "'\"\\{}#") for code, _ in parts):
+            chain = [repr(text) if code is None else text for code, text in parts]
+            return "(" + " + ".join(chain) + ")", False
+        if all(code is None for code, _ in parts):
+            return repr("".join(text for _, text in parts)), True
+        body = "".join(
+            text.replace("{", "{{").replace("}", "}}") if code is None else "{" + code + "}"
+            for code, text in parts
+        )
+        return "f" + repr(body), True
+
+    def _accumulation_target(self, node: Node) -> Optional[str]:
+        # s = s + pieza con tipos str: candidato a acumularse en una lista.
+        if not isinstance(node, ExprStmt) or not isinstance(node.expr, AssignExpr):
+            return None
+        assign = node.expr
+        target = assign.target
+        if not isinstance(target, Identifier) or inferred_type(assign.value) != "str":
+            return None
+        operands = self._concat_operands(assign.value)
+        head = operands[0]
+        if len(operands) < 2 or not isinstance(head, Identifier) or head.name != target.name:
+            return None
+        return target.name
+
+    def _names_in_nested_scopes(self) -> set[str]:
+        root = self.scope_roots[-1]
+        names = self.nested_names.get(id(root))
+        if names is None:
+            body = root.body.body if isinstance(root, FunctionDecl) else root.body
+            names = {
+                child.name
+                for stmt in body
+                for nested in walk_nodes(stmt)
+                if isinstance(nested, (FunctionDecl, ClassDecl))
+                for child in walk_nodes(nested)
+                if isinstance(child, Identifier)
+            }
+            self.nested_names[id(root)] = names
+        return names
+
+    def _string_accumulators(self, node: Node) -> list[str]:
+        # Solo si cada aparicion del nombre dentro del bucle es parte de s = s + pieza:
+        # nadie observa el valor intermedio y basta unir las piezas al salir.
+        if not self.scope_roots:
+            return []
+        uses: Counter[str] = Counter()
+        accumulations: Counter[str] = Counter()
+        rebound: set[str] = set()
+        for child in walk_nodes(node):
+            if isinstance(child, Identifier):
+                uses[child.name] += 1
+            elif isinstance(child, (VarDecl, ForInStmt, FunctionDecl, ClassDecl)):
+                rebound.add(child.name)
+                if isinstance(child, FunctionDecl):
+                    rebound.update(child.params)
+            else:
+                name = self._accumulation_target(child)
+                if name is not None:
+                    accumulations[name] += 1
+        if not accumulations:
+            return []
+        nested = self._names_in_nested_scopes()
+        return [
+            name
+            for name, count in accumulations.items()
+            if uses[name] == 2 * count
+            and name not in rebound
+            and name not in nested
+            and name not in self.accumulators
+        ]
+
+    def _struct(self, node: StructDecl) -> str:
+        # Registro compacto e inmutable: __slots__, igualdad y hash por valor, asi
+        # sirve como clave de dict. __setattr__ rechaza toda escritura; el constructor
+        # escribe por los descriptores de slot capturados tras crear la clase, que
+        # cuestan casi lo mismo que una asignacion normal (un registro congelado con
+        # object.__setattr__ tarda ~1.5x en construirse).
+        name, fields = node.name, node.fields
+        comma = "," if len(fields) == 1 else ""
+        own = "(" + ", ".join(f"self.{field}" for field in fields) + comma + ")"
+        other = "(" + ", ".join(f"other.{field}" for field in fields) + comma + ")"
+        shown = ", ".join(f"{field}={{self.{field}!r}}" for field in fields)
+        lines = [
+            f"class {name}:",
+            f"    __slots__ = {tuple(fields)!r}",
+            *(["    def __init__(self):", "        pass"] if not fields else []),
+            "    def __setattr__(self, name, value):",
+            f"        raise AttributeError(f\"struct {name} es inmutable: no se puede asignar '{{name}}'\")",
+            "    def __delattr__(self, name):",
+            f"        raise AttributeError(f\"struct {name} es inmutable: no se puede borrar '{{name}}'\")",
+            "    def __eq__(self, other):",
+            "        if other.__class__ is not self.__class__:",
+            "            return NotImplemented",
+            f"        return {own} == {other}",
+            "    def __hash__(self):",
+            f"        return hash({own})",
+            "    def __reduce__(self):",
+            f"        return (self.__class__, {own})",
+            "    def __repr__(self):",
+            f"        return f'{name}({shown})'",
+        ]
+        if fields:
+            setters = [f"_opn_set_{field}" for field in fields]
+            lines += [
+                f"def _opn_init_{name}({', '.join(setters)}):",
+                f"    def __init__({', '.join(['self', *fields])}):",
+                *(f"        {setter}(self, {field})" for setter, field in zip(setters, fields)),
+                "    return __init__",
+                f"{name}.__init__ = _opn_init_{name}("
+                + ", ".join(f"{name}.{field}.__set__" for field in fields)
+                + ")",
+                f"del _opn_init_{name}",
+            ]
+        return "\n".join(self.emit(line) for line in lines)
+
+    def _inline_call(self, node: CallExpr) -> Optional[str]:
+        name = node.callee.name
+        func = self.inlinable[name]
+        body = func.body.body[0].expr
+        if len(node.args) != len(func.params) or self.in_class_body or self.inline_args:
+            return None
+        # Los nombres libres del cuerpo deben seguir resolviendo al modulo.
+        enclosing = set().union(*self.scopes) if self.scopes else set()
+        if (_used_names([body]) - set(func.params)) & enclosing:
+            return None
+        # Un argumento compuesto se liga con := en el primer uso de su parametro; solo
+        # es valido si ese uso no es condicional, precede a toda llamada del cuerpo y
+        # los argumentos compuestos conservan su orden de evaluacion.
+        first_uses: dict[str, tuple[int, Identifier, bool]] = {}
+        called = False
+        for position, (child, conditional) in enumerate(_evaluation_order(body)):
+            if isinstance(child, CallExpr):
+                called = True
+            elif child.name in func.params and child.name not in first_uses:
+                first_uses[child.name] = (position, child, not (conditional or called))
+        bound = [
+            (param, arg)
+            for param, arg in zip(func.params, node.args)
+            if not isinstance(arg, (Literal, Identifier)) or param not in first_uses
+        ]
+        positions = []
+        for param, _ in bound:
+            if param not in first_uses or not first_uses[param][2]:
+                return None
+            positions.append(first_uses[param][0])
+        if positions != sorted(positions):
+            return None
+
+        args = {param: self.expr(arg) for param, arg in zip(func.params, node.args)}
+        defs = {}
+        uses = Counter(child.name for child in walk_nodes(body) if isinstance(child, Identifier))
+        for param, _ in bound:
+            if uses[param] == 1:
+                continue
+            self.temp_count += 1
+            temp = f"_opn_arg_{self.temp_count}"
+            defs[id(first_uses[param][1])] = f"({temp} := {args[param]})"
+            args[param] = temp
+        self.inline_args = args
+        self.inline_defs = defs
+        try:
+            inner = self.expr(body)
+        finally:
+            self.inline_args = {}
+            self.inline_defs = {}
+        self.specialize("inline", f"{name}() -> {inner}")
+        return inner
+
+    def _plan_common_chains(self, body: list[Node]) -> list[int]:
+        # CSE por bloque basico: la primera aparicion define el temporal con := y
+        # las siguientes lo leen, sin alterar el orden de evaluacion.
+        planned: list[int] = []
+        planner = _ChainPlanner()
+        for stmt in [*body, None]:
+            if isinstance(stmt, (VarDecl, ExprStmt, ReturnStmt, YieldStmt)):
+                planner.statement(stmt)
+                continue
+            for code, nodes, line in planner.plan():
+                self.temp_count += 1
+                name = f"_opn_cse_{self.temp_count}"
+                self.cse[id(nodes[0])] = (name, True)
+                self.cse.update((id(node), (name, False)) for node in nodes[1:])
+                planned.extend(id(node) for node in nodes)
+                self.specialize("cse", f"{code} x{len(nodes)} -> {name}", line)
+            planner = _ChainPlanner()
+        return planned
+
+    def _accumulate_loop(self, node: Node, names: list[str], in_class: bool) -> str:
+        head = []
+        tail = []
+        for name in names:
+            self.temp_count += 1
+            parts = f"_opn_parts_{self.temp_count}"
+            self.accumulators[name] = parts
+            head.append(self.emit(f"{parts} = [{name}]"))
+            tail.append(self.emit(f"{name} = ''.join({parts})"))
+            self.specialize("string-join", f"{name} = {name} + ... -> {parts}.append + join")
+        loop = self._transpile(node, in_class)
+        for name in names:
+            del self.accumulators[name]
+        return "\n".join([*head, loop, *tail])
+
+    def _transpile_error(self, message: str, hint: Optional[str] = None) -> OPNError:
+        return OPNError(
+            message,
+            code="OPN2007",
+            phase="Transpilacion",
+            source_name=self.source_name,
+            source_code=self.source_code,
+            line=self.line,
+            col=1,
+            hint=hint,
+        )
+
+    def _warn(self, line: int, message: str) -> None:
+        self.warnings.append(f"{self.source_name or '<opn>'}:{line}: {message}")
+
+    def _parallel_for(self, node: ParallelFor) -> str:
+        line = self.line
+        if isinstance(node.loop, ForInStmt):
+            var_name, items = node.loop.name, self.expr(node.loop.iterable)
+        else:
+            range_info = self._for_to_range(node.loop)
+            if range_info is None:
+                raise self._transpile_error(
+                    "parallel for requiere un bucle de rango simple o for (x in items)",
+                    hint="Usa la forma: parallel for (var i = a; i < b; i = i + 1) { ... }",
+                )
+            var_name, range_args = range_info
+            items = f"range({range_args})"
+        body = node.loop.body
+        local_names = {
+            child.name
+            for child in walk_scope(body)
+            if isinstance(child, (VarDecl, FunctionDecl, ClassDecl, StructDecl, ForInStmt))
+        }
+        local_names.add(var_name)
+        for child in walk_scope(body):
+            if not isinstance(child, AssignExpr):
+                continue
+            root = child.target
+            while isinstance(root, (MemberExpr, IndexExpr)):
+                root = root.obj
+            if isinstance(root, Identifier) and root.name not in local_names:
+                raise self._transpile_error(
+                    f"parallel for no puede asignar la variable externa '{root.name}'",
+                    hint="Devuelve el resultado con return; parallel for entrega la lista ordenada.",
+                )
+
+        enclosing = set().union(*self.scopes) if self.scopes else set()
+        free = {
+            "self" if child.name == "this" else child.name
+            for child in walk_nodes(body)
+            if isinstance(child, Identifier)
+        }
+        bound = sorted((free & enclosing) - local_names)
+        # Funciones, clases y structs declarados dentro de una funcion no se pueden
+        # serializar hacia otro proceso: ese bucle corre con hilos.
+        local_types = {
+            child.name
+            for root in self.scope_roots
+            if isinstance(root, FunctionDecl)
+            for child in walk_scope(root.body)
+            if isinstance(child, (FunctionDecl, ClassDecl, StructDecl))
+        }
+        unpicklable = [name for name in bound if name in local_types]
+        threads = node.threads or bool(unpicklable)
+        if not node.threads:
+            if unpicklable:
+                self._warn(
+                    line,
+                    f"parallel for usa hilos porque el cuerpo usa '{unpicklable[0]}', declarado "
+                    "dentro de una funcion; declaralo en el nivel superior para usar procesos.",
+                )
+            elif not _fork_available():
+                self._warn(
+                    line,
+                    "parallel for usa hilos en esta plataforma (sin fork); el codigo Python "
+                    "puro no corre en paralelo.",
+                )
+
+        self.lifted_count += 1
+        worker = f"_opn_parallel_{self.lifted_count}"
+        saved_indent = self.indent
+        self.indent = 0
+        lines = []
+        if not self.uses_parallel:
+            self.uses_parallel = True
+            lines.extend(PARALLEL_HELPER)
+        lines.append(f"def {worker}({', '.join([*bound, var_name])}):")
+        self.scopes.append(local_names | set(bound))
+        self.indent = 1
+        lines.append(self.transpile(body))
+        self.scopes.pop()
+        self.indent = saved_indent
+        self.lifted.append("\n".join(lines))
+
+        bound_args = "".join(f"{name}, " for name in bound)
+        chunk = self.expr(node.chunk) if node.chunk is not None else "None"
+        return (
+            f"_opn_parallel_map({worker}, {items}, ({bound_args}), "
+            f"{threads}, {chunk})"
+        )
+
     def _eval_const_binary(self, op: str, left: Any, right: Any) -> Optional[Any]:
         if op in ("&&", "||"):
             return None
@@ -951,6 +2745,7 @@ class Transpiler:
                 start_expr = self.expr(assign.value)
         if not var_name or start_expr is None:
             return None
+        start_node = node.init.expr if isinstance(node.init, VarDecl) else node.init.expr.value
 
         if not isinstance(node.test, BinaryExpr):
             return None
@@ -983,6 +2778,11 @@ class Transpiler:
             return None
 
         step = 1 if node.update.value.op == "+" else -1
+        # range() solo acepta enteros: un limite float o str conocido conserva el while.
+        start_type = inferred_type(start_node)
+        end_type = inferred_type(node.test.right)
+        if start_type not in (None, "int", "bool") or end_type not in (None, "int", "bool"):
+            return None
 
         if node.test.op in ("<", "<=") and step < 0:
             return None
@@ -1002,6 +2802,8 @@ class Transpiler:
             range_args = f"{start_expr}, {stop_expr}"
         else:
             range_args = f"{start_expr}, {stop_expr}, -1"
+        if start_type == "int" and end_type == "int":
+            self.specialize("int-range", f"{var_name} in range({range_args})")
         return var_name, range_args
 
     def _reduce_sum_loop(
@@ -1035,49 +2837,1472 @@ class Transpiler:
         return None
 
 
+def _fork_available() -> bool:
+    import multiprocessing
+
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
 def _cache_key(source: str, source_name: Optional[str] = None) -> tuple[str, str]:
     digest = hashlib.blake2b(source.encode("utf-8"), digest_size=16).hexdigest()
     return digest, source_name or "<opn>"
 
 
-def parse_opn(code: str, source_name: Optional[str] = None) -> Program:
-    lexer = Lexer(code, source_name=source_name)
-    tokens = lexer.tokenize()
-    parser = Parser(tokens, source_name=source_name, source_code=code)
-    return parser.parse()
-
-
-def transpile_opn(code: str, source_name: Optional[str] = None) -> str:
-    key = _cache_key(code, source_name)
-    cached = _TRANSPILE_CACHE.get(key)
-    if cached is not None:
-        return cached
-    ast_root = parse_opn(code, source_name=source_name)
-    transpiler = Transpiler()
-    py_code = transpiler.transpile(ast_root)
-    _TRANSPILE_CACHE.set(key, py_code)
-    return py_code
-
-
-def compile_opn(code: str, source_name: Optional[str] = None) -> Any:
-    key = _cache_key(code, source_name)
-    compiled = _COMPILED_CACHE.get(key)
-    if compiled is not None:
-        return compiled
-    py_code = transpile_opn(code, source_name=source_name)
-    filename = f"<opn:{source_name or '<memory>'}>"
-    compiled = compile(py_code, filename, "exec")
-    _COMPILED_CACHE.set(key, compiled)
-    return compiled
+def _emit_opn_warnings(messages: Iterable[str]) -> None:
+    for message in messages:
+        warnings.warn(message, OPNWarning, stacklevel=3)
 
 
-def compile_opn_file(source_path: str, output_path: str) -> str:
-    with open(source_path, "r", encoding="utf-8-sig") as f:
-        code = f.read()
-    py_code = transpile_opn(code, source_name=source_path)
-    with open(output_path, "w", encoding="utf-8", newline="\n") as f:
-        f.write(py_code + ("\n" if py_code and not py_code.endswith("\n") else ""))
-    return output_path
+def _variant_key(key: tuple[str, str], inline: bool) -> tuple[str, str]:
+    # El codigo sin inlining comparte fuente y nombre, pero no entrada de cache.
+    return key if inline else (key[0] + ":sin-inline", key[1])
+
+
+def _nesting_error(phase: str, source_name: Optional[str], err: BaseException) -> OPNError:
+    return OPNError(
+        "El programa excede la profundidad de anidamiento soportada",
+        code="OPN2009",
+        phase=phase,
+        source_name=source_name,
+        details="".join(traceback.format_exception_only(type(err), err)).strip(),
+        hint="Divide expresiones o bloques muy anidados en variables o funciones auxiliares.",
+    )
+
+
+def parse_opn(code: str, source_name: Optional[str] = None) -> Program:
+    lexer = Lexer(code, source_name=source_name)
+    parser = Parser(lexer.iter_tokens(), source_name=source_name, source_code=code)
+    try:
+        return parser.parse()
+    except RecursionError as err:
+        raise _nesting_error("Sintaxis", source_name, err) from err
+
+
+def _transpile_entry(
+    code: str, source_name: Optional[str], key: Optional[tuple[str, str]], inline: bool
+) -> tuple[str, array.array, tuple[str, ...]]:
+    # La entrada guarda tambien los avisos: una compilacion desde cache los repite.
+    key = _variant_key(key or _cache_key(code, source_name), inline)
+    entry = _TRANSPILE_CACHE.get(key)
+    if entry is None:
+        ast_root = parse_opn(code, source_name=source_name)
+        transpiler = Transpiler(source_name=source_name, inline=inline, source_code=code)
+        try:
+            py_code = transpiler.transpile(ast_root)
+        except RecursionError as err:
+            raise _nesting_error("Transpilacion", source_name, err) from err
+        entry = (py_code, transpiler.line_map, tuple(transpiler.warnings))
+        _TRANSPILE_CACHE.set(key, entry)
+    return entry
+
+
+def transpile_opn_mapped(
+    code: str,
+    source_name: Optional[str] = None,
+    *,
+    key: Optional[tuple[str, str]] = None,
+    inline: bool = True,
+) -> tuple[str, array.array]:
+    py_code, line_map, messages = _transpile_entry(code, source_name, key, inline)
+    _emit_opn_warnings(messages)
+    return py_code, line_map
+
+
+def transpile_opn(
+    code: str, source_name: Optional[str] = None, *, key: Optional[tuple[str, str]] = None
+) -> str:
+    return transpile_opn_mapped(code, source_name, key=key)[0]
+
+
+def compile_opn(
+    code: str,
+    source_name: Optional[str] = None,
+    *,
+    key: Optional[tuple[str, str]] = None,
+    inline: bool = True,
+) -> Any:
+    # La clave se calcula una sola vez y se reutiliza en ambas caches.
+    key = key or _cache_key(code, source_name)
+    entry = _COMPILED_CACHE.get(_variant_key(key, inline))
+    if entry is not None:
+        return _use_compiled(entry)
+    py_code, line_map, messages = _transpile_entry(code, source_name, key, inline)
+    filename = _opn_filename(source_name, _variant_key(key, inline))
+    try:
+        compiled = compile(py_code, filename, "exec", ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+    except (RecursionError, MemoryError) as err:
+        raise _nesting_error("Compilacion", source_name, err) from err
+    except SyntaxError as err:
+        if "too many" not in str(err):
+            raise
+        raise _nesting_error("Compilacion", source_name, err) from err
+    entry = (compiled, line_map, messages)
+    _COMPILED_CACHE.set(_variant_key(key, inline), entry)
+    return _use_compiled(entry)
+
+
+def _use_compiled(entry: tuple[Any, array.array, tuple[str, ...]]) -> Any:
+    _LINE_MAPS.set(entry[0].co_filename, entry[1])
+    _emit_opn_warnings(entry[2])
+    return entry[0]
+
+
+def _module_store_names(tree: ast.Module) -> set[str]:
+    names: set[str] = set()
+    pending: list[ast.AST] = list(tree.body)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            continue
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split(".")[0])
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        pending.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def _wrap_async_entry(py_code: str) -> str:
+    # Python no acepta await de nivel superior en un script: el cuerpo se mueve a
+    # una corrutina que declara global todo nombre de modulo y se lanza con asyncio.run.
+    prelude, _, body = py_code.partition("\n\n")
+    tree = compile(body, "<opn>", "exec", ast.PyCF_ONLY_AST | ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+    lines = [prelude]
+    if "_opn_asyncio" not in prelude:
+        lines.append("import asyncio as _opn_asyncio")
+    lines.extend(["", "", "async def _opn_main():"])
+    names = sorted(_module_store_names(tree))
+    if names:
+        lines.append(f"    global {', '.join(names)}")
+    lines.extend(f"    {line}" if line else line for line in body.splitlines())
+    lines.extend(["", "", "_opn_asyncio.run(_opn_main())"])
+    return "\n".join(lines)
+
+
+def read_opn_source(path: str) -> str:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return f.read()
+
+
+def _file_stat_key(path: str) -> tuple[str, int, int, int]:
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def compile_opn_path(path: str, *, inline: bool = True) -> Any:
+    # Ruta rapida: si el archivo no cambio, basta un stat para llegar al codigo compilado.
+    stat_key = _file_stat_key(path)
+    key = _FILE_KEY_CACHE.get(stat_key)
+    if key is not None:
+        entry = _COMPILED_CACHE.get(_variant_key(key, inline))
+        if entry is not None:
+            return _use_compiled(entry)
+    code = read_opn_source(path)
+    key = _cache_key(code, path)
+    compiled = compile_opn(code, source_name=path, key=key, inline=inline)
+    _FILE_KEY_CACHE.set(stat_key, key)
+    return compiled
+
+
+def _entry_script(py_code: str, compiled: Any) -> str:
+    # Script Python autonomo: el await de nivel superior se envuelve en asyncio.run.
+    if compiled.co_flags & CO_COROUTINE:
+        py_code = _wrap_async_entry(py_code)
+    return py_code + ("\n" if py_code and not py_code.endswith("\n") else "")
+
+
+def transpile_opn_entry(source_path: str) -> str:
+    code = read_opn_source(source_path)
+    key = _cache_key(code, source_path)
+    py_code = transpile_opn(code, source_name=source_path, key=key)
+    return _entry_script(py_code, compile_opn(code, source_name=source_path, key=key))
+
+
+def shake_opn_entry(source_path: str) -> tuple[str, ShakeReport]:
+    code = read_opn_source(source_path)
+    program, report = shake_program(parse_opn(code, source_name=source_path))
+    transpiler = Transpiler(source_name=source_path, source_code=code)
+    try:
+        py_code = transpiler.transpile(program)
+    except RecursionError as err:
+        raise _nesting_error("Transpilacion", source_path, err) from err
+    _emit_opn_warnings(transpiler.warnings)
+    compiled = compile(py_code, f"<opn:{source_path}>", "exec", ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+    return _entry_script(py_code, compiled), report
+
+
+def compile_opn_file(source_path: str, output_path: str) -> str:
+    py_code = transpile_opn_entry(source_path)
+    with open(output_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(py_code)
+    return output_path
+
+
+# Con menos archivos, arrancar procesos cuesta mas que revisarlos en serie.
+CHECK_POOL_MIN_FILES = 8
+
+
+def analyze_opn_source(
+    code: str,
+    source_name: Optional[str] = None,
+    *,
+    specialize: bool = True,
+    tokens: Optional[list[Token]] = None,
+) -> tuple[Optional[Program], list[OPNError]]:
+    # Lexico y sintaxis con recuperacion (todos los errores del archivo); si no hay
+    # ninguno, transpila y compila a bytecode sin ejecutar. El programa parcial se
+    # devuelve aunque haya errores (el servidor de lenguaje lo usa para simbolos).
+    # Si se pasa tokens, recibe los del lexico para no volver a lexear el texto.
+    lexer = Lexer(code, source_name=source_name, recover=True)
+    stream: Iterable[Token] = lexer.iter_tokens()
+    if tokens is not None:
+        tokens.extend(stream)
+        stream = iter(tokens)
+    parser = Parser(
+        stream,
+        source_name=source_name,
+        source_code=code,
+        recover=True,
+        lexer_errors=lexer.errors,
+    )
+    try:
+        program = parser.parse()
+    except RecursionError as err:
+        return None, [_nesting_error("Sintaxis", source_name, err)]
+    errors = sorted([*lexer.errors, *parser.errors], key=lambda err: (err.line or 0, err.col or 0))
+    if errors:
+        return program, errors
+    transpiler = Transpiler(source_name=source_name, specialize=specialize, source_code=code)
+    try:
+        py_code = transpiler.transpile(program)
+        # Los SyntaxWarning de Python se ven al ejecutar; aqui solo cuentan errores.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", SyntaxWarning)
+            compile(py_code, f"<opn:{source_name}>", "exec", ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+    except OPNError as err:
+        return program, [err]
+    except (RecursionError, MemoryError) as err:
+        return program, [_nesting_error("Compilacion", source_name, err)]
+    except SyntaxError as err:
+        line_map = transpiler.line_map
+        lineno = err.lineno or 0
+        return program, [
+            OPNError(
+                err.msg,
+                code="OPN2011",
+                phase="Compilacion",
+                source_name=source_name,
+                source_code=code,
+                line=line_map[lineno - 1] if 0 < lineno <= len(line_map) else None,
+                hint="El codigo Python generado no es valido; revisa nombres reservados de Python.",
+            )
+        ]
+    return program, []
+
+
+def check_opn_source(code: str, source_name: Optional[str] = None) -> list[OPNError]:
+    return analyze_opn_source(code, source_name)[1]
+
+
+def _error_record(err: OPNError) -> dict[str, Any]:
+    return {
+        "code": err.code,
+        "phase": err.phase,
+        "message": err.message,
+        "line": err.line,
+        "col": err.col,
+        "hint": err.hint,
+    }
+
+
+def check_opn_file(path: str) -> dict[str, Any]:
+    try:
+        code = read_opn_source(path)
+    except (OSError, UnicodeDecodeError) as err:
+        errors = [
+            OPNError(
+                "No se pudo leer el archivo .opn",
+                code="OPN4001",
+                phase="CLI",
+                source_name=path,
+                details=str(err),
+            )
+        ]
+    else:
+        errors = check_opn_source(code, source_name=path)
+    return {"file": path, "ok": not errors, "errors": [_error_record(err) for err in errors]}
+
+
+def _collect_opn_files(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            # .venv, .opn_build, .git y __pycache__ no contienen fuentes del proyecto.
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+            files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(".opn"))
+    return files
+
+
+def check_opn_paths(paths: list[str], workers: Optional[int] = None) -> list[dict[str, Any]]:
+    files = _collect_opn_files(paths)
+    if workers == 1 or len(files) < CHECK_POOL_MIN_FILES:
+        return [check_opn_file(path) for path in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunk = max(1, len(files) // ((workers or os.cpu_count() or 1) * 4))
+        return list(pool.map(check_opn_file, files, chunksize=chunk))
+
+
+def _print_check_results(results: list[dict[str, Any]]) -> None:
+    for result in results:
+        for err in result["errors"]:
+            where = result["file"]
+            if err["line"] is not None:
+                where += f":{err['line']}"
+                if err["col"] is not None:
+                    where += f":{err['col']}"
+            print(f"{where}: [{err['code']}] {err['message']}")
+    failed = sum(1 for result in results if not result["ok"])
+    errors = sum(len(result["errors"]) for result in results)
+    print(f"{len(results)} archivos revisados, {failed} con errores ({errors} errores).")
+
+
+# Servidor de lenguaje (opn lsp). Un documento abierto se divide en fragmentos:
+# cada sentencia de nivel superior con sus lineas en blanco y comentarios finales.
+# Tras un '}' de nivel superior, estos tokens siguen la misma sentencia.
+CHUNK_CONTINUATION_TYPES = frozenset(
+    "ELSE SEMICOL DOT COMMA OP COLON LPAREN RPAREN LBRACKET RBRACKET".split()
+)
+# Con llaves sin cerrar, una declaracion en la columna 1 (o cualquier sentencia en la
+# columna 1 tras ';' o '}') abre un fragmento: asi un '{' a medio escribir no obliga a
+# reanalizar el resto del archivo. Se asume que el cuerpo de los bloques va indentado.
+CHUNK_DECLARATION_TYPES = frozenset("FUNCTION FUNC ASYNC CLASS".split())
+LSP_COMPLETION_LIMIT = 200
+LSP_COMPLETION_KINDS = {
+    "method": 2,
+    "function": 3,
+    "field": 5,
+    "variable": 6,
+    "parameter": 6,
+    "class": 7,
+    "module": 9,
+    "keyword": 14,
+    "struct": 22,
+}
+LSP_SYMBOL_KINDS = {
+    "module": 2,
+    "class": 5,
+    "method": 6,
+    "field": 8,
+    "function": 12,
+    "variable": 13,
+    "struct": 23,
+}
+LSP_BUILTIN_NAMES = sorted(name for name in dir(builtins) if not name.startswith("_"))
+WORD_REGEX = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+WORD_END_REGEX = re.compile(r"[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _chunk_starts(tokens: Iterable[Token]) -> list[int]:
+    # Lineas (0-based) donde empieza cada fragmento: la sentencia anterior termino
+    # en ';' o '}' con todos los delimitadores cerrados y la nueva empieza en otra linea.
+    starts = [0]
+    depth = 0
+    prev: Optional[Token] = None
+    for tok in tokens:
+        kind = tok.type
+        if kind == "EOF":
+            break
+        if prev is not None and tok.line > prev.line:
+            if depth == 0:
+                if prev.type == "SEMICOL" or (
+                    prev.type == "RBRACE" and kind not in CHUNK_CONTINUATION_TYPES
+                ):
+                    starts.append(tok.line - 1)
+            elif tok.col == 1 and (
+                kind in CHUNK_DECLARATION_TYPES
+                or (
+                    prev.type in ("SEMICOL", "RBRACE")
+                    and (kind == "ID" or kind in STATEMENT_START_TYPES)
+                )
+            ):
+                starts.append(tok.line - 1)
+                depth = 0
+        if kind in ("LBRACE", "LPAREN", "LBRACKET"):
+            depth += 1
+        elif kind in ("RBRACE", "RPAREN", "RBRACKET") and depth:
+            depth -= 1
+        prev = tok
+    return starts
+
+
+@dataclass(slots=True)
+class OPNSymbol:
+    # Lineas relativas al fragmento (0-based). scope es el rango de lineas de la
+    # funcion donde el nombre es local; None para nombres de nivel superior.
+    name: str
+    kind: str
+    line: int
+    col: int
+    end: int
+    container: Optional[str] = None
+    scope: Optional[tuple[int, int]] = None
+
+
+def _locate_name(lines: list[str], line: int, name: str, col: int = 0) -> tuple[int, int]:
+    # Los nodos solo guardan la linea de la sentencia: el nombre se busca en el texto
+    # como palabra completa, desde col y hasta unas pocas lineas mas abajo.
+    size = len(name)
+    for index in range(line, min(line + 8, len(lines))):
+        text = lines[index]
+        pos = text.find(name, col if index == line else 0)
+        while pos >= 0:
+            before = text[pos - 1] if pos else " "
+            after = text[pos + size] if pos + size < len(text) else " "
+            if not (before.isalnum() or before == "_" or after.isalnum() or after == "_"):
+                return index, pos
+            pos = text.find(name, pos + 1)
+    return line, 0
+
+
+def _collect_symbols(program: Program, lines: list[str]) -> list[OPNSymbol]:
+    symbols: list[OPNSymbol] = []
+    seen_fields: set[tuple[str, str]] = set()
+
+    def add(
+        name: str,
+        kind: str,
+        at: tuple[int, int],
+        end: int,
+        container: Optional[str] = None,
+        scope: Optional[tuple[int, int]] = None,
+    ) -> tuple[int, int]:
+        pos = _locate_name(lines, at[0], name, at[1])
+        symbols.append(OPNSymbol(name, kind, pos[0], pos[1], end, container, scope))
+        return pos[0], pos[1] + len(name)
+
+    def loop(node: Node, line: int, end: int, cls: Optional[str], scope: Optional[tuple[int, int]]):
+        if isinstance(node, ForInStmt):
+            add(node.name, "variable", (line, 0), end, scope=scope)
+        elif isinstance(node, ForStmt) and isinstance(node.init, VarDecl):
+            add(node.init.name, "variable", (line, 0), end, scope=scope)
+        visit(node.body.body, end, cls, scope, False)
+
+    def visit(
+        body: list[Node],
+        end: int,
+        cls: Optional[str],
+        scope: Optional[tuple[int, int]],
+        class_body: bool,
+    ) -> None:
+        for index, stmt in enumerate(body):
+            line = stmt.line - 1
+            stmt_end = max(line, body[index + 1].line - 2) if index + 1 < len(body) else end
+            if isinstance(stmt, FunctionDecl):
+                method = class_body and cls is not None
+                after = add(
+                    stmt.name,
+                    "method" if method else "function",
+                    (line, 0),
+                    stmt_end,
+                    container=cls if method else None,
+                    scope=scope,
+                )
+                inner = (line, stmt_end)
+                for param in stmt.params:
+                    after = add(param, "parameter", after, stmt_end, scope=inner)
+                visit(stmt.body.body, stmt_end, cls, inner, False)
+            elif isinstance(stmt, ClassDecl):
+                add(stmt.name, "class", (line, 0), stmt_end, scope=scope)
+                visit(stmt.body.body, stmt_end, stmt.name, scope, True)
+            elif isinstance(stmt, StructDecl):
+                after = add(stmt.name, "struct", (line, 0), stmt_end, scope=scope)
+                for name in stmt.fields:
+                    after = add(name, "field", after, stmt_end, container=stmt.name)
+            elif isinstance(stmt, VarDecl):
+                if class_body and cls is not None:
+                    add(stmt.name, "field", (line, 0), stmt_end, container=cls)
+                else:
+                    add(stmt.name, "variable", (line, 0), stmt_end, scope=scope)
+            elif isinstance(stmt, (ForInStmt, ForStmt)):
+                loop(stmt, line, stmt_end, cls, scope)
+            elif isinstance(stmt, ParallelFor):
+                loop(stmt.loop, line, stmt_end, cls, scope)
+            elif isinstance(stmt, WhileStmt):
+                visit(stmt.body.body, stmt_end, cls, scope, False)
+            elif isinstance(stmt, IfStmt):
+                visit(stmt.cons.body, stmt_end, cls, scope, False)
+                if stmt.alt is not None:
+                    visit(stmt.alt.body, stmt_end, cls, scope, False)
+            elif isinstance(stmt, Block):
+                visit(stmt.body, stmt_end, cls, scope, class_body)
+            elif isinstance(stmt, ImportStmt):
+                name = stmt.alias or stmt.module.split(".")[0]
+                add(name, "module", (line, 0), stmt_end, scope=scope)
+            elif isinstance(stmt, FromImportStmt):
+                for name, alias in stmt.names:
+                    if name != "*":
+                        add(alias or name, "module", (line, 0), stmt_end, scope=scope)
+            elif (
+                isinstance(stmt, ExprStmt)
+                and cls is not None
+                and isinstance(stmt.expr, AssignExpr)
+                and isinstance(stmt.expr.target, MemberExpr)
+                and isinstance(stmt.expr.target.obj, Identifier)
+                and stmt.expr.target.obj.name == "this"
+                and (cls, stmt.expr.target.prop) not in seen_fields
+            ):
+                seen_fields.add((cls, stmt.expr.target.prop))
+                prop = stmt.expr.target.prop
+                add(prop, "field", (line, 0), stmt_end, container=cls)
+
+    visit(program.body, len(lines) - 1, None, None, False)
+    return symbols
+
+
+def _collect_references(program: Program, lines: list[str]) -> list[tuple[str, str, int, int]]:
+    # Usos (nombre, "name" o "member", linea, col) en orden de fuente; lineas 0-based.
+    # Los nombres declarados se saltan en el texto para no contarlos como uso.
+    refs: list[tuple[str, str, int, int]] = []
+    cursor: dict[tuple[str, int], tuple[int, int]] = {}
+
+    def locate(name: str, line: int) -> tuple[int, int]:
+        at = cursor.get((name, line), (line, 0))
+        pos = _locate_name(lines, at[0], name, at[1])
+        cursor[(name, line)] = (pos[0], pos[1] + len(name))
+        return pos
+
+    # Un str en la pila es la propiedad de un MemberExpr: sale despues del objeto.
+    pending: list[tuple[Any, int]] = [(program, 0)]
+    while pending:
+        node, line = pending.pop()
+        if isinstance(node, str):
+            refs.append((node, "member", *locate(node, line)))
+            continue
+        line = node.line - 1 if hasattr(node, "line") else line
+        if isinstance(node, Identifier):
+            if node.name != "this":
+                refs.append((node.name, "name", *locate(node.name, line)))
+        elif isinstance(node, MemberExpr):
+            pending.append((node.prop, line))
+        elif isinstance(node, FunctionDecl):
+            for name in (node.name, *node.params):
+                locate(name, line)
+        elif isinstance(node, (VarDecl, ForInStmt, ClassDecl, StructDecl)):
+            locate(node.name, line)
+            for name in getattr(node, "fields", ()):
+                locate(name, line)
+        pending.extend((child, line) for child in reversed(list(iter_child_nodes(node))))
+    return refs
+
+
+@dataclass(slots=True)
+class _DocumentChunk:
+    start: int
+    text: str
+    # Primera linea (relativa) con un token; las anteriores son blancos o comentarios.
+    head: int
+    errors: list[OPNError]
+    symbols: list[OPNSymbol]
+    refs: list[tuple[str, str, int, int]]
+
+
+def _chunk_head(lines: list[str]) -> int:
+    return next(
+        (index for index, line in enumerate(lines) if LINE_COMMENT_REGEX.sub("", line).strip()),
+        len(lines),
+    )
+
+
+def _is_global_symbol(symbol: OPNSymbol) -> bool:
+    return symbol.scope is None and symbol.container is None
+
+
+class OPNDocument:
+    # Texto de un archivo abierto en el editor. Cada fragmento guarda sus errores y
+    # simbolos con lineas relativas: una edicion reanaliza solo los fragmentos que
+    # toca y el resto solo se desplaza.
+    def __init__(self, uri: str, text: str, source_name: Optional[str] = None):
+        self.uri = uri
+        self.source_name = source_name or uri
+        self.lines = text.split("\n")
+        self.chunks: list[_DocumentChunk] = []
+        self.starts: list[int] = []
+        # Indices nombre -> [(fragmento, simbolo)] de nivel superior y de miembros.
+        self.globals: dict[str, list[tuple[_DocumentChunk, OPNSymbol]]] = {}
+        self.members: dict[str, list[tuple[_DocumentChunk, OPNSymbol]]] = {}
+        self._open()
+
+    def apply_change(self, change: dict[str, Any]) -> None:
+        if "range" not in change:
+            self.lines = change["text"].split("\n")
+            self.chunks, self.starts = [], []
+            self.globals.clear()
+            self.members.clear()
+            self._open()
+            return
+        lines = self.lines
+        start, end = change["range"]["start"], change["range"]["end"]
+        l0 = min(start["line"], len(lines) - 1)
+        l1 = min(end["line"], len(lines) - 1)
+        first = self.chunk_index(l0)
+        chunk = self.chunks[first]
+        # Editar el primer token de un fragmento puede unirlo con el anterior (else).
+        if first and l0 - chunk.start <= chunk.head:
+            first -= 1
+        last = self.chunk_index(l1)
+        head, tail = lines[l0][: start["character"]], lines[l1][end["character"] :]
+        new_lines = (head + change["text"] + tail).split("\n")
+        lines[l0 : l1 + 1] = new_lines
+        delta = len(new_lines) - (l1 - l0 + 1)
+        if delta:
+            for index in range(last + 1, len(self.chunks)):
+                self.chunks[index].start += delta
+                self.starts[index] += delta
+        self._relex(first, last)
+
+    def chunk_index(self, line: int) -> int:
+        return max(0, bisect.bisect_right(self.starts, line) - 1)
+
+    def _open(self) -> None:
+        # Los tokens y el arbol del archivo completo son millones de objetos sin ciclos:
+        # el recolector los recorreria una y otra vez sin liberar nada (~40% del tiempo).
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._open_whole()
+        finally:
+            if enabled:
+                gc.enable()
+
+    def _open_whole(self) -> None:
+        # Apertura: un solo lexico, parse y transpile del archivo completo, y sus
+        # simbolos y usos se reparten por fragmento con lineas relativas. Un fragmento
+        # cuyos limites no coinciden con sentencias de nivel superior se analiza solo;
+        # un archivo con errores se analiza fragmento a fragmento, como al editar.
+        text = "\n".join(self.lines)
+        tokens: list[Token] = []
+        program, errors = analyze_opn_source(text, self.source_name, specialize=False, tokens=tokens)
+        if program is None or errors:
+            self._relex(0, -1)
+            return
+        starts = _chunk_starts(tokens)
+        del tokens
+        statements = {stmt.line - 1 for stmt in program.body}
+        clean = [index == 0 or start in statements for index, start in enumerate(starts)]
+        clean.append(True)
+        symbols: list[list[OPNSymbol]] = [[] for _ in starts]
+        refs: list[list[tuple[str, str, int, int]]] = [[] for _ in starts]
+        for symbol in _collect_symbols(program, self.lines):
+            index = bisect.bisect_right(starts, symbol.line) - 1
+            start = starts[index]
+            symbol.line -= start
+            symbol.end -= start
+            if symbol.scope is not None:
+                symbol.scope = (symbol.scope[0] - start, symbol.scope[1] - start)
+            symbols[index].append(symbol)
+        for name, kind, line, col in _collect_references(program, self.lines):
+            index = bisect.bisect_right(starts, line) - 1
+            refs[index].append((name, kind, line - starts[index], col))
+        del program
+        for index, (a, b) in enumerate(zip(starts, [*starts[1:], len(self.lines)])):
+            lines = self.lines[a:b]
+            if clean[index] and clean[index + 1]:
+                chunk = _DocumentChunk(a, "\n".join(lines), _chunk_head(lines), [], symbols[index], refs[index])
+            else:
+                chunk = self._analyze("\n".join(lines))
+                chunk.start = a
+            self.chunks.append(chunk)
+            self._index(chunk)
+        self.starts = list(starts)
+
+    def _relex(self, first: int, last: int) -> None:
+        # Relexea desde el fragmento first hasta last mas uno de control. Si el inicio
+        # del fragmento de control sigue siendo un limite, lo que viene despues no
+        # cambio; si no, la region crece (al doble) y se vuelve a intentar.
+        chunks = self.chunks
+        start = chunks[first].start if chunks else 0
+        while True:
+            look = last + 1
+            end = chunks[look + 1].start if look + 1 < len(chunks) else len(self.lines)
+            region = self.lines[start:end]
+            starts = _chunk_starts(Lexer("\n".join(region), recover=True).iter_tokens())
+            if look >= len(chunks):
+                stop, cut = len(chunks), len(region)
+                break
+            cut = chunks[look].start - start
+            position = bisect.bisect_left(starts, cut)
+            if position < len(starts) and starts[position] == cut:
+                stop, starts = look, starts[:position]
+                break
+            last = min(len(chunks) - 1, last + max(1, last - first + 1))
+
+        replaced = chunks[first:stop]
+        for chunk in replaced:
+            self._unindex(chunk)
+        reusable = {chunk.text: chunk for chunk in replaced}
+        fresh = []
+        for a, b in zip(starts, [*starts[1:], cut]):
+            text = "\n".join(region[a:b])
+            chunk = reusable.pop(text, None) or self._analyze(text)
+            chunk.start = start + a
+            fresh.append(chunk)
+            self._index(chunk)
+        chunks[first:stop] = fresh
+        self.starts[first:stop] = [chunk.start for chunk in fresh]
+
+    def _analyze(self, text: str) -> _DocumentChunk:
+        # Sin especializar: el servidor solo necesita errores, no codigo optimizado.
+        program, errors = analyze_opn_source(text, self.source_name, specialize=False)
+        lines = text.split("\n")
+        head = _chunk_head(lines)
+        if program is None:
+            return _DocumentChunk(0, text, head, errors, [], [])
+        symbols = _collect_symbols(program, lines)
+        return _DocumentChunk(0, text, head, errors, symbols, _collect_references(program, lines))
+
+    def _index(self, chunk: _DocumentChunk) -> None:
+        for symbol in chunk.symbols:
+            if _is_global_symbol(symbol):
+                self.globals.setdefault(symbol.name, []).append((chunk, symbol))
+            elif symbol.kind in ("method", "field"):
+                self.members.setdefault(symbol.name, []).append((chunk, symbol))
+
+    def _unindex(self, chunk: _DocumentChunk) -> None:
+        for symbol in chunk.symbols:
+            if _is_global_symbol(symbol):
+                index = self.globals
+            elif symbol.kind in ("method", "field"):
+                index = self.members
+            else:
+                continue
+            entries = [entry for entry in index.get(symbol.name, ()) if entry[0] is not chunk]
+            if entries:
+                index[symbol.name] = entries
+            else:
+                index.pop(symbol.name, None)
+
+    def locals_at(self, line: int) -> tuple[_DocumentChunk, list[OPNSymbol]]:
+        # Simbolos locales visibles en la linea, del ambito mas interno al externo.
+        chunk = self.chunks[self.chunk_index(line)]
+        rel = line - chunk.start
+        visible = [
+            symbol
+            for symbol in chunk.symbols
+            if symbol.scope is not None and symbol.scope[0] <= rel <= symbol.scope[1]
+        ]
+        visible.sort(key=lambda symbol: (-symbol.scope[0], symbol.line > rel, -symbol.line))
+        return chunk, visible
+
+    def enclosing_class(self, line: int) -> Optional[str]:
+        chunk = self.chunks[self.chunk_index(line)]
+        rel = line - chunk.start
+        classes = [
+            symbol
+            for symbol in chunk.symbols
+            if symbol.kind == "class" and symbol.line <= rel <= symbol.end
+        ]
+        return max(classes, key=lambda symbol: symbol.line).name if classes else None
+
+    def diagnostics(self) -> list[dict[str, Any]]:
+        result = []
+        for chunk in self.chunks:
+            for err in chunk.errors:
+                line = chunk.start + (err.line - 1 if err.line else chunk.head)
+                line = min(max(line, 0), len(self.lines) - 1)
+                col = err.col - 1 if err.col else 0
+                match = WORD_REGEX.match(self.lines[line], col)
+                end = match.end() if match else col + 1
+                message = err.message if not err.hint else f"{err.message}\n{err.hint}"
+                result.append(
+                    {
+                        "range": _lsp_range(line, col, line, end),
+                        "severity": 1,
+                        "code": err.code,
+                        "source": "opn",
+                        "message": message,
+                    }
+                )
+        return result
+
+
+def _lsp_range(line: int, col: int, end_line: int, end_col: int) -> dict[str, Any]:
+    return {
+        "start": {"line": line, "character": col},
+        "end": {"line": end_line, "character": end_col},
+    }
+
+
+def _symbol_location(uri: str, chunk: _DocumentChunk, symbol: OPNSymbol) -> dict[str, Any]:
+    line = chunk.start + symbol.line
+    return {"uri": uri, "range": _lsp_range(line, symbol.col, line, symbol.col + len(symbol.name))}
+
+
+def _member_receiver(text: str, start: int) -> Optional[str]:
+    # Para obj.nombre devuelve "obj" ("" si no es un identificador); None sin punto.
+    prefix = text[:start].rstrip()
+    if not prefix.endswith("."):
+        return None
+    match = WORD_END_REGEX.search(prefix[:-1].rstrip())
+    return match.group() if match else ""
+
+
+def _uri_to_path(uri: str) -> str:
+    parsed = urlparse(uri)
+    return unquote(parsed.path) if parsed.scheme == "file" else uri
+
+
+def _path_to_uri(path: str) -> str:
+    return "file://" + quote(os.path.abspath(path).replace(os.sep, "/"))
+
+
+def _index_location(index: "OPNIndex", row: dict[str, Any], name: str) -> dict[str, Any]:
+    uri = _path_to_uri(os.path.join(index.root, row["file"]))
+    line, col = row["line"] - 1, row["col"] - 1
+    return {"uri": uri, "range": _lsp_range(line, col, line, col + len(name))}
+
+
+class OPNLanguageServer:
+    # Las posiciones se cuentan en caracteres: coincide con UTF-16 salvo fuera del BMP.
+    # Si el proyecto tiene indice (opn index), responde tambien por archivos no abiertos.
+    def __init__(self) -> None:
+        self.documents: dict[str, OPNDocument] = {}
+        self.shutdown_requested = False
+        self.index: Optional[OPNIndex] = None
+
+    def handle(self, message: dict[str, Any]) -> list[dict[str, Any]]:
+        method = message.get("method")
+        params = message.get("params") or {}
+        if "id" not in message:
+            return self.notify(method, params)
+        handler = {
+            "initialize": self.initialize,
+            "shutdown": self.shutdown,
+            "textDocument/definition": self.definition,
+            "textDocument/references": self.references,
+            "textDocument/completion": self.completion,
+            "textDocument/documentSymbol": self.document_symbols,
+        }.get(method)
+        if handler is None:
+            error = {"code": -32601, "message": f"Metodo no soportado: {method}"}
+            return [{"jsonrpc": "2.0", "id": message["id"], "error": error}]
+        try:
+            result = handler(params)
+        except Exception as exc:  # un fallo en una peticion no debe tumbar el servidor
+            error = {"code": -32603, "message": f"{type(exc).__name__}: {exc}"}
+            return [{"jsonrpc": "2.0", "id": message["id"], "error": error}]
+        return [{"jsonrpc": "2.0", "id": message["id"], "result": result}]
+
+    def notify(self, method: Optional[str], params: dict[str, Any]) -> list[dict[str, Any]]:
+        if method == "textDocument/didOpen":
+            item = params["textDocument"]
+            uri = item["uri"]
+            self.documents[uri] = OPNDocument(uri, item["text"], _uri_to_path(uri))
+            return [self.publish(uri)]
+        if method == "textDocument/didChange":
+            uri = params["textDocument"]["uri"]
+            doc = self.documents.get(uri)
+            if doc is None:
+                return []
+            for change in params["contentChanges"]:
+                doc.apply_change(change)
+            return [self.publish(uri)]
+        if method == "textDocument/didSave":
+            if self.index is not None:
+                self.index.update_file(_uri_to_path(params["textDocument"]["uri"]))
+            return []
+        if method == "textDocument/didClose":
+            uri = params["textDocument"]["uri"]
+            self.documents.pop(uri, None)
+            return [self.publish(uri)]
+        return []
+
+    def publish(self, uri: str) -> dict[str, Any]:
+        doc = self.documents.get(uri)
+        return {
+            "jsonrpc": "2.0",
+            "method": "textDocument/publishDiagnostics",
+            "params": {"uri": uri, "diagnostics": doc.diagnostics() if doc else []},
+        }
+
+    def initialize(self, params: dict[str, Any]) -> dict[str, Any]:
+        root = params.get("rootUri")
+        root = _uri_to_path(root) if root else params.get("rootPath") or os.getcwd()
+        index_path = os.path.join(root, DEFAULT_INDEX_FILE)
+        if os.path.isfile(index_path):
+            self.index = OPNIndex(index_path)
+            self.index.update()
+        return {
+            "capabilities": {
+                "textDocumentSync": {
+                    "openClose": True,
+                    "change": 2,
+                    "save": {"includeText": False},
+                },
+                "definitionProvider": True,
+                "referencesProvider": True,
+                "completionProvider": {"triggerCharacters": ["."]},
+                "documentSymbolProvider": True,
+            },
+            "serverInfo": {"name": "opn", "version": RUNTIME_VERSION},
+        }
+
+    def shutdown(self, params: dict[str, Any]) -> None:
+        self.shutdown_requested = True
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+    def _ordered_documents(self, uri: str) -> list[OPNDocument]:
+        doc = self.documents[uri]
+        return [doc, *(other for other in self.documents.values() if other is not doc)]
+
+    def _word_at(
+        self, params: dict[str, Any]
+    ) -> Optional[tuple[OPNDocument, int, str, Optional[str]]]:
+        # (documento, linea, nombre, receptor) bajo el cursor; receptor como en _member_receiver.
+        doc = self.documents[params["textDocument"]["uri"]]
+        line, col = params["position"]["line"], params["position"]["character"]
+        if line >= len(doc.lines):
+            return None
+        text = doc.lines[line]
+        word = next(
+            (match for match in WORD_REGEX.finditer(text) if match.start() <= col <= match.end()),
+            None,
+        )
+        if word is None:
+            return None
+        return doc, line, word.group(), _member_receiver(text, word.start())
+
+    def _indexed_elsewhere(self, rows: list[dict[str, Any]], name: str) -> list[dict[str, Any]]:
+        # Filas del indice de archivos no abiertos: los abiertos se responden en vivo.
+        if self.index is None:
+            return []
+        locations = [_index_location(self.index, row, name) for row in rows]
+        return [location for location in locations if location["uri"] not in self.documents]
+
+    def definition(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        found = self._word_at(params)
+        if found is None:
+            return []
+        doc, line, name, receiver = found
+        result = self._open_definitions(doc, line, name, receiver)
+        if not result and self.index is not None:
+            result = self._indexed_elsewhere(self.index.definitions(name), name)
+        return result
+
+    def _open_definitions(
+        self, doc: OPNDocument, line: int, name: str, receiver: Optional[str]
+    ) -> list[dict[str, Any]]:
+        uri = doc.uri
+        if receiver is not None:
+            if receiver == "this":
+                cls = doc.enclosing_class(line)
+                own = [
+                    _symbol_location(uri, chunk, symbol)
+                    for chunk, symbol in doc.members.get(name, ())
+                    if symbol.container == cls
+                ]
+                if own:
+                    return own
+            return [
+                _symbol_location(other.uri, chunk, symbol)
+                for other in self._ordered_documents(uri)
+                for chunk, symbol in other.members.get(name, ())
+            ]
+        chunk, visible = doc.locals_at(line)
+        for symbol in visible:
+            if symbol.name == name:
+                return [_symbol_location(uri, chunk, symbol)]
+        return [
+            _symbol_location(other.uri, chunk, symbol)
+            for other in self._ordered_documents(uri)
+            for chunk, symbol in other.globals.get(name, ())
+        ]
+
+    def references(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        found = self._word_at(params)
+        if found is None:
+            return []
+        doc, line, name, receiver = found
+        kind = "name" if receiver is None else "member"
+        result = []
+        if params.get("context", {}).get("includeDeclaration"):
+            result.extend(self._open_definitions(doc, line, name, receiver))
+        for other in self.documents.values():
+            for chunk in other.chunks:
+                for ref_name, ref_kind, ref_line, ref_col in chunk.refs:
+                    if ref_name == name and ref_kind == kind:
+                        start = chunk.start + ref_line
+                        result.append(
+                            {
+                                "uri": other.uri,
+                                "range": _lsp_range(start, ref_col, start, ref_col + len(name)),
+                            }
+                        )
+        if self.index is not None:
+            rows = [row for row in self.index.references(name) if row["kind"] == kind]
+            if params.get("context", {}).get("includeDeclaration"):
+                rows = self.index.definitions(name) + rows
+            result.extend(self._indexed_elsewhere(rows, name))
+        return result
+
+    def completion(self, params: dict[str, Any]) -> dict[str, Any]:
+        uri = params["textDocument"]["uri"]
+        doc = self.documents[uri]
+        line, col = params["position"]["line"], params["position"]["character"]
+        text = doc.lines[line] if line < len(doc.lines) else ""
+        match = WORD_END_REGEX.search(text[:col])
+        prefix = match.group() if match else ""
+        receiver = _member_receiver(text, col - len(prefix))
+        found: dict[str, str] = {}
+        if receiver is not None:
+            cls = doc.enclosing_class(line) if receiver == "this" else None
+            for other in self._ordered_documents(uri):
+                for name, entries in other.members.items():
+                    if name.startswith(prefix) and name not in found:
+                        if cls is None or any(symbol.container == cls for _, symbol in entries):
+                            found[name] = entries[0][1].kind
+        else:
+            for symbol in doc.locals_at(line)[1]:
+                if symbol.name.startswith(prefix):
+                    found.setdefault(symbol.name, symbol.kind)
+            for other in self._ordered_documents(uri):
+                for name, entries in other.globals.items():
+                    if name.startswith(prefix) and name not in found:
+                        found[name] = entries[0][1].kind
+            for name in sorted(KEYWORDS):
+                if name.startswith(prefix):
+                    found.setdefault(name, "keyword")
+            for name in LSP_BUILTIN_NAMES:
+                if name.startswith(prefix):
+                    found.setdefault(name, "function")
+        items = [
+            {"label": name, "kind": LSP_COMPLETION_KINDS[kind]}
+            for name, kind in itertools.islice(found.items(), LSP_COMPLETION_LIMIT)
+        ]
+        return {"isIncomplete": len(found) > LSP_COMPLETION_LIMIT, "items": items}
+
+    def document_symbols(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        uri = params["textDocument"]["uri"]
+        doc = self.documents[uri]
+        result = []
+        for chunk in doc.chunks:
+            for symbol in chunk.symbols:
+                if symbol.scope is not None or symbol.kind not in LSP_SYMBOL_KINDS:
+                    continue
+                entry = {
+                    "name": symbol.name,
+                    "kind": LSP_SYMBOL_KINDS[symbol.kind],
+                    "location": _symbol_location(uri, chunk, symbol),
+                }
+                if symbol.container:
+                    entry["containerName"] = symbol.container
+                result.append(entry)
+        return result
+
+
+def _read_lsp_message(stream: Any) -> Optional[dict[str, Any]]:
+    length = None
+    while True:
+        header = stream.readline()
+        if not header:
+            return None
+        header = header.strip()
+        if not header:
+            break
+        name, _, value = header.decode("ascii").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    if length is None:
+        return {}
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def _write_lsp_message(stream: Any, message: dict[str, Any]) -> None:
+    body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    stream.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    stream.flush()
+
+
+def serve_lsp(stdin: Any, stdout: Any) -> int:
+    # JSON-RPC sobre stdio con cabeceras Content-Length; stdout es solo del protocolo.
+    server = OPNLanguageServer()
+    while True:
+        message = _read_lsp_message(stdin)
+        if message is None:
+            return 1
+        if message.get("method") == "exit":
+            return 0 if server.shutdown_requested else 1
+        for reply in server.handle(message):
+            _write_lsp_message(stdout, reply)
+
+
+# Indice de simbolos del proyecto (opn index): declaraciones, usos e imports de cada
+# .opn en SQLite. Un archivo se reanaliza solo si cambia su hash de contenido.
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    errors INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    file_id INTEGER NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL,
+    line INTEGER NOT NULL, col INTEGER NOT NULL, container TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (
+    file_id INTEGER NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL,
+    line INTEGER NOT NULL, col INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS imports (
+    file_id INTEGER NOT NULL, module TEXT NOT NULL, name TEXT, alias TEXT,
+    line INTEGER NOT NULL, col INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file_id);
+CREATE INDEX IF NOT EXISTS refs_name ON refs (name);
+CREATE INDEX IF NOT EXISTS refs_file ON refs (file_id);
+CREATE INDEX IF NOT EXISTS imports_module ON imports (module);
+CREATE INDEX IF NOT EXISTS imports_file ON imports (file_id);
+"""
+# Sube con cualquier cambio de tablas o de lo que se extrae: el indice se regenera.
+INDEX_SCHEMA_VERSION = "1"
+
+
+def _content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def index_opn_file(path: str) -> dict[str, Any]:
+    # Filas del indice para un archivo (se ejecuta en procesos del pool): lineas y
+    # columnas 1-based. Con errores de sintaxis se indexa el programa recuperado.
+    # El stat se toma antes de leer: si el archivo cambia entre ambos, el proximo
+    # update ve otro tamano o mtime y lo vuelve a indexar.
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    entry: dict[str, Any] = {
+        "path": path,
+        "hash": _content_hash(data),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "errors": 0,
+        "symbols": [],
+        "refs": [],
+        "imports": [],
+    }
+    try:
+        code = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Igual que opn check (OPN4001): el archivo queda registrado con error y sin simbolos.
+        entry["errors"] = 1
+        return entry
+    lexer = Lexer(code, source_name=path, recover=True)
+    parser = Parser(
+        lexer.iter_tokens(), source_name=path, source_code=code, recover=True, lexer_errors=lexer.errors
+    )
+    try:
+        program = parser.parse()
+    except RecursionError:
+        program = Program([])
+    lines = code.split("\n")
+    imports = []
+    for node in walk_nodes(program):
+        if isinstance(node, (ImportStmt, FromImportStmt)):
+            line, col = _locate_name(lines, node.line - 1, node.module.split(".")[0])
+            if isinstance(node, ImportStmt):
+                imports.append((node.module, None, node.alias, line + 1, col + 1))
+            else:
+                imports.extend(
+                    (node.module, name, alias, line + 1, col + 1) for name, alias in node.names
+                )
+    entry["errors"] = len(lexer.errors) + len(parser.errors)
+    entry["symbols"] = [
+        (symbol.name, symbol.kind, symbol.line + 1, symbol.col + 1, symbol.container)
+        for symbol in _collect_symbols(program, lines)
+        if symbol.scope is None
+    ]
+    entry["refs"] = [
+        (name, kind, line + 1, col + 1)
+        for name, kind, line, col in _collect_references(program, lines)
+    ]
+    entry["imports"] = imports
+    return entry
+
+
+class OPNIndex:
+    # Rutas guardadas relativas a la carpeta del indice; las consultas devuelven
+    # diccionarios {"file", "line", "col", ...} con posiciones 1-based.
+    def __init__(self, path: str = DEFAULT_INDEX_FILE):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+
+    def _migrate(self) -> None:
+        self.db.executescript(INDEX_SCHEMA)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is not None and row["value"] == INDEX_SCHEMA_VERSION:
+            return
+        with self.db:
+            for table in ("files", "symbols", "refs", "imports"):
+                self.db.execute(f"DELETE FROM {table}")
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (INDEX_SCHEMA_VERSION,)
+            )
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "OPNIndex":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def relative(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def roots(self) -> list[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'roots'").fetchone()
+        return json.loads(row["value"]) if row else ["."]
+
+    def update(
+        self, paths: Optional[list[str]] = None, workers: Optional[int] = None
+    ) -> dict[str, int]:
+        # Un stat basta para los archivos sin cambios; si cambia tamano o mtime se
+        # compara el hash y solo un contenido distinto se vuelve a parsear.
+        if paths:
+            roots = [self.relative(path) for path in paths]
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('roots', ?)", (json.dumps(roots),)
+                )
+        else:
+            roots = self.roots()
+        known = {
+            row["path"]: row
+            for row in self.db.execute("SELECT id, path, hash, size, mtime_ns FROM files")
+        }
+        current = {
+            self.relative(path): path
+            for path in _collect_opn_files([os.path.join(self.root, root) for root in roots])
+            if os.path.isfile(path)
+        }
+        touched: list[tuple[str, int, int]] = []
+        changed: list[str] = []
+        for rel, path in current.items():
+            st = os.stat(path)
+            row = known.get(rel)
+            if row is not None and (row["size"], row["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                continue
+            if row is not None:
+                with open(path, "rb") as f:
+                    if _content_hash(f.read()) == row["hash"]:
+                        touched.append((rel, st.st_size, st.st_mtime_ns))
+                        continue
+            changed.append(path)
+        removed = [row["id"] for rel, row in known.items() if rel not in current]
+
+        if workers == 1 or len(changed) < CHECK_POOL_MIN_FILES:
+            entries = [index_opn_file(path) for path in changed]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunk = max(1, len(changed) // ((workers or os.cpu_count() or 1) * 4))
+                entries = list(pool.map(index_opn_file, changed, chunksize=chunk))
+        with self.db:
+            for rel, size, mtime_ns in touched:
+                self.db.execute(
+                    "UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?", (size, mtime_ns, rel)
+                )
+            self._drop(removed)
+            for entry in entries:
+                self._store(entry)
+        return {
+            "files": len(current),
+            "indexed": len(entries),
+            "unchanged": len(current) - len(entries),
+            "removed": len(removed),
+        }
+
+    def update_file(self, path: str) -> None:
+        if os.path.isfile(path):
+            with self.db:
+                self._store(index_opn_file(path))
+
+    def _drop(self, file_ids: list[int]) -> None:
+        for table in ("symbols", "refs", "imports"):
+            self.db.executemany(
+                f"DELETE FROM {table} WHERE file_id = ?", [(file_id,) for file_id in file_ids]
+            )
+        self.db.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id in file_ids])
+
+    def _store(self, entry: dict[str, Any]) -> None:
+        rel = self.relative(entry["path"])
+        row = self.db.execute("SELECT id FROM files WHERE path = ?", (rel,)).fetchone()
+        if row is not None:
+            self._drop([row["id"]])
+        file_id = self.db.execute(
+            "INSERT INTO files (path, hash, size, mtime_ns, errors) VALUES (?, ?, ?, ?, ?)",
+            (rel, entry["hash"], entry["size"], entry["mtime_ns"], entry["errors"]),
+        ).lastrowid
+        self.db.executemany(
+            "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)",
+            [(file_id, *symbol) for symbol in entry["symbols"]],
+        )
+        self.db.executemany(
+            "INSERT INTO refs VALUES (?, ?, ?, ?, ?)", [(file_id, *ref) for ref in entry["refs"]]
+        )
+        self.db.executemany(
+            "INSERT INTO imports VALUES (?, ?, ?, ?, ?, ?)",
+            [(file_id, *item) for item in entry["imports"]],
+        )
+
+    def _query(self, sql: str, params: tuple[Any, ...]) -> list[dict[str, Any]]:
+        return [dict(row) for row in self.db.execute(sql, params)]
+
+    def definitions(self, name: str) -> list[dict[str, Any]]:
+        return self._query(
+            "SELECT f.path AS file, s.line, s.col, s.kind, s.container FROM symbols s "
+            "JOIN files f ON f.id = s.file_id WHERE s.name = ? ORDER BY f.path, s.line",
+            (name,),
+        )
+
+    def references(self, name: str) -> list[dict[str, Any]]:
+        return self._query(
+            "SELECT f.path AS file, r.line, r.col, r.kind FROM refs r "
+            "JOIN files f ON f.id = r.file_id WHERE r.name = ? ORDER BY f.path, r.line, r.col",
+            (name,),
+        )
+
+    def importers(self, module: str) -> list[dict[str, Any]]:
+        return self._query(
+            "SELECT f.path AS file, i.line, i.col, i.module, i.name, i.alias FROM imports i "
+            "JOIN files f ON f.id = i.file_id WHERE i.module = ? OR i.module LIKE ? ESCAPE '\\' "
+            "ORDER BY f.path, i.line",
+            (module, module.replace("%", r"\%").replace("_", r"\_") + ".%"),
+        )
+
+    def unused(self) -> list[dict[str, Any]]:
+        # Como el tree shaking, pero para todo el proyecto: funciones, clases y structs
+        # de nivel superior cuyo nombre no aparece en ningun archivo.
+        return self._query(
+            "SELECT f.path AS file, s.line, s.col, s.kind, s.name FROM symbols s "
+            "JOIN files f ON f.id = s.file_id "
+            "WHERE s.container IS NULL AND s.kind IN ('function', 'class', 'struct') "
+            "AND NOT EXISTS (SELECT 1 FROM refs r WHERE r.name = s.name) "
+            "ORDER BY f.path, s.line",
+            (),
+        )
+
+
+def _print_index_rows(rows: list[dict[str, Any]], label: Callable[[dict[str, Any]], str]) -> None:
+    for row in rows:
+        print(f"{row['file']}:{row['line']}:{row['col']}: {label(row)}")
+    print(f"{len(rows)} resultados.")
+
+
+def specialization_report(source_path: str) -> list[Specialization]:
+    # Transpila sin cache para recuperar las especializaciones aplicadas por tipo.
+    source_name = os.path.basename(source_path)
+    transpiler = Transpiler(source_name=source_name)
+    transpiler.transpile(parse_opn(read_opn_source(source_path), source_name=source_name))
+    return transpiler.specializations
+
+
+def _print_specializations(report: list[Specialization], source_path: str) -> None:
+    print(f"Especializaciones por tipo: {len(report)}")
+    for item in report:
+        print(f"  {source_path}:{item.line}: {item.kind:<14} {item.detail}")
+
+
+def _python_magic() -> str:
+    from importlib.util import MAGIC_NUMBER
+
+    return MAGIC_NUMBER.hex()
+
+
+def compile_opn_bytecode(source_path: str, output_path: str) -> str:
+    code = read_opn_source(source_path)
+    key = _cache_key(code, source_path)
+    compiled = compile_opn(code, source_name=source_path, key=key)
+    line_map = transpile_opn_mapped(code, source_name=source_path, key=key)[1]
+    header = json.dumps(
+        {
+            "runtime": RUNTIME_VERSION,
+            "python_magic": _python_magic(),
+            "source_hash": key[0],
+            "source_name": source_path,
+            "line_map": line_map.tolist(),
+        },
+        sort_keys=True,
+    ).encode("utf-8")
+    with open(output_path, "wb") as f:
+        f.write(OPNC_PREFIX.pack(OPNC_MAGIC, OPNC_FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(marshal.dumps(compiled))
+    return output_path
+
+
+def load_opn_bytecode(path: str) -> tuple[dict[str, Any], Any]:
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        magic, version, header_len = OPNC_PREFIX.unpack_from(data)
+        if magic != OPNC_MAGIC:
+            raise ValueError("cabecera OPNC ausente")
+        start = OPNC_PREFIX.size
+        header = json.loads(data[start : start + header_len].decode("utf-8"))
+    except (struct.error, ValueError) as err:
+        raise OPNError(
+            "El archivo no es un artefacto .opnc valido",
+            code="OPN3005",
+            phase="Runtime",
+            source_name=path,
+            details=str(err),
+            hint="Genera el artefacto con: opn compile --bytecode app.opn -o app.opnc",
+        ) from err
+
+    expected = {
+        "formato": (version, OPNC_FORMAT_VERSION),
+        "runtime OPN": (header.get("runtime"), RUNTIME_VERSION),
+        "magic de Python": (header.get("python_magic"), _python_magic()),
+    }
+    for label, (found, wanted) in expected.items():
+        if found != wanted:
+            raise OPNError(
+                "El artefacto .opnc fue generado por otra version",
+                code="OPN3006",
+                phase="Runtime",
+                source_name=path,
+                details=f"{label}: artefacto {found}, actual {wanted}",
+                hint="Recompila desde el fuente .opn con la version actual de opn.",
+            )
+    try:
+        compiled = marshal.loads(data[OPNC_PREFIX.size + header_len :])
+    except (EOFError, ValueError, TypeError) as err:
+        raise OPNError(
+            "El artefacto .opnc esta danado",
+            code="OPN3005",
+            phase="Runtime",
+            source_name=path,
+            details=str(err),
+            hint="Genera el artefacto con: opn compile --bytecode app.opn -o app.opnc",
+        ) from err
+    _LINE_MAPS.set(compiled.co_filename, array.array("I", header.get("line_map", [])))
+    return header, compiled
 
 
 def _venv_python_path(venv_dir: str = DEFAULT_VENV_DIR) -> str:
@@ -1301,49 +4526,137 @@ def _binary_artifact_name(binary_name: str) -> str:
     return binary_name
 
 
-def build_opn_binary(source_path: str, output_path: Optional[str] = None) -> str:
-    if not source_path.endswith(".opn"):
-        raise OPNError(
-            "El comando build requiere un archivo .opn",
-            code="OPN4008",
-            phase="Build",
-            hint="Uso: opn build archivo.opn -o dist/miapp",
-        )
-    if not os.path.exists(source_path):
-        raise FileNotFoundError(source_path)
+def _locked_dependencies(python_bin: str) -> str:
+    freeze = subprocess.run(
+        [python_bin, "-m", "pip", "freeze", "--all"],
+        capture_output=True,
+        text=True,
+    )
+    if freeze.returncode != 0:
+        return ""
+    return "\n".join(sorted(line.strip() for line in freeze.stdout.splitlines() if line.strip()))
 
-    python_bin = ensure_project_venv()
-    ensure_pip_in_venv(python_bin)
-    ensure_pyinstaller_in_venv(python_bin)
 
-    os.makedirs(DEFAULT_BUILD_WORK_DIR, exist_ok=True)
-    os.makedirs(DEFAULT_DIST_DIR, exist_ok=True)
+def _venv_python_version(venv_dir: str = DEFAULT_VENV_DIR) -> str:
+    try:
+        with open(os.path.join(venv_dir, "pyvenv.cfg"), "r", encoding="utf-8") as f:
+            for line in f:
+                name, _, value = line.partition("=")
+                if name.strip() in ("version", "version_info"):
+                    return value.strip()
+    except OSError:
+        pass
+    return sys.version
+
+
+def _local_import_files(py_code: str, search_dirs: list[str]) -> list[str]:
+    # Modulos .py y paquetes locales que importa el entry, y recursivamente lo que
+    # importan ellos: PyInstaller los empaqueta, asi que su contenido entra en la clave.
+    found: dict[str, None] = {}
+    pending = [py_code]
+    while pending:
+        try:
+            tree = ast.parse(pending.pop())
+        except (SyntaxError, ValueError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                top = name.split(".")[0]
+                for directory in search_dirs:
+                    module = os.path.join(directory, f"{top}.py")
+                    package = os.path.join(directory, top)
+                    if os.path.isfile(module):
+                        candidates = [module]
+                    elif os.path.isdir(package):
+                        candidates = sorted(
+                            os.path.join(root, file)
+                            for root, _, files in os.walk(package)
+                            for file in files
+                            if file.endswith(".py")
+                        )
+                    else:
+                        continue
+                    for path in candidates:
+                        if path not in found:
+                            found[path] = None
+                            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                                pending.append(f.read())
+                    break
+    return list(found)
+
+
+def _build_cache_key(
+    py_code: str, python_bin: str, options: list[str], local_files: Iterable[str] = ()
+) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    local = []
+    for path in sorted(local_files):
+        with open(path, "rb") as f:
+            local.append(f"{path}:{_content_hash(f.read())}")
+    for part in (
+        py_code,
+        _locked_dependencies(python_bin),
+        _venv_python_version(),
+        "\0".join(options),
+        "\0".join(local),
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _prune_build_cache(cache_root: str, keep: int = DEFAULT_BUILD_CACHE_ENTRIES) -> None:
+    entries = [os.path.join(cache_root, name) for name in os.listdir(cache_root)]
+    entries = sorted((p for p in entries if os.path.isdir(p)), key=os.path.getmtime, reverse=True)
+    for stale in entries[keep:]:
+        shutil.rmtree(stale, ignore_errors=True)
 
-    binary_name = _default_binary_name(source_path)
-    transpiled_entry = os.path.join(DEFAULT_BUILD_WORK_DIR, f"{binary_name}__entry.py")
-    compile_opn_file(source_path, transpiled_entry)
 
+def _write_if_changed(path: str, content: str) -> None:
+    # Conservar el mtime del entry deja que PyInstaller reutilice su analisis previo.
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(content)
+
+
+def _startup_probe_entry(py_code: str) -> str:
+    # Entry solo para el build de medicion (--measure-startup): sale justo despues
+    # del preambulo. El cuerpo sigue en el archivo para que PyInstaller analice y
+    # empaquete los mismos modulos que el binario real, pero nunca se ejecuta.
+    prelude, _, body = py_code.partition("\n\n")
+    return f"{prelude}\n\nraise SystemExit(0)\n\n{body}"
+
+
+def _pyinstaller_build(
+    python_bin: str, entry: str, options: list[str], source_path: str
+) -> None:
+    # Sin --clean: el workpath conserva el analisis de PyInstaller entre builds.
     pyinstaller_work = os.path.join(DEFAULT_BUILD_WORK_DIR, "pyinstaller")
     os.makedirs(pyinstaller_work, exist_ok=True)
-
     cmd = [
         python_bin,
         "-m",
         "PyInstaller",
-        "--noconfirm",
-        "--clean",
-        "--onefile",
-        "--name",
-        binary_name,
+        *options,
         "--distpath",
         DEFAULT_DIST_DIR,
         "--workpath",
         pyinstaller_work,
         "--specpath",
         DEFAULT_BUILD_WORK_DIR,
-        transpiled_entry,
+        entry,
     ]
-    print(f"Empaquetando '{source_path}' como binario portable...")
     build = subprocess.run(cmd, capture_output=True, text=True)
     if build.returncode != 0:
         detail = build.stderr.strip() or build.stdout.strip()
@@ -1358,8 +4671,204 @@ def build_opn_binary(source_path: str, output_path: Optional[str] = None) -> str
             hint="Revisa imports dinamicos o usa opn -m pip install pyinstaller --upgrade",
         )
 
-    artifact = os.path.join(DEFAULT_DIST_DIR, _binary_artifact_name(binary_name))
-    if not os.path.exists(artifact):
+
+def _zipapp_build(python_bin: Optional[str], py_code: str, artifact: str, source_path: str) -> None:
+    import compileall
+    import py_compile
+    import zipapp
+
+    staging = os.path.join(DEFAULT_BUILD_WORK_DIR, "zipapp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    with open(os.path.join(staging, "__main__.py"), "w", encoding="utf-8", newline="\n") as f:
+        f.write(py_code)
+    dependencies = load_opn_project().get("dependencies", [])
+    if dependencies and python_bin:
+        install = subprocess.run(
+            [python_bin, "-m", "pip", "install", "--target", staging, *dependencies],
+            capture_output=True,
+            text=True,
+        )
+        if install.returncode != 0:
+            detail = install.stderr.strip() or install.stdout.strip()
+            if detail:
+                detail = detail.splitlines()[-1]
+            raise OPNError(
+                "No se pudieron empaquetar las dependencias en el zipapp",
+                code="OPN4010",
+                phase="Build",
+                source_name=source_path,
+                details=detail if detail else None,
+                hint="Los zipapp solo admiten dependencias de Python puro.",
+            )
+    # .pyc junto a cada .py (legacy) y sin validar contra el fuente: zipimport los
+    # carga directo; el .py queda como respaldo si cambia la version de Python.
+    compileall.compile_dir(
+        staging,
+        quiet=1,
+        legacy=True,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+    zipapp.create_archive(
+        staging, artifact, interpreter="/usr/bin/env python3", compressed=True
+    )
+
+
+def _remove_path(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _same_path(a: str, b: str) -> bool:
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+
+def _copy_artifact(source: str, destination: str) -> None:
+    # -o dist/app apunta al mismo artefacto: borrar el destino borraria el build.
+    if _same_path(source, destination):
+        return
+    _remove_path(destination)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, symlinks=True)
+    else:
+        shutil.copy2(source, destination)
+
+
+def _format_artifact_path(binary_name: str, build_format: str) -> str:
+    if build_format == "zipapp":
+        return os.path.join(DEFAULT_DIST_DIR, f"{binary_name}.pyz")
+    return os.path.join(DEFAULT_DIST_DIR, _binary_artifact_name(binary_name))
+
+
+def _print_shake_report(report: ShakeReport, report_path: str) -> None:
+    if report.skipped_reason:
+        print(f"Tree shaking omitido ({report.skipped_reason}).")
+        return
+    print(
+        f"Tree shaking: {len(report.functions)} funciones, {len(report.classes)} clases y "
+        f"{len(report.imports)} imports eliminados (reporte: {report_path})"
+    )
+
+
+def build_opn_binary(
+    source_path: str,
+    output_path: Optional[str] = None,
+    build_format: str = "onefile",
+    shake: bool = True,
+    measure_startup: bool = False,
+) -> str:
+    if not source_path.endswith(".opn"):
+        raise OPNError(
+            "El comando build requiere un archivo .opn",
+            code="OPN4008",
+            phase="Build",
+            hint="Uso: opn build archivo.opn -o dist/miapp",
+        )
+    if build_format not in BUILD_FORMATS:
+        raise OPNError(
+            f"Formato de build no soportado: {build_format}",
+            code="OPN4017",
+            phase="Build",
+            hint=f"Formatos validos: {', '.join(BUILD_FORMATS)}",
+        )
+    if not os.path.exists(source_path):
+        raise OPNError(
+            "No se encontro el archivo fuente para build",
+            code="OPN4001",
+            phase="Build",
+            source_name=source_path,
+            hint="Verifica la ruta de entrada.",
+        )
+
+    # zipapp no usa PyInstaller; el venv solo hace falta para empaquetar dependencias.
+    python_bin: Optional[str] = None
+    if build_format != "zipapp" or load_opn_project().get("dependencies"):
+        python_bin = ensure_project_venv()
+        ensure_pip_in_venv(python_bin)
+    if build_format != "zipapp":
+        ensure_pyinstaller_in_venv(python_bin)
+
+    os.makedirs(DEFAULT_BUILD_WORK_DIR, exist_ok=True)
+    os.makedirs(DEFAULT_DIST_DIR, exist_ok=True)
+
+    binary_name = _default_binary_name(source_path)
+    extra_options: list[str] = []
+    if shake:
+        py_code, report = shake_opn_entry(source_path)
+        report_path = os.path.join(DEFAULT_BUILD_WORK_DIR, f"{binary_name}__shake.json")
+        with open(report_path, "w", encoding="utf-8", newline="\n") as f:
+            json.dump(asdict(report), f, indent=2)
+            f.write("\n")
+        _print_shake_report(report, report_path)
+        for module in report.excluded_modules:
+            extra_options.extend(["--exclude-module", module])
+    else:
+        py_code = transpile_opn_entry(source_path)
+
+    artifact = _build_artifact(
+        python_bin, py_code, binary_name, build_format, extra_options, source_path
+    )
+    delivered = _deliver_artifact(artifact, output_path)
+    if measure_startup:
+        # Build aparte con el mismo formato y opciones: el binario entregado no lleva
+        # ningun gancho de medicion.
+        probe_name = f"{binary_name}__startup"
+        probe = _build_artifact(
+            python_bin,
+            _startup_probe_entry(py_code),
+            probe_name,
+            build_format,
+            extra_options,
+            source_path,
+        )
+        seconds = measure_artifact_startup(probe, probe_name)
+        if seconds is None:
+            print(f"No se pudo medir el arranque de {probe}.", file=sys.stderr)
+        else:
+            print(f"Arranque medido ({build_format}): {seconds * 1000:.0f} ms")
+    return delivered
+
+
+def _build_artifact(
+    python_bin: Optional[str],
+    py_code: str,
+    binary_name: str,
+    build_format: str,
+    extra_options: list[str],
+    source_path: str,
+) -> str:
+    # Empaqueta py_code en dist/ (o lo copia desde la cache) y devuelve la ruta.
+    transpiled_entry = os.path.join(DEFAULT_BUILD_WORK_DIR, f"{binary_name}__entry.py")
+    options = ["--noconfirm", f"--{build_format}", "--name", binary_name, *extra_options]
+    _write_if_changed(transpiled_entry, py_code)
+
+    artifact = _format_artifact_path(binary_name, build_format)
+    search_dirs = list(dict.fromkeys([os.path.dirname(os.path.abspath(source_path)), os.getcwd()]))
+    cache_key = _build_cache_key(
+        py_code,
+        python_bin or sys.executable,
+        options,
+        _local_import_files(py_code, search_dirs),
+    )
+    cache_dir = os.path.join(DEFAULT_BUILD_WORK_DIR, "cache", cache_key)
+    cached_artifact = os.path.join(cache_dir, os.path.basename(artifact))
+    if os.path.lexists(cached_artifact):
+        print(f"Sin cambios en '{source_path}': reutilizando binario en cache.")
+        _copy_artifact(cached_artifact, artifact)
+        os.utime(cache_dir)
+        return artifact
+
+    # onefile y onedir comparten nombre en dist/: se descarta el artefacto anterior.
+    _remove_path(artifact)
+    print(f"Empaquetando '{source_path}' como {build_format}...")
+    if build_format == "zipapp":
+        _zipapp_build(python_bin, py_code, artifact, source_path)
+    else:
+        _pyinstaller_build(python_bin, transpiled_entry, options, source_path)
+
+    if not os.path.lexists(artifact):
         raise OPNError(
             "No se encontro el binario generado",
             code="OPN4012",
@@ -1368,10 +4877,44 @@ def build_opn_binary(source_path: str, output_path: Optional[str] = None) -> str
             hint="Revisa el directorio dist o ejecuta nuevamente opn build.",
         )
 
+    os.makedirs(cache_dir, exist_ok=True)
+    _copy_artifact(artifact, cached_artifact)
+    _prune_build_cache(os.path.dirname(cache_dir))
+    return artifact
+
+
+def _artifact_command(artifact: str, binary_name: str) -> list[str]:
+    if artifact.endswith(".pyz"):
+        return [sys.executable, artifact]
+    if os.path.isdir(artifact):
+        # onedir: el ejecutable lleva el nombre del build, no el de la carpeta.
+        return [os.path.join(artifact, _binary_artifact_name(binary_name))]
+    return [artifact]
+
+
+def measure_artifact_startup(artifact: str, binary_name: str, runs: int = 3) -> Optional[float]:
+    # El mejor de varios arranques de un build de medicion; None si no arranca.
+    cmd = _artifact_command(os.path.abspath(artifact), binary_name)
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            return None
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _deliver_artifact(artifact: str, output_path: Optional[str]) -> str:
     if not output_path:
         return artifact
 
     destination = output_path
+    if _same_path(artifact, output_path):
+        return artifact
     if output_path.endswith(os.sep) or os.path.isdir(output_path):
         os.makedirs(output_path, exist_ok=True)
         destination = os.path.join(output_path, os.path.basename(artifact))
@@ -1379,13 +4922,31 @@ def build_opn_binary(source_path: str, output_path: Optional[str] = None) -> str
         parent = os.path.dirname(output_path)
         if parent:
             os.makedirs(parent, exist_ok=True)
-    shutil.copy2(artifact, destination)
+    _copy_artifact(artifact, destination)
     return destination
 
 
 class OPNInterpreter:
-    def __init__(self):
-        self.globals = {"__builtins__": __builtins__}
+    def __init__(
+        self, module_name: str = OPN_MODULE_NAME, *, auto_install: bool = True, inline: bool = True
+    ):
+        # Un modulo real permite que los workers de 'parallel for' (fork) resuelvan
+        # por nombre las funciones del programa al deserializarlas.
+        self.module = types.ModuleType(module_name)
+        self.globals = self.module.__dict__
+        self.globals["__builtins__"] = __builtins__
+        self.auto_install = auto_install
+        # inline=False para profilers y cobertura: cada funcion conserva sus frames.
+        self.inline = inline
+
+    def _execute(self, compiled: Any) -> None:
+        sys.modules[self.module.__name__] = self.module
+        if compiled.co_flags & CO_COROUTINE:
+            import asyncio
+
+            asyncio.run(eval(compiled, self.globals))
+            return
+        exec(compiled, self.globals)
 
     def _is_running_in_venv(self, venv_dir: str = DEFAULT_VENV_DIR) -> bool:
         abs_venv = os.path.normcase(os.path.abspath(venv_dir))
@@ -1426,10 +4987,31 @@ class OPNInterpreter:
     def run(
         self, code: str, source_name: str = "<opn>", source_path: Optional[str] = None
     ) -> None:
-        compiled = compile_opn(code, source_name=source_name)
+        compiled = compile_opn(code, source_name=source_name, inline=self.inline)
+        self._run_compiled(compiled, lambda: code, source_name, source_path)
+
+    def run_file(self, path: str) -> None:
+        if path.endswith(".opnc"):
+            # Artefacto precompilado: sin lexer, parser ni transpiler, y sin fuente.
+            _, compiled = load_opn_bytecode(path)
+            self._run_compiled(compiled, lambda: "", path, path)
+            return
+        # El fuente solo se lee si cambio el archivo o si hace falta para un error.
+        compiled = compile_opn_path(path, inline=self.inline)
+        self._run_compiled(compiled, lambda: read_opn_source(path), path, path)
+
+    def _run_compiled(
+        self,
+        compiled: Any,
+        load_source: Callable[[], str],
+        source_name: str,
+        source_path: Optional[str],
+    ) -> None:
         try:
-            exec(compiled, self.globals)
+            self._execute(compiled)
         except ModuleNotFoundError as err:
+            if not self.auto_install:
+                raise self._runtime_error(err, load_source(), source_name) from err
             missing_module = err.name or "desconocido"
             try:
                 self._ensure_venv_and_install(missing_module)
@@ -1439,46 +5021,960 @@ class OPNInterpreter:
                     code="OPN3002",
                     phase="Runtime",
                     source_name=source_name,
-                    source_code=code,
+                    source_code=load_source(),
                     details=str(install_err),
                     hint=f"Prueba con: opn -m pip install {missing_module}",
                 ) from install_err
 
             if self._is_running_in_venv():
-                compiled = compile_opn(code, source_name=source_name)
-                exec(compiled, self.globals)
+                self._execute(compiled)
                 return
 
             self._rerun_inside_venv(source_path or source_name)
         except OPNError:
             raise
         except Exception as err:
-            tb = traceback.extract_tb(err.__traceback__)
-            opn_frame = None
-            for frame in reversed(tb):
-                if frame.filename.startswith("<opn:"):
-                    opn_frame = frame
-                    break
-            generated_line = opn_frame.lineno if opn_frame else None
-            line = (
-                max(1, generated_line - GENERATED_BODY_LINE_OFFSET)
-                if generated_line is not None
-                else None
-            )
-            col = 1 if opn_frame else None
-            detail = "".join(traceback.format_exception_only(type(err), err)).strip()
+            raise self._runtime_error(err, load_source(), source_name) from err
+
+    def _runtime_error(self, err: BaseException, code: str, source_name: str) -> OPNError:
+        tb = traceback.extract_tb(err.__traceback__)
+        generated_line = None
+        line = None
+        for frame in reversed(tb):
+            location = opn_location(frame.filename, frame.lineno)
+            # Los guardas de inmutabilidad de un struct apuntan a su declaracion; el
+            # error esta en la asignacion del llamador.
+            if location is not None and frame.name not in ("__setattr__", "__delattr__"):
+                generated_line = frame.lineno
+                line = location[1] or None
+                break
+        col = 1 if line is not None else None
+        detail = "".join(traceback.format_exception_only(type(err), err)).strip()
+        return OPNError(
+            "Error durante la ejecucion del programa OPN",
+            code="OPN3001",
+            phase="Runtime",
+            source_name=source_name,
+            source_code=code,
+            line=line,
+            col=col,
+            details=f"{detail} (linea Python generada: {generated_line})"
+            if generated_line is not None
+            else detail,
+        )
+
+
+_CONTEXT_IDS = itertools.count(1)
+
+
+@dataclass(slots=True)
+class OPNRunResult:
+    source_name: str
+    globals: dict[str, Any]
+    error: Optional[OPNError] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run_isolated(code: str, source_name: str = "<opn>") -> OPNRunResult:
+    # Cada llamada usa globals nuevos; el codigo compilado sale de las caches
+    # compartidas. El nombre de modulo es unico para que 'parallel for' no
+    # resuelva funciones de otro contexto que corre en paralelo.
+    interpreter = OPNInterpreter(f"{OPN_MODULE_NAME}{next(_CONTEXT_IDS)}", auto_install=False)
+    try:
+        interpreter.run(code, source_name=source_name)
+    except OPNError as exc:
+        return OPNRunResult(source_name, interpreter.globals, exc)
+    finally:
+        sys.modules.pop(interpreter.module.__name__, None)
+    return OPNRunResult(source_name, interpreter.globals)
+
+
+def run_many(
+    scripts: Iterable[str | tuple[str, str]], *, workers: Optional[int] = None
+) -> list[OPNRunResult]:
+    # Acepta codigo suelto o pares (source_name, code); el resultado respeta el orden.
+    jobs = [
+        (script, f"<opn:{index}>") if isinstance(script, str) else (script[1], script[0])
+        for index, script in enumerate(scripts)
+    ]
+    if workers == 1 or len(jobs) <= 1:
+        return [run_isolated(code, name) for code, name in jobs]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda job: run_isolated(*job), jobs))
+
+
+# Consola interactiva (opn repl). Cada entrada se compila por separado en un
+# contexto persistente, sin las especializaciones de programa completo: una
+# entrada posterior puede redefinir funciones, clases o builtins de otra.
+REPL_PROMPT = "opn> "
+REPL_CONTINUATION_PROMPT = "...  "
+REPL_SOURCE_NAME = "<repl>"
+REPL_TIME_REPEAT = 5
+REPL_TIME_TARGET = 0.2
+# Al final de una linea, estos tokens piden la siguiente (expresion sin terminar).
+REPL_OPEN_TYPES = frozenset("OP COMMA DOT COLON ELSE".split())
+REPL_HELP = """Comandos:
+  :time <codigo>   mide el codigo en bucle (mejor de 5) contra el estado actual
+  :reset           descarta variables, funciones y clases definidas
+  :help            muestra esta ayuda
+  :quit, :exit     sale (tambien Ctrl-D)
+Una entrada termina en ';' o al cerrar sus llaves; el ';' final es opcional.
+Tras un bloque '{ ... }' deja una linea vacia (o sigue con 'else')."""
+
+
+def _repl_status(source: str) -> str:
+    # "empty", "more" (faltan lineas), "block" (cerro un '}': puede seguir un else),
+    # "done" (termino en ';') u "open" (sentencia completa sin ';' final).
+    depth = 0
+    last: Optional[Token] = None
+    for tok in Lexer(source, source_name=REPL_SOURCE_NAME, recover=True).iter_tokens():
+        if tok.type == "EOF":
+            break
+        if tok.type in ("LBRACE", "LPAREN", "LBRACKET"):
+            depth += 1
+        elif tok.type in ("RBRACE", "RPAREN", "RBRACKET"):
+            depth -= 1
+        last = tok
+    if last is None:
+        return "empty"
+    if depth > 0 or last.type in REPL_OPEN_TYPES:
+        return "more"
+    if last.type == "RBRACE":
+        return "block"
+    return "done" if last.type == "SEMICOL" else "open"
+
+
+def _repl_continues(line: str) -> bool:
+    first = next(Lexer(line, source_name=REPL_SOURCE_NAME, recover=True).iter_tokens())
+    return first.type != "EOF" and first.type in CHUNK_CONTINUATION_TYPES
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+class OPNRepl:
+    def __init__(self, interpreter: Optional[OPNInterpreter] = None):
+        # Sin auto-instalacion: relanzar dentro del venv perderia el estado de la sesion.
+        self.interpreter = interpreter or OPNInterpreter(auto_install=False)
+        self.cache = LRUCache(*cache_limits())
+        self.sources: dict[str, str] = {}
+        self.entries = 0
+        # Los workers de 'parallel for' son globales del modulo: su numeracion
+        # continua entre entradas para que una no pise los de otra.
+        self.lifted = 0
+
+    def _transpiler(self, source: str) -> Transpiler:
+        self.entries += 1
+        name = f"<repl:{self.entries}>"
+        self.sources[name] = source
+        transpiler = Transpiler(source_name=name, specialize=False, source_code=source)
+        transpiler.lifted_count = self.lifted
+        return transpiler
+
+    def _compile_python(self, py_code: str, transpiler: Transpiler, *, display: bool) -> Any:
+        filename = f"<opn:{transpiler.source_name}>"
+        try:
+            tree = ast.parse(py_code, filename)
+            last = tree.body[-1] if tree.body else None
+            if display and isinstance(last, ast.Expr):
+                # Como en la consola de Python: se muestra el valor de una expresion final.
+                hook = ast.Attribute(ast.Name("_opn_sys", ast.Load()), "displayhook", ast.Load())
+                tree.body[-1] = ast.copy_location(ast.Expr(ast.Call(hook, [last.value], [])), last)
+                ast.fix_missing_locations(tree)
+            compiled = compile(tree, filename, "exec", ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+        except (RecursionError, MemoryError) as err:
+            raise _nesting_error("Compilacion", transpiler.source_name, err) from err
+        except SyntaxError as err:
+            line_map = transpiler.line_map
+            lineno = err.lineno or 0
             raise OPNError(
-                "Error durante la ejecucion del programa OPN",
-                code="OPN3001",
-                phase="Runtime",
-                source_name=source_name,
-                source_code=code,
-                line=line,
-                col=col,
-                details=f"{detail} (linea Python generada: {generated_line})"
-                if generated_line is not None
-                else detail,
+                err.msg,
+                code="OPN2011",
+                phase="Compilacion",
+                source_name=transpiler.source_name,
+                source_code=self.sources[transpiler.source_name],
+                line=line_map[lineno - 1] if 0 < lineno <= len(line_map) else None,
+                hint="El codigo Python generado no es valido; revisa nombres reservados de Python.",
             ) from err
+        _LINE_MAPS.set(filename, transpiler.line_map)
+        _emit_opn_warnings(transpiler.warnings)
+        return compiled
+
+    def compile(self, source: str) -> Any:
+        # Una entrada repetida reutiliza su bytecode sin volver a parsear ni transpilar.
+        key = _cache_key(source, REPL_SOURCE_NAME)
+        compiled = self.cache.get(key)
+        if compiled is not None:
+            return compiled
+        transpiler = self._transpiler(source)
+        name = transpiler.source_name
+        program = parse_opn(source, source_name=name)
+        try:
+            py_code = transpiler.transpile(program)
+        except RecursionError as err:
+            raise _nesting_error("Transpilacion", name, err) from err
+        self.lifted = transpiler.lifted_count
+        compiled = self._compile_python(py_code, transpiler, display=True)
+        self.cache.set(key, compiled)
+        return compiled
+
+    def compile_timer(self, source: str) -> Any:
+        # El codigo va dentro de un bucle en una funcion generada (como timeit):
+        # las variables que asigna son locales y no ensucian la sesion.
+        key = _cache_key(source, "<repl:time>")
+        compiled = self.cache.get(key)
+        if compiled is not None:
+            return compiled
+        transpiler = self._transpiler(source)
+        name = transpiler.source_name
+        program = parse_opn(source, source_name=name)
+        transpiler.scope_roots.append(program)
+        transpiler.indent = 2
+        try:
+            chunks = [transpiler.transpile(stmt) for stmt in program.body]
+        except RecursionError as err:
+            raise _nesting_error("Transpilacion", name, err) from err
+        self.lifted = transpiler.lifted_count
+        is_async = any(isinstance(node, AwaitExpr) for node in walk_nodes(program))
+        header = "\n".join(
+            [
+                *(["import asyncio as _opn_asyncio"] if transpiler.uses_asyncio else []),
+                *transpiler.lifted,
+                f"{'async def' if is_async else 'def'} _opn_timer(_opn_loops, _opn_clock):",
+                "    _opn_started = _opn_clock()",
+                "    for _opn_loop in range(_opn_loops):",
+            ]
+        )
+        transpiler.line_map = array.array("I", [0] * (header.count("\n") + 1))
+        body = "\n".join(chunk for chunk in chunks if chunk.strip()) or "        pass"
+        body = transpiler._strip_line_markers(body)
+        transpiler.line_map.append(0)
+        py_code = "\n".join([header, body, "    return _opn_clock() - _opn_started"])
+        compiled = self._compile_python(py_code, transpiler, display=False)
+        self.cache.set(key, compiled)
+        return compiled
+
+    def _runtime_error(self, err: BaseException) -> OPNError:
+        # El frame OPN mas interno puede ser de una entrada anterior (una funcion
+        # definida antes): el error se muestra contra el fuente de esa entrada.
+        name = REPL_SOURCE_NAME
+        for frame in reversed(traceback.extract_tb(err.__traceback__)):
+            location = opn_location(frame.filename, frame.lineno)
+            if location is not None:
+                name = location[0]
+                break
+        return self.interpreter._runtime_error(err, self.sources.get(name, ""), name)
+
+    def execute(self, source: str) -> None:
+        compiled = self.compile(source)
+        try:
+            self.interpreter._execute(compiled)
+        except Exception as err:
+            raise self._runtime_error(err) from err
+
+    def time(self, source: str) -> tuple[int, float]:
+        # Devuelve (iteraciones por medicion, mejor tiempo por iteracion en segundos).
+        self.interpreter._execute(self.compile_timer(source))
+        timer = self.interpreter.globals.pop("_opn_timer")
+        if timer.__code__.co_flags & CO_COROUTINE:
+            import asyncio
+
+            async_timer = timer
+
+            def timer(loops: int, clock: Callable[[], float]) -> float:
+                return asyncio.run(async_timer(loops, clock))
+
+        try:
+            # Como timeit: 1, 2, 5, 10, 20, 50... iteraciones hasta ~0.2 s por medicion.
+            loops = 0
+            for scale in itertools.count():
+                for factor in (1, 2, 5):
+                    loops = factor * 10**scale
+                    elapsed = timer(loops, time.perf_counter)
+                    if elapsed >= REPL_TIME_TARGET:
+                        break
+                else:
+                    continue
+                break
+            best = elapsed
+            for _ in range(REPL_TIME_REPEAT - 1):
+                best = min(best, timer(loops, time.perf_counter))
+        except Exception as err:
+            raise self._runtime_error(err) from err
+        return loops, best / loops
+
+    def _submit(self, source: str, timed: bool = False) -> None:
+        if _repl_status(source) == "open":
+            source += ";"
+        try:
+            if not timed:
+                self.execute(source)
+                return
+            loops, per_loop = self.time(source)
+            print(
+                f"{loops} iteraciones, mejor de {REPL_TIME_REPEAT}: "
+                f"{_format_seconds(per_loop)} por iteracion"
+            )
+        except OPNError as exc:
+            print_opn_error(exc)
+        except KeyboardInterrupt:
+            print("KeyboardInterrupt", file=sys.stderr)
+        except Exception as exc:
+            # Un fallo interno del compilador no debe cerrar la sesion ni perder su estado.
+            print_opn_error(
+                OPNError(
+                    "Fallo interno no controlado",
+                    code="OPN9000",
+                    phase="Interno",
+                    details="".join(traceback.format_exception_only(type(exc), exc)).strip(),
+                )
+            )
+
+    def _command(self, line: str) -> Optional[str]:
+        # Devuelve el codigo de ':time' para leerlo (puede seguir en otras lineas),
+        # "" si el comando ya se atendio y None para salir.
+        name, _, rest = line.partition(" ")
+        if name in (":quit", ":exit"):
+            return None
+        if name == ":time":
+            if rest.strip():
+                return rest
+            print("Uso: :time <codigo>", file=sys.stderr)
+        elif name == ":reset":
+            self.interpreter = OPNInterpreter(self.interpreter.module.__name__, auto_install=False)
+        elif name == ":help":
+            print(REPL_HELP)
+        else:
+            print(f"Comando desconocido: {name} (usa :help)", file=sys.stderr)
+        return ""
+
+    def interact(self, stream: Any = None) -> int:
+        stream = stream or sys.stdin
+        interactive = stream.isatty()
+        if interactive:
+            try:
+                import readline  # noqa: F401  (historial y edicion de linea)
+            except ImportError:
+                pass
+            print(f"OPN BluePanda v{RUNTIME_VERSION} - :help para ver los comandos, :quit para salir")
+
+        def read_line(prompt: str) -> Optional[str]:
+            if interactive:
+                try:
+                    return input(prompt)
+                except EOFError:
+                    print()
+                    return None
+            line = stream.readline()
+            return line.rstrip("\r\n") if line else None
+
+        buffer: list[str] = []
+        timed = False
+        status = "empty"
+        line: Optional[str] = None
+        while True:
+            try:
+                if line is None:
+                    line = read_line(REPL_CONTINUATION_PROMPT if buffer else REPL_PROMPT)
+            except KeyboardInterrupt:
+                print("\nKeyboardInterrupt", file=sys.stderr)
+                buffer, line = [], None
+                continue
+            if line is None:
+                if buffer:
+                    self._submit("\n".join(buffer), timed)
+                return 0
+            if buffer and status == "block" and not _repl_continues(line):
+                # El bloque no sigue con else: se ejecuta y la linea abre otra entrada.
+                self._submit("\n".join(buffer), timed)
+                buffer = []
+            if not buffer:
+                timed = False
+                stripped = line.strip()
+                if not stripped:
+                    line = None
+                    continue
+                if stripped.startswith(":"):
+                    code = self._command(stripped)
+                    if code is None:
+                        return 0
+                    line = None
+                    if not code:
+                        continue
+                    line, timed = code, True
+            buffer.append(line)
+            line = None
+            status = _repl_status("\n".join(buffer))
+            if status not in ("more", "block"):
+                self._submit("\n".join(buffer), timed)
+                buffer = []
+
+
+OPNFrame = tuple[str, int, str]
+
+
+class OPNSampler:
+    # Perfilador por muestreo: un hilo lee las pilas de los demas hilos cada
+    # 'interval' segundos y conserva solo los frames de codigo OPN.
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks: Counter[tuple[OPNFrame, ...]] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="opn-sampler", daemon=True)
+
+    def __enter__(self) -> "OPNSampler":
+        # Un intervalo de cambio corto deja que el muestreador obtenga el GIL a tiempo.
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    location = opn_location(code.co_filename, frame.f_lineno)
+                    if location is not None:
+                        name = "<main>" if code.co_name == "<module>" else code.co_name
+                        stack.append((*location, name))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def hot_spots(self) -> list[tuple[OPNFrame, int, int]]:
+        # (frame, muestras propias, muestras totales) ordenado por costo propio.
+        own: Counter[OPNFrame] = Counter()
+        total: Counter[OPNFrame] = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        return sorted(
+            ((frame, own[frame], total[frame]) for frame in total),
+            key=lambda row: (row[1], row[2]),
+            reverse=True,
+        )
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            for stack, count in sorted(self.stacks.items()):
+                names = ";".join(f"{name} ({source}:{line})" for source, line, name in stack)
+                f.write(f"{names} {count}\n")
+
+
+def _format_profile(sampler: OPNSampler, source_path: str, top: int) -> str:
+    try:
+        source_lines = read_opn_source(source_path).splitlines()
+    except (OSError, UnicodeDecodeError):
+        source_lines = []
+    rows = sampler.hot_spots()[:top]
+    samples = max(1, sum(sampler.stacks.values()))
+    lines = [
+        f"Perfil de {source_path}: {samples} muestras cada {sampler.interval * 1000:.1f} ms",
+        f"{'propio%':>8} {'total%':>8}  {'ubicacion':<28} {'funcion':<20} codigo",
+    ]
+    for (source, line, name), own, total in rows:
+        text = ""
+        if source == source_path and 0 < line <= len(source_lines):
+            text = source_lines[line - 1].strip()
+        location = f"{source}:{line or '?'}"
+        lines.append(
+            f"{own * 100 / samples:>8.1f} {total * 100 / samples:>8.1f}  "
+            f"{location:<28} {name:<20} {text}"
+        )
+    return "\n".join(lines)
+
+
+def profile_opn_file(
+    source_path: str,
+    *,
+    top: int = 20,
+    interval: float = 0.001,
+    collapsed_path: Optional[str] = None,
+) -> str:
+    sampler = OPNSampler(interval)
+    try:
+        with sampler:
+            OPNInterpreter(inline=False).run_file(source_path)
+    finally:
+        if collapsed_path:
+            sampler.write_collapsed(collapsed_path)
+        print(_format_profile(sampler, source_path, top), file=sys.stderr)
+    return collapsed_path or ""
+
+
+class OPNLineTracer:
+    # Cuenta ejecuciones por linea Python de codigo OPN y, con timing, el tiempo
+    # hasta la siguiente linea OPN del mismo hilo. Usa sys.monitoring (3.12+),
+    # que desactiva para siempre las lineas ajenas a OPN; si no, sys.settrace.
+    def __init__(self, timing: bool = True):
+        self.timing = timing
+        self.hits: Counter[tuple[str, int]] = Counter()
+        self.seconds: Counter[tuple[str, int]] = Counter()
+        self._last: dict[int, tuple[tuple[str, int], float]] = {}
+        self._tool_id: Optional[int] = None
+
+    def _record(self, filename: str, lineno: int) -> None:
+        key = (filename, lineno)
+        self.hits[key] += 1
+        if self.timing:
+            now = time.perf_counter()
+            ident = threading.get_ident()
+            last = self._last.get(ident)
+            if last is not None:
+                self.seconds[last[0]] += now - last[1]
+            self._last[ident] = (key, now)
+
+    def _on_line(self, code: types.CodeType, lineno: int) -> Any:
+        if not code.co_filename.startswith("<opn:"):
+            return sys.monitoring.DISABLE
+        self._record(code.co_filename, lineno)
+        return None
+
+    def _global_trace(self, frame: types.FrameType, event: str, arg: Any) -> Any:
+        if frame.f_code.co_filename.startswith("<opn:"):
+            return self._local_trace
+        return None
+
+    def _local_trace(self, frame: types.FrameType, event: str, arg: Any) -> Any:
+        if event == "line":
+            self._record(frame.f_code.co_filename, frame.f_lineno)
+        return self._local_trace
+
+    def __enter__(self) -> "OPNLineTracer":
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is not None:
+            try:
+                monitoring.use_tool_id(monitoring.COVERAGE_ID, "opn")
+            except ValueError:
+                monitoring = None
+        if monitoring is not None:
+            self._tool_id = monitoring.COVERAGE_ID
+            monitoring.register_callback(self._tool_id, monitoring.events.LINE, self._on_line)
+            monitoring.set_events(self._tool_id, monitoring.events.LINE)
+            return self
+        threading.settrace(self._global_trace)
+        sys.settrace(self._global_trace)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._tool_id is not None:
+            monitoring = sys.monitoring
+            monitoring.set_events(self._tool_id, 0)
+            monitoring.register_callback(self._tool_id, monitoring.events.LINE, None)
+            monitoring.free_tool_id(self._tool_id)
+            monitoring.restart_events()
+        else:
+            sys.settrace(None)
+            threading.settrace(None)
+        now = time.perf_counter()
+        for key, started in self._last.values():
+            self.seconds[key] += now - started
+        self._last.clear()
+
+    def report(self, compiled: Any, source_path: str) -> dict[str, Any]:
+        # Varias lineas Python pueden venir de una misma linea OPN: las visitas se
+        # toman como maximo (no se duplican) y el tiempo se suma.
+        executable: set[int] = set()
+        pending = [compiled]
+        while pending:
+            code = pending.pop()
+            for _, _, lineno in code.co_lines():
+                line = opn_source_line(code.co_filename, lineno)
+                if line:
+                    executable.add(line)
+            pending.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+        lines: dict[int, dict[str, float]] = {}
+        for (filename, lineno), count in self.hits.items():
+            line = opn_source_line(filename, lineno)
+            if not line or filename != compiled.co_filename:
+                continue
+            entry = lines.setdefault(line, {"hits": 0, "seconds": 0.0})
+            entry["hits"] = max(entry["hits"], count)
+            entry["seconds"] += self.seconds.get((filename, lineno), 0.0)
+        missed = sorted(executable - set(lines))
+        return {
+            "source": source_path,
+            "timing": self.timing,
+            "coverage": round(100 * (1 - len(missed) / len(executable)), 2) if executable else 100.0,
+            "executable": sorted(executable),
+            "missed": missed,
+            "lines": {str(line): lines[line] for line in sorted(lines)},
+        }
+
+
+def format_line_report(report: dict[str, Any], source_code: str) -> str:
+    # Fuente anotado al estilo gcov: '#####' marca lineas ejecutables que nunca corrieron.
+    executable = set(report["executable"])
+    out = []
+    for number, text in enumerate(source_code.splitlines(), 1):
+        stats = report["lines"].get(str(number))
+        if stats is not None:
+            hits = f"{stats['hits']:>9}"
+            ms = f"{stats['seconds'] * 1000:>10.3f}" if report["timing"] else " " * 10
+        elif number in executable:
+            hits, ms = f"{'#####':>9}", " " * 10
+        else:
+            hits, ms = f"{'-':>9}", " " * 10
+        out.append(f"{hits} {ms} {number:>5} | {text}")
+    header = f"{'visitas':>9} {'ms':>10} {'linea':>5} | {report['source']}"
+    return "\n".join([header, *out, f"Cobertura: {report['coverage']}%"])
+
+
+def run_with_line_stats(
+    source_path: str, *, timing: bool = True, output_base: Optional[str] = None
+) -> dict[str, Any]:
+    compiled = compile_opn_path(source_path, inline=False)
+    tracer = OPNLineTracer(timing=timing)
+    try:
+        with tracer:
+            OPNInterpreter(inline=False).run_file(source_path)
+    finally:
+        # El reporte se escribe tambien si el programa falla a mitad de camino.
+        report = tracer.report(compiled, source_path)
+        base = output_base or re.sub(r"\.opn$", "", source_path) + (
+            ".linestats" if timing else ".coverage"
+        )
+        with open(base + ".json", "w", encoding="utf-8", newline="\n") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        with open(base + ".txt", "w", encoding="utf-8", newline="\n") as f:
+            f.write(format_line_report(report, read_opn_source(source_path)) + "\n")
+        print(
+            f"Cobertura {report['coverage']}% ({len(report['missed'])} lineas sin ejecutar). "
+            f"Reportes: {base}.json, {base}.txt",
+            file=sys.stderr,
+        )
+    return report
+
+
+# El hilo de snapshots espera al menos este multiplo del costo del ultimo snapshot:
+# el analisis retiene el GIL, asi que el programa conserva ~80% del tiempo.
+MEMORY_SNAPSHOT_COST_FACTOR = 4
+
+
+class OPNMemoryProfiler:
+    # Cada bloque se atribuye al frame OPN mas interno de su traceback, asi lo que
+    # reserva una biblioteca cuenta para la linea que la llamo. tracemalloc solo
+    # guarda los nframes mas recientes: una reserva mas profunda que eso bajo el
+    # codigo OPN queda sin atribuir (se reporta aparte). 32 frames cubren las
+    # bibliotecas habituales por ~1.5x el costo de 4.
+    def __init__(self, interval: float = 1.0, nframes: int = 32):
+        self.interval = interval
+        self.nframes = nframes
+        self.snapshots: list[dict[str, Any]] = []
+        self.peak_bytes = 0
+        self.snapshot_seconds = 0.0
+        self._locations: dict[tuple[str, int], Optional[str]] = {}
+        self._started_at = 0.0
+        self._owns_tracing = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="opn-memory", daemon=True)
+
+    def __enter__(self) -> "OPNMemoryProfiler":
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+            self._owns_tracing = True
+        self._started_at = time.perf_counter()
+        if self.interval > 0:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        import tracemalloc
+
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        # Se detiene el trazado antes de analizar: el analisis final corre en el hilo
+        # del llamador y sus propias reservas no deben pagar ni aparecer en el reporte.
+        final = tracemalloc.take_snapshot()
+        self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        if self._owns_tracing:
+            tracemalloc.stop()
+        self.snapshot(final)
+
+    def _run(self) -> None:
+        wait = self.interval
+        while not self._stop.wait(wait):
+            started = time.perf_counter()
+            self.snapshot()
+            wait = max(self.interval, MEMORY_SNAPSHOT_COST_FACTOR * (time.perf_counter() - started))
+
+    def _site(self, frames: tuple[tuple[str, int], ...]) -> Optional[str]:
+        # Frames crudos de tracemalloc, del mas reciente al mas antiguo.
+        for frame in frames:
+            site = self._locations.get(frame, "")
+            if site == "":
+                location = opn_location(*frame)
+                site = None if location is None else f"{location[0]}:{location[1]}"
+                self._locations[frame] = site
+            if site is not None:
+                return site
+        return None
+
+    def snapshot(self, taken: Any = None) -> dict[str, Any]:
+        import tracemalloc
+
+        started = time.perf_counter()
+        # statistics("traceback") hashea cada traceback de hasta nframes frames por
+        # bloque; _tracemalloc ya comparte una tupla por traceback distinto, asi que
+        # agrupar por id() cuesta O(1) por bloque. Trazas crudas: (dominio, tamano,
+        # frames, total_nframe).
+        traces = (taken or tracemalloc.take_snapshot()).traces._traces
+        groups: dict[int, list[Any]] = {}
+        for trace in traces:
+            group = groups.get(id(trace[2]))
+            if group is None:
+                groups[id(trace[2])] = [trace[2], trace[1], 1]
+            else:
+                group[1] += trace[1]
+                group[2] += 1
+        sites: dict[str, list[int]] = {}
+        unattributed = 0
+        for frames, size, count in groups.values():
+            site_key = self._site(frames)
+            if site_key is None:
+                unattributed += size
+                continue
+            site = sites.setdefault(site_key, [0, 0])
+            site[0] += size
+            site[1] += count
+        self.snapshot_seconds += time.perf_counter() - started
+        entry = {
+            "seconds": round(time.perf_counter() - self._started_at, 3),
+            "total": sum(size for size, _ in sites.values()),
+            "unattributed": unattributed,
+            "sites": sites,
+        }
+        with self._lock:
+            self.snapshots.append(entry)
+        return entry
+
+    def report(self, first: int = 0, last: int = -1) -> dict[str, Any]:
+        # max_sampled es el mayor tamano visto en los snapshots, no el pico real del
+        # sitio: una reserva que crece y se libera entre dos snapshots no aparece.
+        maxima: Counter[str] = Counter()
+        for snap in self.snapshots:
+            for site, (size, _) in snap["sites"].items():
+                maxima[site] = max(maxima[site], size)
+        current = self.snapshots[-1]["sites"] if self.snapshots else {}
+        sites = [
+            {
+                "location": site,
+                "current": current.get(site, [0, 0])[0],
+                "max_sampled": size,
+                "blocks": current.get(site, [0, 0])[1],
+            }
+            for site, size in maxima.most_common()
+        ]
+        return {
+            "interval": self.interval,
+            "peak_bytes": self.peak_bytes,
+            "snapshot_seconds": round(self.snapshot_seconds, 3),
+            "sites": sites,
+            "diff": diff_memory_snapshots(self.snapshots[first], self.snapshots[last])
+            if self.snapshots
+            else [],
+            "snapshots": self.snapshots,
+        }
+
+
+def diff_memory_snapshots(before: dict[str, Any], after: dict[str, Any]) -> list[dict[str, Any]]:
+    # Crecimiento por sitio entre dos snapshots; un sitio que solo crece apunta a una fuga.
+    sites = set(before["sites"]) | set(after["sites"])
+    rows = []
+    for site in sites:
+        old = before["sites"].get(site, [0, 0])
+        new = after["sites"].get(site, [0, 0])
+        if new[0] != old[0]:
+            rows.append({"location": site, "delta": new[0] - old[0], "blocks": new[1] - old[1]})
+    return sorted(rows, key=lambda row: row["delta"], reverse=True)
+
+
+def format_memory_report(report: dict[str, Any], source_path: str, top: int = 20) -> str:
+    try:
+        source_lines = read_opn_source(source_path).splitlines()
+    except (OSError, UnicodeDecodeError):
+        source_lines = []
+
+    def code_at(location: str) -> str:
+        source, _, line = location.rpartition(":")
+        if source == source_path and 0 < int(line) <= len(source_lines):
+            return source_lines[int(line) - 1].strip()
+        return ""
+
+    snapshots = report["snapshots"]
+    unattributed = snapshots[-1].get("unattributed", 0) if snapshots else 0
+    lines = [
+        f"Memoria de {source_path}: pico trazado {report['peak_bytes'] / 2**20:.2f} MB, "
+        f"{len(snapshots)} snapshots ({report.get('snapshot_seconds', 0):.2f} s de analisis), "
+        f"{unattributed / 2**20:.2f} MB sin frame OPN al final",
+        f"{'actual KB':>10} {'max muestreado KB':>18} {'bloques':>8}  {'ubicacion':<28} codigo",
+    ]
+    for row in report["sites"][:top]:
+        lines.append(
+            f"{row['current'] / 1024:>10.1f} {row['max_sampled'] / 1024:>18.1f} "
+            f"{row['blocks']:>8}  {row['location']:<28} {code_at(row['location'])}"
+        )
+    if len(snapshots) > 1:
+        lines.append(
+            f"Cambio entre t={snapshots[0]['seconds']}s y t={snapshots[-1]['seconds']}s:"
+        )
+        for row in report["diff"][:top]:
+            lines.append(
+                f"{row['delta'] / 1024:>+10.1f} KB {row['blocks']:>+8}  "
+                f"{row['location']:<28} {code_at(row['location'])}"
+            )
+    return "\n".join(lines)
+
+
+def run_with_mem_profile(
+    source_path: str,
+    *,
+    interval: float = 1.0,
+    top: int = 20,
+    output_base: Optional[str] = None,
+) -> dict[str, Any]:
+    profiler = OPNMemoryProfiler(interval)
+    failure: list[BaseException] = []
+
+    def target() -> None:
+        try:
+            OPNInterpreter(inline=False).run_file(source_path)
+        except BaseException as exc:
+            failure.append(exc)
+
+    try:
+        # tracemalloc resuelve la linea de cada frame capturado en cada reserva, y
+        # el frame <module> de este archivo (miles de lineas, al fondo de la pila
+        # cuando se ejecuta como script) cuesta un recorrido de su tabla de lineas.
+        # Un hilo propio deja bajo el programa solo frames pequenos.
+        with profiler:
+            worker = threading.Thread(target=target, name="opn-main")
+            worker.start()
+            worker.join()
+        if failure:
+            raise failure[0]
+    finally:
+        report = profiler.report()
+        path = (output_base or re.sub(r"\.opnc?$", "", source_path) + ".memprofile") + ".json"
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(format_memory_report(report, source_path, top), file=sys.stderr)
+        print(f"Reporte de memoria: {path}", file=sys.stderr)
+    return report
+
+
+def _run_cli_file(path: str, ns: argparse.Namespace) -> None:
+    if ns.mem_profile:
+        run_with_mem_profile(
+            path, interval=ns.mem_interval, top=ns.top, output_base=ns.output
+        )
+        return
+    if not (ns.line_stats or ns.coverage):
+        OPNInterpreter().run_file(path)
+        return
+    if path.endswith(".opnc"):
+        raise OPNError(
+            "--line-stats y --coverage requieren el fuente .opn",
+            code="OPN4019",
+            phase="CLI",
+            source_name=path,
+            hint="Ejecuta: opn run app.opn --coverage",
+        )
+    run_with_line_stats(path, timing=ns.line_stats, output_base=ns.output)
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"debe ser un entero mayor que 0: {value}")
+    return number
+
+
+# Comandos que usan cada opcion; cualquier otro comando la rechaza con OPN4023.
+# "run" cubre tambien la forma corta opn2.py archivo.opn.
+CLI_OPTION_COMMANDS: dict[str, tuple[str, ...]] = {
+    "output": ("run", "compile", "build", "profile"),
+    "bytecode": ("compile",),
+    "specializations": ("compile",),
+    "json": ("check", "index"),
+    "workers": ("check", "index"),
+    "line_stats": ("run",),
+    "coverage": ("run",),
+    "mem_profile": ("run",),
+    "mem_interval": ("run",),
+    "top": ("run", "profile"),
+    "interval_ms": ("profile",),
+    "no_shake": ("build",),
+    "measure_startup": ("build",),
+    "format": ("build",),
+}
+# Opciones que solo tienen efecto junto a otra (en run, --top es de --mem-profile).
+CLI_OPTION_REQUIRES = {"mem_interval": "mem_profile"}
+# Valores por defecto aplicados despues de validar: el parser usa None para saber
+# si la opcion se escribio.
+CLI_OPTION_DEFAULTS = {"mem_interval": 1.0, "top": 20, "interval_ms": 1.0, "format": "onefile"}
+
+
+def _validate_cli_options(ns: argparse.Namespace, cmd: str) -> None:
+    flags = {dest: "--" + dest.replace("_", "-") for dest in CLI_OPTION_COMMANDS}
+    flags["output"] = "-o/--output"
+    # Identidad, no igualdad: --mem-interval 0 es un valor escrito.
+    given = {
+        dest
+        for dest in CLI_OPTION_COMMANDS
+        if getattr(ns, dest) is not None and getattr(ns, dest) is not False
+    }
+    requires = dict(CLI_OPTION_REQUIRES)
+    if cmd == "run":
+        requires["top"] = "mem_profile"
+    for dest in sorted(given):
+        if cmd not in CLI_OPTION_COMMANDS[dest]:
+            raise OPNError(
+                f"La opcion {flags[dest]} no aplica al comando {cmd}",
+                code="OPN4023",
+                phase="CLI",
+                hint=f"{flags[dest]} solo se usa con: {', '.join(CLI_OPTION_COMMANDS[dest])}.",
+            )
+        needed = requires.get(dest)
+        if needed is not None and needed not in given:
+            raise OPNError(
+                f"La opcion {flags[dest]} requiere {flags[needed]}",
+                code="OPN4023",
+                phase="CLI",
+                hint=f"Agrega {flags[needed]} o quita {flags[dest]}.",
+            )
+    for dest, value in CLI_OPTION_DEFAULTS.items():
+        if getattr(ns, dest) is None:
+            setattr(ns, dest, value)
 
 
 def main(argv: list[str]) -> int:
@@ -1498,17 +5994,78 @@ def main(argv: list[str]) -> int:
         help=(
             "Uso: opn2.py archivo.opn | opn2.py run archivo.opn | "
             "opn2.py compile in.opn -o out.py | opn2.py build app.opn -o dist/app | "
-            "opn2.py setup | opn2.py deps sync"
+            "opn2.py check src/ | opn2.py profile app.opn | opn2.py repl | opn2.py lsp | "
+            "opn2.py index refs nombre | opn2.py setup | opn2.py deps sync"
         ),
     )
     parser.add_argument("-o", "--output", help="Ruta de salida para compile/build")
-    ns = parser.parse_args(argv)
+    parser.add_argument(
+        "--bytecode",
+        action="store_true",
+        help="compile: genera un artefacto .opnc precompilado en lugar de .py",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="check/index: resultados en JSON"
+    )
+    parser.add_argument(
+        "--workers",
+        type=_positive_int,
+        help="check/index: procesos en paralelo (por defecto, uno por CPU)",
+    )
+    parser.add_argument(
+        "--specializations",
+        action="store_true",
+        help="compile: lista las especializaciones aplicadas por la inferencia de tipos",
+    )
+    parser.add_argument(
+        "--line-stats",
+        action="store_true",
+        help="run: visitas y tiempo por linea OPN (JSON y fuente anotado)",
+    )
+    parser.add_argument(
+        "--coverage", action="store_true", help="run: cobertura por linea OPN sin medir tiempo"
+    )
+    parser.add_argument(
+        "--mem-profile",
+        action="store_true",
+        help="run: reservas de memoria por linea OPN, con snapshots y diferencia",
+    )
+    parser.add_argument(
+        "--mem-interval",
+        type=float,
+        help="run --mem-profile: segundos entre snapshots (0 = solo al final; por defecto 1)",
+    )
+    parser.add_argument(
+        "--top", type=int, help="profile/run --mem-profile: filas en las tablas (por defecto 20)"
+    )
+    parser.add_argument(
+        "--interval-ms", type=float, help="profile: intervalo de muestreo en ms (por defecto 1)"
+    )
+    parser.add_argument(
+        "--no-shake",
+        action="store_true",
+        help="build: conserva funciones, clases e imports sin uso",
+    )
+    parser.add_argument(
+        "--measure-startup",
+        action="store_true",
+        help="build: genera un build de medicion aparte y reporta el tiempo de arranque",
+    )
+    parser.add_argument(
+        "--format",
+        choices=BUILD_FORMATS,
+        help="build: formato onefile (por defecto), onedir o zipapp",
+    )
+    ns = parser.parse_intermixed_args(argv)
+    install_opn_warning_printer()
+    direct = len(ns.args) == 1 and ns.args[0].endswith((".opn", ".opnc"))
+    _validate_cli_options(ns, "run" if direct else ns.args[0])
+    configure_caches(load_opn_project())
 
-    if len(ns.args) == 1 and ns.args[0].endswith(".opn"):
+    if direct:
         path = ns.args[0]
         try:
-            with open(path, "r", encoding="utf-8-sig") as f:
-                OPNInterpreter().run(f.read(), source_name=path, source_path=path)
+            _run_cli_file(path, ns)
         except FileNotFoundError as err:
             raise OPNError(
                 "No se encontro el archivo .opn",
@@ -1531,8 +6088,7 @@ def main(argv: list[str]) -> int:
             )
         path = ns.args[1]
         try:
-            with open(path, "r", encoding="utf-8-sig") as f:
-                OPNInterpreter().run(f.read(), source_name=path, source_path=path)
+            _run_cli_file(path, ns)
         except FileNotFoundError as err:
             raise OPNError(
                 "No se encontro el archivo .opn",
@@ -1553,11 +6109,15 @@ def main(argv: list[str]) -> int:
                 hint="Uso: opn2.py compile in.opn -o out.py",
             )
         src = ns.args[1]
-        out = ns.output or re.sub(r"\.opn$", ".py", src)
+        ext = ".opnc" if ns.bytecode else ".py"
+        out = ns.output or re.sub(r"\.opn$", ext, src)
         if out == src:
-            out = src + ".py"
+            out = src + ext
         try:
-            compile_opn_file(src, out)
+            if ns.bytecode:
+                compile_opn_bytecode(src, out)
+            else:
+                compile_opn_file(src, out)
         except FileNotFoundError as err:
             raise OPNError(
                 "No se encontro el archivo fuente para compilar",
@@ -1568,6 +6128,86 @@ def main(argv: list[str]) -> int:
                 details=str(err),
             ) from err
         print(f"Compilado: {src} -> {out}")
+        if ns.specializations:
+            _print_specializations(specialization_report(src), src)
+        return 0
+
+    if cmd == "check":
+        paths = ns.args[1:] or ["."]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise OPNError(
+                "No se encontro la ruta a revisar",
+                code="OPN4020",
+                phase="CLI",
+                source_name=missing[0],
+                hint="Uso: opn check [archivos o carpetas .opn]",
+            )
+        results = check_opn_paths(paths, workers=ns.workers)
+        if ns.json:
+            print(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            _print_check_results(results)
+        return 0 if all(result["ok"] for result in results) else 1
+
+    if cmd == "lsp":
+        return serve_lsp(sys.stdin.buffer, sys.stdout.buffer)
+
+    if cmd == "repl":
+        return OPNRepl().interact()
+
+    if cmd == "index":
+        subcmd = ns.args[1] if len(ns.args) >= 2 else "build"
+        if subcmd == "build":
+            paths = ns.args[2:]
+            missing = [path for path in paths if not os.path.exists(path)]
+            if missing:
+                raise OPNError(
+                    "No se encontro la ruta a indexar",
+                    code="OPN4020",
+                    phase="CLI",
+                    source_name=missing[0],
+                    hint="Uso: opn index build [archivos o carpetas .opn]",
+                )
+            started = time.perf_counter()
+            with OPNIndex() as index:
+                stats = index.update(paths or None, workers=ns.workers)
+            print(
+                f"Indice {DEFAULT_INDEX_FILE}: {stats['files']} archivos, "
+                f"{stats['indexed']} reindexados, {stats['removed']} eliminados "
+                f"({time.perf_counter() - started:.2f} s)"
+            )
+            return 0
+        queries: dict[str, tuple[str, Callable[[dict[str, Any]], str]]] = {
+            "defs": ("definitions", lambda row: f"{row['kind']} {row['container'] or ''}".rstrip()),
+            "refs": ("references", lambda row: row["kind"]),
+            "imports": ("importers", lambda row: f"{row['module']} {row['name'] or ''}".rstrip()),
+        }
+        if subcmd == "unused":
+            query, label, args = "unused", (lambda row: f"{row['kind']} {row['name']}"), ()
+        elif subcmd in queries:
+            if len(ns.args) < 3:
+                raise OPNError(
+                    f"Falta el nombre a buscar en index {subcmd}",
+                    code="OPN4021",
+                    phase="CLI",
+                    hint=f"Uso: opn index {subcmd} nombre",
+                )
+            (query, label), args = queries[subcmd], (ns.args[2],)
+        else:
+            raise OPNError(
+                f"Subcomando index no soportado: {subcmd}",
+                code="OPN4022",
+                phase="CLI",
+                hint="Subcomandos index: build, defs, refs, imports, unused",
+            )
+        with OPNIndex() as index:
+            index.update(workers=ns.workers)
+            rows = getattr(index, query)(*args)
+        if ns.json:
+            print(json.dumps(rows, indent=2, ensure_ascii=False))
+        else:
+            _print_index_rows(rows, label)
         return 0
 
     if cmd == "build":
@@ -1580,19 +6220,51 @@ def main(argv: list[str]) -> int:
             )
         src = ns.args[1]
         try:
-            out = build_opn_binary(src, ns.output)
+            out = build_opn_binary(
+                src,
+                ns.output,
+                ns.format,
+                shake=not ns.no_shake,
+                measure_startup=ns.measure_startup,
+            )
         except FileNotFoundError as err:
+            # El fuente ya se valido (OPN4001): esto falta durante el empaquetado.
             raise OPNError(
-                "No se encontro el archivo fuente para build",
-                code="OPN4001",
+                "Fallo la generacion del binario",
+                code="OPN4010",
                 phase="Build",
                 source_name=src,
-                hint="Verifica la ruta de entrada.",
                 details=str(err),
             ) from err
         print(f"Binario generado: {out}")
         return 0
 
+    if cmd == "profile":
+        if len(ns.args) < 2:
+            raise OPNError(
+                "Falta archivo .opn para profile",
+                code="OPN4018",
+                phase="CLI",
+                hint="Uso: opn profile app.opn [--top 20] [-o app.folded]",
+            )
+        path = ns.args[1]
+        collapsed = ns.output or re.sub(r"\.opnc?$", "", path) + ".folded"
+        try:
+            profile_opn_file(
+                path, top=ns.top, interval=ns.interval_ms / 1000, collapsed_path=collapsed
+            )
+        except FileNotFoundError as err:
+            raise OPNError(
+                "No se encontro el archivo .opn",
+                code="OPN4001",
+                phase="CLI",
+                source_name=path,
+                hint="Verifica la ruta o el nombre del archivo.",
+                details=str(err),
+            ) from err
+        print(f"Pilas colapsadas (flamegraph): {collapsed}", file=sys.stderr)
+        return 0
+
     if cmd == "setup":
         ensure_project_venv()
         synced = sync_project_dependencies()
@@ -1653,7 +6325,10 @@ def main(argv: list[str]) -> int:
         f"Comando no soportado: {cmd}",
         code="OPN4004",
         phase="CLI",
-        hint="Comandos validos: run, compile, build, setup, deps o -m",
+        hint=(
+            "Comandos validos: run, compile, check, repl, lsp, index, build, profile, "
+            "setup, deps o -m"
+        ),
     )
 
 
@@ -0,0 +1,739 @@
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import traceback
+from typing import Any, Callable, Optional
+
+from opn2 import (
+    KEYWORDS,
+    WORD_REGEX,
+    OPNError,
+    OPNLanguageServer,
+    Transpiler,
+    compile_opn,
+    parse_opn,
+    print_opn_error,
+    transpile_opn,
+)
+
+DEFAULT_SCALING_SIZES = [1000, 2000, 4000, 8000, 16000]
+# Exponente maximo aceptado en tiempo ~ lineas**k antes de marcar una etapa.
+DEFAULT_MAX_EXPONENT = 1.2
+SCALING_REPEATS = 3
+DEFAULT_REPORT_ROWS = [1000, 5000, 20000]
+DEFAULT_OBJECT_COUNTS = [100000, 500000]
+DEFAULT_LSP_LINES = 50000
+# Latencia maxima (p95, ms) por operacion del servidor de lenguaje; "edit" incluye
+# el reanalisis y las diagnosticas publicadas tras la tecla.
+LSP_LATENCY_TARGETS_MS = {"edit": 50.0, "definition": 10.0, "completion": 30.0}
+# Apertura maxima como multiplo del parse completo: abrir lexea, parsea y transpila
+# una vez y reparte simbolos por fragmento.
+LSP_OPEN_TARGET_RATIO = 2.5
+
+
+class ProgramGenerator:
+    def __init__(
+        self,
+        seed: int = 0,
+        *,
+        nesting: int = 3,
+        expr_depth: int = 3,
+        functions: int = 20,
+        classes: int = 5,
+    ):
+        self.rng = random.Random(seed)
+        self.nesting = nesting
+        self.expr_depth = expr_depth
+        self.functions = functions
+        self.classes = classes
+        self.lines: list[str] = []
+        self.counter = 0
+
+    def generate(self, lines: int) -> str:
+        self.lines = []
+        for index in range(self.classes):
+            self.class_decl(index)
+        for index in range(self.functions):
+            self.function_decl(index)
+        names = ["seed"]
+        self.emit(0, f"var seed = {self.rng.randint(1, 9)};")
+        while len(self.lines) < lines:
+            self.statement(0, 0, names, self.functions)
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, indent: int, text: str) -> None:
+        self.lines.append("    " * indent + text)
+
+    def fresh(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def expr(self, names: list[str], callable_count: int, depth: Optional[int] = None) -> str:
+        depth = self.expr_depth if depth is None else depth
+        roll = self.rng.random()
+        if depth <= 0 or roll < 0.25:
+            if names and roll < 0.15:
+                return self.rng.choice(names)
+            return str(self.rng.randint(0, 9))
+        if callable_count and roll < 0.4:
+            target = self.rng.randrange(callable_count)
+            left = self.expr(names, callable_count, depth - 1)
+            right = self.expr(names, callable_count, depth - 1)
+            return f"fn{target}({left}, {right})"
+        op = self.rng.choice(["+", "-", "*"])
+        left = self.expr(names, callable_count, depth - 1)
+        right = self.expr(names, callable_count, depth - 1)
+        return f"({left} {op} {right}) % 97"
+
+    def condition(self, names: list[str], callable_count: int) -> str:
+        op = self.rng.choice(["<", "<=", ">", ">=", "==", "!="])
+        left = self.expr(names, callable_count, 1)
+        return f"{left} {op} {self.rng.randint(0, 9)}"
+
+    def statement(self, indent: int, depth: int, names: list[str], callable_count: int) -> None:
+        kind = self.rng.random()
+        if depth < self.nesting and kind < 0.3:
+            self.block_stmt(indent, depth, names, callable_count)
+            return
+        if kind < 0.55 or not names:
+            name = self.fresh("v")
+            self.emit(indent, f"var {name} = {self.expr(names, callable_count)};")
+            names.append(name)
+            return
+        if kind < 0.8:
+            target = self.rng.choice(names)
+            self.emit(indent, f"{target} = {self.expr(names, callable_count)};")
+            return
+        if self.classes and kind < 0.9:
+            cls = self.rng.randrange(self.classes)
+            obj = self.fresh("obj")
+            self.emit(indent, f"var {obj} = Cls{cls}({self.expr(names, callable_count, 1)});")
+            self.emit(indent, f"{obj}.bump({self.expr(names, callable_count, 1)});")
+            return
+        self.emit(indent, f"print({self.expr(names, callable_count)});")
+
+    def block_stmt(self, indent: int, depth: int, names: list[str], callable_count: int) -> None:
+        kind = self.rng.randrange(4)
+        inner = list(names)
+        if kind == 0:
+            self.emit(indent, f"if ({self.condition(names, callable_count)}) {{")
+            self.block_body(indent + 1, depth + 1, inner, callable_count)
+            self.emit(indent, "} else {")
+            self.block_body(indent + 1, depth + 1, list(names), callable_count)
+            self.emit(indent, "}")
+        elif kind == 1:
+            var = self.fresh("i")
+            self.emit(indent, f"for (var {var} = 0; {var} < 3; {var} = {var} + 1) {{")
+            inner.append(var)
+            self.block_body(indent + 1, depth + 1, inner, callable_count)
+            self.emit(indent, "}")
+        elif kind == 2:
+            var = self.fresh("item")
+            self.emit(indent, f"for ({var} in [1, 2, 3]) {{")
+            inner.append(var)
+            self.block_body(indent + 1, depth + 1, inner, callable_count)
+            self.emit(indent, "}")
+        else:
+            var = self.fresh("n")
+            self.emit(indent, f"var {var} = 0;")
+            names.append(var)
+            inner.append(var)
+            self.emit(indent, f"while ({var} < 2) {{")
+            self.block_body(indent + 1, depth + 1, inner, callable_count)
+            self.emit(indent + 1, f"{var} = {var} + 1;")
+            self.emit(indent, "}")
+
+    def block_body(self, indent: int, depth: int, names: list[str], callable_count: int) -> None:
+        for _ in range(self.rng.randint(1, 3)):
+            self.statement(indent, depth, names, callable_count)
+
+    def function_decl(self, index: int) -> None:
+        # Solo se llaman funciones anteriores: sin recursion ni ciclos infinitos.
+        names = ["a", "b"]
+        self.emit(0, f"function fn{index}(a, b) {{")
+        self.block_body(1, 1, names, index)
+        self.emit(1, f"return {self.expr(names, index)};")
+        self.emit(0, "}")
+
+    def class_decl(self, index: int) -> None:
+        self.emit(0, f"class Cls{index} {{")
+        self.emit(1, "function init(start) {")
+        self.emit(2, "this.value = start;")
+        self.emit(2, "this.count = 0;")
+        self.emit(1, "}")
+        self.emit(1, "function bump(step) {")
+        self.emit(2, "this.value = (this.value + step) % 97;")
+        self.emit(2, "this.count = this.count + 1;")
+        self.emit(2, "return this.value;")
+        self.emit(1, "}")
+        self.emit(0, "}")
+
+
+def synthetic_source(lines: int, seed: int = 0) -> str:
+    return ProgramGenerator(seed).generate(lines)
+
+
+def _peak_rss_bytes() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB, macOS reporta bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure_memory(lines: int, traced: bool = False) -> dict[str, float]:
+    # tracemalloc guarda un traceback por bloque y eso infla el RSS, asi que el RSS
+    # y la memoria trazada se miden en corridas distintas.
+    code = synthetic_source(lines)
+    real_lines = code.count("\n")
+    per_10k = 10000 / real_lines
+    if traced:
+        tracemalloc.start()
+        program = parse_opn(code, source_name="<bench>")
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del program
+        return {"lines": real_lines, "traced_peak_per_10k_mb": traced_peak / 2**20 * per_10k}
+    rss_before = _peak_rss_bytes()
+    started = time.perf_counter()
+    program = parse_opn(code, source_name="<bench>")
+    elapsed = time.perf_counter() - started
+    rss_after = _peak_rss_bytes()
+    del program
+    return {
+        "lines": real_lines,
+        "parse_seconds": elapsed,
+        "peak_rss_mb": rss_after / 2**20,
+        "rss_growth_per_10k_mb": (rss_after - rss_before) / 2**20 * per_10k,
+    }
+
+
+def run_memory_benchmark(sizes: list[int]) -> list[dict[str, float]]:
+    # Cada tamano corre en procesos nuevos para que el pico de RSS no se acumule:
+    # uno sin trazar para RSS y tiempo, otro con tracemalloc.
+    results = []
+    for lines in sizes:
+        row: dict[str, float] = {}
+        for mode in ("rss", "traced"):
+            row.update(_memory_child(lines, mode))
+        results.append(row)
+    return results
+
+
+def _memory_child(lines: int, mode: str) -> dict[str, float]:
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "_memory-child", str(lines), mode],
+        capture_output=True,
+        text=True,
+    )
+    if child.returncode != 0:
+        detail = child.stderr.strip() or child.stdout.strip()
+        if detail:
+            detail = detail.splitlines()[-1]
+        raise OPNError(
+            "Fallo la medicion de memoria",
+            code="OPN5001",
+            phase="Bench",
+            details=detail if detail else None,
+        )
+    return json.loads(child.stdout)
+
+
+def print_memory_report(results: list[dict[str, float]]) -> None:
+    print(f"{'lineas':>10} {'parse (s)':>10} {'pico RSS MB':>12} {'RSS/10k MB':>11} {'traced/10k MB':>14}")
+    for row in results:
+        print(
+            f"{row['lines']:>10} {row['parse_seconds']:>10.3f} {row['peak_rss_mb']:>12.1f} "
+            f"{row['rss_growth_per_10k_mb']:>11.2f} {row['traced_peak_per_10k_mb']:>14.2f}"
+        )
+
+
+def _time_stage(stage: Callable[[str, str], Any], code: str, name: str) -> float:
+    started = time.perf_counter()
+    stage(code, name)
+    return time.perf_counter() - started
+
+
+def _growth_exponent(sizes: list[int], timings: list[float]) -> float:
+    # Pendiente por minimos cuadrados en escala log-log: tiempo ~ lineas**k.
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(timing, 1e-9)) for timing in timings]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    num = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    den = sum((x - mean_x) ** 2 for x in xs)
+    return num / den if den else 0.0
+
+
+def run_scaling_suite(
+    sizes: list[int],
+    *,
+    seed: int = 0,
+    max_exponent: float = DEFAULT_MAX_EXPONENT,
+    generator_options: Optional[dict[str, int]] = None,
+) -> dict[str, Any]:
+    stages: dict[str, Callable[[str, str], Any]] = {
+        "parse_opn": lambda code, name: parse_opn(code, source_name=name),
+        "transpile_opn": lambda code, name: transpile_opn(code, source_name=name),
+        "compile_opn": lambda code, name: compile_opn(code, source_name=name),
+    }
+    timings: dict[str, list[float]] = {stage: [] for stage in stages}
+    real_sizes = []
+    failures = []
+    for size in sizes:
+        code = ProgramGenerator(seed, **(generator_options or {})).generate(size)
+        real_sizes.append(code.count("\n"))
+        for stage, run in stages.items():
+            # Un nombre por etapa, tamano y repeticion evita que las caches LRU oculten
+            # el costo; el mejor de varios tiempos quita el ruido de una sola corrida.
+            try:
+                timings[stage].append(
+                    min(
+                        _time_stage(run, code, f"<stress:{stage}:{size}:{attempt}>")
+                        for attempt in range(SCALING_REPEATS)
+                    )
+                )
+            except OPNError as exc:
+                failures.append({"stage": stage, "lines": size, "code": exc.code, "error": str(exc)})
+                timings[stage].append(float("nan"))
+
+    report: dict[str, Any] = {"sizes": real_sizes, "stages": {}, "failures": failures}
+    for stage, values in timings.items():
+        valid = [(size, t) for size, t in zip(real_sizes, values) if not math.isnan(t)]
+        exponent = _growth_exponent(*map(list, zip(*valid))) if len(valid) >= 2 else 0.0
+        report["stages"][stage] = {
+            "seconds": values,
+            "exponent": exponent,
+            "superlinear": exponent > max_exponent,
+        }
+    return report
+
+
+def deep_nesting_source(depth: int) -> str:
+    lines = ["var total = 0;"]
+    for level in range(depth):
+        lines.append("    " * level + f"if (total < {level + 1}) {{")
+    lines.append("    " * depth + "total = total + 1;")
+    for level in reversed(range(depth)):
+        lines.append("    " * level + "}")
+    lines.append("print(total);")
+    return "\n".join(lines) + "\n"
+
+
+def deep_expression_source(depth: int) -> str:
+    return f"var total = {'(1 + ' * depth}1{')' * depth};\nprint(total);\n"
+
+
+def run_depth_probe(depths: list[int]) -> list[dict[str, Any]]:
+    results = []
+    for depth in depths:
+        for kind, build in (("nesting", deep_nesting_source), ("expr_depth", deep_expression_source)):
+            try:
+                compile_opn(build(depth), source_name=f"<depth:{kind}:{depth}>")
+                results.append({"kind": kind, "depth": depth, "ok": True})
+            except OPNError as exc:
+                results.append({"kind": kind, "depth": depth, "ok": False, "code": exc.code})
+    return results
+
+
+def report_source(rows: int) -> str:
+    # Script tipico de reportes: filas acumuladas en un string y plantillas con +.
+    return f"""var title = "Ventas";
+function render_rows(n) {{
+    var out = "";
+    for (var i = 0; i < n; i = i + 1) {{
+        var id = str(i);
+        out = out + "<tr><td>" + id + "</td><td>item " + id + "</td><td>" + str(i * 3) + "</td></tr>\\n";
+    }}
+    return out;
+}}
+var page = "<h1>" + title + "</h1>\\n<table>\\n" + render_rows({rows}) + "</table>\\n";
+var summary = "";
+for (var k = 0; k < {rows}; k = k + 1) {{
+    summary = summary + title + " #" + str(k) + ";";
+}}
+"""
+
+
+def _compile_variant(code: str, name: str, specialize: bool) -> Any:
+    transpiler = Transpiler(source_name=name, specialize=specialize)
+    return compile(transpiler.transpile(parse_opn(code, source_name=name)), name, "exec")
+
+
+def _run_report(code: str, rows: int, specialize: bool) -> tuple[float, int]:
+    compiled = _compile_variant(code, f"<report:{rows}:{specialize}>", specialize)
+    namespace: dict[str, Any] = {"__name__": "__opn_bench__"}
+    started = time.perf_counter()
+    exec(compiled, namespace)
+    elapsed = time.perf_counter() - started
+    return elapsed, len(namespace["page"]) + len(namespace["summary"])
+
+
+def run_string_benchmark(rows_list: list[int]) -> list[dict[str, Any]]:
+    results = []
+    for rows in rows_list:
+        code = report_source(rows)
+        generic, generic_size = _run_report(code, rows, specialize=False)
+        specialized, specialized_size = _run_report(code, rows, specialize=True)
+        if generic_size != specialized_size:
+            raise OPNError(
+                "El reporte especializado no coincide con el generico",
+                code="OPN5002",
+                phase="Benchmark",
+                details=f"filas={rows}: {generic_size} != {specialized_size} caracteres",
+            )
+        results.append(
+            {
+                "rows": rows,
+                "generic_s": generic,
+                "specialized_s": specialized,
+                "speedup": generic / specialized if specialized else 0.0,
+            }
+        )
+    return results
+
+
+def print_string_report(results: list[dict[str, Any]]) -> None:
+    print(f"{'filas':>8}{'generico (s)':>15}{'join/f-string (s)':>20}{'mejora':>9}")
+    for item in results:
+        print(
+            f"{item['rows']:>8}{item['generic_s']:>15.4f}"
+            f"{item['specialized_s']:>20.4f}{item['speedup']:>8.2f}x"
+        )
+
+
+def object_source(count: int, record: bool = False) -> str:
+    # Muchos objetos pequenos (como Task en test/30) y un recorrido que lee sus campos;
+    # con record=True, Task es un struct.
+    if record:
+        declaration = "struct Task { title, priority, done }"
+        build = 'Task("tarea", i, false)'
+    else:
+        declaration = """class Task {
+    function init(title, priority) {
+        this.title = title;
+        this.priority = priority;
+        this.done = false;
+    }
+    function complete() {
+        this.done = true;
+    }
+}"""
+        build = 'Task("tarea", i)'
+    return declaration + f"""
+function score(tasks) {{
+    var total = 0;
+    for (t in tasks) {{
+        if (t.done == false) {{
+            total = total + t.priority;
+        }}
+    }}
+    return total;
+}}
+var tasks = [];
+for (var i = 0; i < {count}; i = i + 1) {{
+    tasks.append({build});
+}}
+"""
+
+
+def _run_objects(code: str, count: int, specialize: bool) -> dict[str, float]:
+    compiled = _compile_variant(code, f"<objects:{count}:{specialize}>", specialize)
+    tracemalloc.start()
+    exec(compiled, {"__name__": "__opn_bench__"})
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # Mejor de varias construcciones: una sola corrida queda dominada por el GC
+    # de la basura que dejaron las variantes anteriores.
+    build = float("inf")
+    for _ in range(5):
+        namespace: dict[str, Any] = {"__name__": "__opn_bench__"}
+        started = time.perf_counter()
+        exec(compiled, namespace)
+        build = min(build, time.perf_counter() - started)
+    score, tasks = namespace["score"], namespace["tasks"]
+    started = time.perf_counter()
+    for _ in range(5):
+        score(tasks)
+    access = (time.perf_counter() - started) / 5
+    return {"bytes_per_object": peak / count, "build_s": build, "access_s": access}
+
+
+def run_object_benchmark(counts: list[int]) -> list[dict[str, Any]]:
+    results = []
+    for count in counts:
+        code = object_source(count)
+        results.append(
+            {
+                "objects": count,
+                "generic": _run_objects(code, count, specialize=False),
+                "specialized": _run_objects(code, count, specialize=True),
+                "struct": _run_objects(object_source(count, record=True), count, specialize=True),
+            }
+        )
+    return results
+
+
+def print_object_report(results: list[dict[str, Any]]) -> None:
+    print(f"{'objetos':>9}{'variante':>13}{'bytes/obj':>11}{'crear (s)':>11}{'leer (s)':>10}")
+    for item in results:
+        for variant, label in (
+            ("generic", "__dict__"),
+            ("specialized", "__slots__"),
+            ("struct", "struct"),
+        ):
+            data = item[variant]
+            print(
+                f"{item['objects']:>9}{label:>13}{data['bytes_per_object']:>11.0f}"
+                f"{data['build_s']:>11.3f}{data['access_s']:>10.4f}"
+            )
+
+
+def _lsp_change(uri: str, line: int, col: int, end_col: int, text: str) -> dict[str, Any]:
+    change = {
+        "range": {
+            "start": {"line": line, "character": col},
+            "end": {"line": line, "character": end_col},
+        },
+        "text": text,
+    }
+    return {
+        "method": "textDocument/didChange",
+        "params": {"textDocument": {"uri": uri}, "contentChanges": [change]},
+    }
+
+
+def _lsp_position(uri: str, method: str, line: int, col: int) -> dict[str, Any]:
+    params = {"textDocument": {"uri": uri}, "position": {"line": line, "character": col}}
+    return {"id": 1, "method": method, "params": params}
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_lsp_benchmark(lines: int, samples: int = 50, seed: int = 0) -> dict[str, Any]:
+    # Teclas sobre lineas al azar: un espacio al final (y su borrado) y un '{' sin
+    # cerrar al inicio (y su borrado), mas definicion y completado en la misma linea.
+    code = synthetic_source(lines, seed)
+    uri = "file:///bench.opn"
+    started = time.perf_counter()
+    parse_opn(code, source_name="<bench>")
+    parse_s = time.perf_counter() - started
+    server = OPNLanguageServer()
+    started = time.perf_counter()
+    server.handle(
+        {"method": "textDocument/didOpen", "params": {"textDocument": {"uri": uri, "text": code}}}
+    )
+    open_s = time.perf_counter() - started
+    doc = server.documents[uri]
+    rng = random.Random(seed)
+    timings: dict[str, list[float]] = {name: [] for name in LSP_LATENCY_TARGETS_MS}
+
+    def timed(name: str, message: dict[str, Any]) -> None:
+        started = time.perf_counter()
+        server.handle(message)
+        timings[name].append(time.perf_counter() - started)
+
+    for _ in range(samples):
+        line = rng.randrange(len(doc.lines))
+        end = len(doc.lines[line])
+        timed("edit", _lsp_change(uri, line, end, end, " "))
+        timed("edit", _lsp_change(uri, line, end, end + 1, ""))
+        timed("edit", _lsp_change(uri, line, 0, 0, "{"))
+        timed("edit", _lsp_change(uri, line, 0, 1, ""))
+        words = [m for m in WORD_REGEX.finditer(doc.lines[line]) if m.group() not in KEYWORDS]
+        col = words[-1].start() if words else 0
+        timed("definition", _lsp_position(uri, "textDocument/definition", line, col))
+        timed("completion", _lsp_position(uri, "textDocument/completion", line, col + 1))
+    operations = {}
+    for name, values in timings.items():
+        p95 = _percentile(values, 0.95) * 1000
+        operations[name] = {
+            "median_ms": _percentile(values, 0.5) * 1000,
+            "p95_ms": p95,
+            "target_ms": LSP_LATENCY_TARGETS_MS[name],
+            "ok": p95 <= LSP_LATENCY_TARGETS_MS[name],
+        }
+    return {
+        "lines": len(doc.lines),
+        "chunks": len(doc.chunks),
+        "open_s": open_s,
+        "full_parse_s": parse_s,
+        "open_target_s": parse_s * LSP_OPEN_TARGET_RATIO,
+        "open_ok": open_s <= parse_s * LSP_OPEN_TARGET_RATIO,
+        "operations": operations,
+    }
+
+
+def print_lsp_report(report: dict[str, Any]) -> None:
+    flag = "" if report["open_ok"] else "  LENTO"
+    print(
+        f"{report['lines']} lineas, {report['chunks']} fragmentos; apertura {report['open_s']:.2f} s "
+        f"(objetivo {report['open_target_s']:.2f} s = {LSP_OPEN_TARGET_RATIO}x parse completo "
+        f"{report['full_parse_s']:.2f} s){flag}"
+    )
+    print(f"{'operacion':<12}{'mediana (ms)':>14}{'p95 (ms)':>10}{'objetivo':>10}")
+    for name, data in report["operations"].items():
+        flag = "" if data["ok"] else "  LENTO"
+        print(
+            f"{name:<12}{data['median_ms']:>14.2f}{data['p95_ms']:>10.2f}"
+            f"{data['target_ms']:>10.0f}{flag}"
+        )
+
+
+def print_scaling_report(report: dict[str, Any], max_exponent: float) -> None:
+    header = "".join(f"{size:>10}" for size in report["sizes"])
+    print(f"{'etapa':<15}{header}{'k':>8}")
+    for stage, data in report["stages"].items():
+        row = "".join(f"{t:>10.3f}" for t in data["seconds"])
+        flag = "  SUPERLINEAL" if data["superlinear"] else ""
+        print(f"{stage:<15}{row}{data['exponent']:>8.2f}{flag}")
+    for failure in report["failures"]:
+        print(f"FALLO {failure['stage']} ({failure['lines']} lineas): [{failure['code']}] {failure['error']}")
+    print(f"Umbral de crecimiento: k <= {max_exponent}")
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) == 3 and argv[0] == "_memory-child":
+        print(json.dumps(measure_memory(int(argv[1]), traced=argv[2] == "traced")))
+        return 0
+
+    parser = argparse.ArgumentParser(
+        prog="opn_bench.py", description="Benchmarks del front end de OPN."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    memory = sub.add_parser("memory", help="Pico de RSS del parser por cada 10k lineas")
+    memory.add_argument(
+        "--lines", type=int, nargs="+", default=[10000, 50000, 100000], help="Tamanos a medir"
+    )
+    memory.add_argument("--json", action="store_true", help="Salida en JSON")
+
+    generate = sub.add_parser("generate", help="Genera un programa OPN valido y reproducible")
+    generate.add_argument("--lines", type=int, default=1000)
+    generate.add_argument("-o", "--output", help="Archivo destino .opn (por defecto stdout)")
+    scaling = sub.add_parser("scaling", help="Mide el crecimiento de parse/transpile/compile")
+    scaling.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SCALING_SIZES)
+    scaling.add_argument("--max-exponent", type=float, default=DEFAULT_MAX_EXPONENT)
+    scaling.add_argument(
+        "--depths", type=int, nargs="*", default=[8, 32, 64], help="Profundidades a sondear"
+    )
+    scaling.add_argument("--json", action="store_true", help="Salida en JSON")
+    strings = sub.add_parser(
+        "strings", help="Concatenacion generica frente a join/f-string en un script de reportes"
+    )
+    strings.add_argument("--rows", type=int, nargs="+", default=DEFAULT_REPORT_ROWS)
+    strings.add_argument("--json", action="store_true", help="Salida en JSON")
+    objects = sub.add_parser(
+        "objects", help="Memoria, creacion y lectura de objetos: __dict__, __slots__ y struct"
+    )
+    objects.add_argument("--count", type=int, nargs="+", default=DEFAULT_OBJECT_COUNTS)
+    objects.add_argument("--json", action="store_true", help="Salida en JSON")
+    lsp = sub.add_parser("lsp", help="Latencia de edicion, definicion y completado de opn lsp")
+    lsp.add_argument("--lines", type=int, default=DEFAULT_LSP_LINES)
+    lsp.add_argument("--samples", type=int, default=50, help="Lineas editadas al azar")
+    lsp.add_argument("--seed", type=int, default=0)
+    lsp.add_argument("--json", action="store_true", help="Salida en JSON")
+    for command in (generate, scaling):
+        command.add_argument("--seed", type=int, default=0)
+        command.add_argument("--nesting", type=int, default=3)
+        command.add_argument("--expr-depth", type=int, default=3)
+        command.add_argument("--functions", type=int, default=20)
+        command.add_argument("--classes", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command in ("generate", "scaling"):
+        options = {
+            "nesting": args.nesting,
+            "expr_depth": args.expr_depth,
+            "functions": args.functions,
+            "classes": args.classes,
+        }
+    if args.command == "generate":
+        code = ProgramGenerator(args.seed, **options).generate(args.lines)
+        if not args.output:
+            sys.stdout.write(code)
+            return 0
+        with open(args.output, "w", encoding="utf-8", newline="\n") as f:
+            f.write(code)
+        print(f"Programa generado: {args.output}")
+        return 0
+
+    if args.command == "scaling":
+        report = run_scaling_suite(
+            args.sizes, seed=args.seed, max_exponent=args.max_exponent, generator_options=options
+        )
+        report["depth_probe"] = run_depth_probe(args.depths)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_scaling_report(report, args.max_exponent)
+            for probe in report["depth_probe"]:
+                status = "ok" if probe["ok"] else f"FALLO [{probe['code']}]"
+                print(f"profundidad {probe['kind']}={probe['depth']}: {status}")
+        failed = (
+            report["failures"]
+            or any(data["superlinear"] for data in report["stages"].values())
+            or not all(probe["ok"] for probe in report["depth_probe"])
+        )
+        return 1 if failed else 0
+
+    if args.command == "strings":
+        results = run_string_benchmark(args.rows)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_string_report(results)
+        return 0
+
+    if args.command == "objects":
+        results = run_object_benchmark(args.count)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_object_report(results)
+        return 0
+
+    if args.command == "lsp":
+        report = run_lsp_benchmark(args.lines, samples=args.samples, seed=args.seed)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_lsp_report(report)
+        ok = report["open_ok"] and all(data["ok"] for data in report["operations"].values())
+        return 0 if ok else 1
+
+    if args.command == "memory":
+        results = run_memory_benchmark(args.lines)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_memory_report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main(sys.argv[1:]))
+    except OPNError as exc:
+        print_opn_error(exc)
+        raise SystemExit(1)
+    except Exception as exc:
+        err = OPNError(
+            "Fallo interno no controlado",
+            code="OPN9000",
+            phase="Interno",
+            details="".join(traceback.format_exception_only(type(exc), exc)).strip(),
+        )
+        print_opn_error(err)
+        raise SystemExit(1)